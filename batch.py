@@ -0,0 +1,279 @@
+"""Vectorized batch evaluation: one expression applied to whole columns of values
+
+With NumPy installed every AST node becomes a single array operation. Without
+it the same walk runs column-at-a-time over ``array('d')`` buffers, which is
+still one pass per node rather than a full parse/evaluate per row.
+
+Columns are evaluated in float64, so integer literals lose the exact big-int
+arithmetic the interactive evaluator uses. Rows that would raise in the
+interactive calculator (division or modulo by zero, overflow, results that
+are not real numbers) are flagged in the error mask instead.
+"""
+import math
+from array import array
+
+from expression import BinaryOp, Call, ExpressionError, Name, Number, UnaryOp, default_cache
+from functions import CONSTANTS, FUNCTIONS
+from numeric import format_result
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NAN = float('nan')
+
+
+class _NumpyColumns:
+    """Column operations backed by NumPy ufuncs"""
+
+    def __init__(self, size):
+        self.size = size
+        self.errors = np.zeros(size, dtype=bool)
+
+    def column(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.shape != (self.size,):
+            raise ValueError("All columns must have the same length")
+        return self.check(values)
+
+    def constant(self, value):
+        return np.full(self.size, float(value))
+
+    def check(self, result):
+        self.errors |= ~np.isfinite(result)
+        return result
+
+    def negate(self, a):
+        return -a
+
+    def binary(self, op, a, b):
+        with np.errstate(all='ignore'):
+            if op == '+':
+                result = a + b
+            elif op == '-':
+                result = a - b
+            elif op == '*':
+                result = a * b
+            elif op == '/':
+                result = a / b
+            elif op == '//':
+                result = np.floor_divide(a, b)
+                result[b == 0] = np.nan
+            elif op == '%':
+                result = np.mod(a, b)
+            else:
+                result = np.power(a, b)
+        return self.check(result)
+
+    def call(self, function, args):
+        vectorized = function.vectorized()
+        with np.errstate(all='ignore'):
+            if vectorized is not None:
+                result = np.asarray(vectorized(*args), dtype=float)
+            else:
+                # No array implementation available: map the scalar one
+                result = np.fromiter(map(_safe(function.scalar), *args), dtype=float, count=self.size)
+        return self.check(result)
+
+    def finish(self, values):
+        return values, self.errors
+
+
+def _safe(scalar):
+    """scalar with failures mapped to NaN, so they land in the error mask"""
+    def call(*args):
+        try:
+            return float(scalar(*args))
+        except (ValueError, TypeError, ArithmeticError):
+            return NAN
+    return call
+
+
+def _divide(a, b):
+    return a / b if b else NAN
+
+
+def _floor_divide(a, b):
+    return a // b if b else NAN
+
+
+def _modulo(a, b):
+    return a % b if b else NAN
+
+
+def _power(a, b):
+    try:
+        result = a ** b
+    except (OverflowError, ZeroDivisionError):
+        return NAN
+    return NAN if isinstance(result, complex) else result
+
+
+_PURE_OPS = {
+    '/': _divide,
+    '//': _floor_divide,
+    '%': _modulo,
+    '**': _power,
+}
+
+
+class _ArrayColumns:
+    """Column operations over array('d') buffers for when NumPy is absent"""
+
+    def __init__(self, size):
+        self.size = size
+        self.errors = array('b', bytes(size))
+
+    def column(self, values):
+        values = array('d', values)
+        if len(values) != self.size:
+            raise ValueError("All columns must have the same length")
+        return self.check(values)
+
+    def constant(self, value):
+        return array('d', [float(value)]) * self.size
+
+    def check(self, result):
+        isfinite = math.isfinite
+        if all(map(isfinite, result)):
+            return result
+        errors = self.errors
+        for i, value in enumerate(result):
+            if not isfinite(value):
+                errors[i] = 1
+        return result
+
+    def negate(self, a):
+        return array('d', [-x for x in a])
+
+    def binary(self, op, a, b):
+        if op == '+':
+            result = array('d', [x + y for x, y in zip(a, b)])
+        elif op == '-':
+            result = array('d', [x - y for x, y in zip(a, b)])
+        elif op == '*':
+            result = array('d', [x * y for x, y in zip(a, b)])
+        else:
+            func = _PURE_OPS[op]
+            result = array('d', [func(x, y) for x, y in zip(a, b)])
+        return self.check(result)
+
+    def call(self, function, args):
+        try:
+            # map() drives a C-implemented scalar like math.sin without a Python-level loop
+            result = array('d', map(function.scalar, *args))
+        except (ValueError, TypeError, ArithmeticError):
+            result = array('d', map(_safe(function.scalar), *args))
+        return self.check(result)
+
+    def finish(self, values):
+        return values, self.errors
+
+
+def _columns_backend(size):
+    return _NumpyColumns(size) if np is not None else _ArrayColumns(size)
+
+
+def _vectorize(node, backend, columns):
+    if isinstance(node, Number):
+        return backend.constant(node.value)
+    if isinstance(node, Name):
+        if node.name in columns:
+            return columns[node.name]
+        return backend.constant(CONSTANTS[node.name])
+    if isinstance(node, UnaryOp):
+        operand = _vectorize(node.operand, backend, columns)
+        return backend.negate(operand) if node.op == '-' else operand
+    if isinstance(node, BinaryOp):
+        # Iterate down the left spine so long flat chains do not recurse per operator
+        steps = []
+        while isinstance(node, BinaryOp):
+            steps.append(node)
+            node = node.left
+        values = _vectorize(node, backend, columns)
+        for step in reversed(steps):
+            values = backend.binary(step.op, values, _vectorize(step.right, backend, columns))
+        return values
+    if isinstance(node, Call):
+        function = FUNCTIONS.get(node.name)
+        if function is None:
+            raise ExpressionError(f"Unknown function '{node.name}'", node.pos)
+        try:
+            function.check_arity(len(node.args))
+        except ExpressionError as e:
+            raise ExpressionError(e.message, node.pos)
+        return backend.call(function, [_vectorize(arg, backend, columns) for arg in node.args])
+    raise TypeError(f"Unknown node {node!r}")
+
+
+def evaluate_batch(expression, variables=None, size=None):
+    """Evaluate one expression for every row of the variable columns
+
+    expression is expression text or a CompiledExpression; variables maps
+    each name used in the expression to a sequence of numbers, all of the
+    same length. size is only needed when the expression has no variables.
+
+    Returns (values, errors): float results and a mask that is true for rows
+    the interactive calculator would reject. These are NumPy arrays when
+    NumPy is installed, otherwise array('d') and array('b').
+    """
+    compiled = default_cache.compile(expression) if isinstance(expression, str) else expression
+    variables = variables or {}
+    # Library functions and constants are the only names that need no column
+    missing = compiled.names - set(variables) - set(FUNCTIONS) - set(CONSTANTS)
+    if missing:
+        raise ExpressionError(f"Unknown variable '{sorted(missing)[0]}'")
+
+    if size is None:
+        if not variables:
+            raise ValueError("size is required when no variables are given")
+        size = len(next(iter(variables.values())))
+
+    backend = _columns_backend(size)
+    columns = {name: backend.column(variables[name]) for name in compiled.names if name in variables}
+    try:
+        values = _vectorize(compiled.tree, backend, columns)
+    except RecursionError:
+        raise ExpressionError("Expression is nested too deeply")
+    return backend.finish(values)
+
+
+def apply_operation(op, values):
+    """Vectorized single-operand operation (√, ** for x², 1/x) with an error mask"""
+    if np is not None:
+        values = np.asarray(values, dtype=float)
+        with np.errstate(all='ignore'):
+            if op == '√':
+                result = np.sqrt(values)
+                errors = values < 0
+            elif op == '**':
+                result = values ** 2
+                errors = np.zeros(len(values), dtype=bool)
+            elif op == '1/x':
+                result = 1 / values
+                errors = values == 0
+            else:
+                raise ValueError(f"Unknown operation: {op}")
+        return result, errors | ~np.isfinite(result)
+
+    values = array('d', values)
+    if op == '√':
+        result = array('d', [math.sqrt(x) if x >= 0 else NAN for x in values])
+    elif op == '**':
+        result = array('d', [_power(x, 2) for x in values])
+    elif op == '1/x':
+        result = array('d', [_divide(1, x) for x in values])
+    else:
+        raise ValueError(f"Unknown operation: {op}")
+    errors = array('b', [not math.isfinite(x) for x in result])
+    return result, errors
+
+
+def format_batch(values, errors):
+    """Format batch results like the display: rounded numbers, or "Error" for masked rows"""
+    return [
+        "Error" if failed else str(format_result(float(value)))
+        for value, failed in zip(values, errors)
+    ]
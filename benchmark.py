@@ -0,0 +1,654 @@
+"""Benchmark suite for the evaluator, input handling and display update paths
+
+    python benchmark.py run [--output baseline.json] [--filter evaluate]
+    python benchmark.py startup [--runs 10] [--output startup.json]
+    python benchmark.py compare baseline.json current.json [--threshold 0.10]
+
+``run`` times every benchmark headlessly and reports operations per second,
+per-operation latency percentiles and allocations per operation measured
+with tracemalloc. ``compare`` exits non-zero when any benchmark's throughput
+dropped by more than the threshold relative to the baseline.
+
+The GUI benchmark drives the real Calculator view; when no display is
+available it runs the same code against stub StringVars so the event
+dispatch and display-sync logic is still measured.
+
+``startup`` launches fresh interpreters and reports time to first paint of
+the GUI (or, without a display, the import and engine construction cost).
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from definitions import Definitions
+from engine import CalculatorEngine
+from expression import ExpressionCache, compile_expression
+from history import HistoryEntry
+from numeric import MODES, get_backend
+from preview import IncrementalEvaluator
+from session import Session
+from worker import Worker
+
+
+# Registered benchmarks: name -> factory returning a zero-argument callable
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+# Corpora
+def short_expressions(count=200, seed=1, ops=('+', '−', '×', '÷')):
+    """Short arithmetic like the GUI produces: 12×3+4, (7−2)÷5, ..."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        terms = [str(rng.randint(1, 999)) for _ in range(rng.randint(2, 5))]
+        text = terms[0]
+        for term in terms[1:]:
+            text += rng.choice(ops) + term
+        if rng.random() < 0.3:
+            text = f"({text})×{rng.randint(2, 9)}"
+        corpus.append(text)
+    return corpus
+
+
+def nested_expression(depth=100):
+    """Deeply nested parentheses: (1+(1+(1+...)))"""
+    return '(1+' * depth + '1' + ')' * depth
+
+
+def long_expression(length=10000, seed=2):
+    """A flat expression of roughly length characters"""
+    rng = random.Random(seed)
+    parts = [str(rng.randint(1, 99))]
+    size = len(parts[0])
+    while size < length:
+        part = rng.choice('+−×') + str(rng.randint(1, 99))
+        parts.append(part)
+        size += len(part)
+    return ''.join(parts)
+
+
+def keystroke_stream(count=2000, seed=3):
+    """Random but well-formed keyboard input, with occasional = and backspace"""
+    rng = random.Random(seed)
+    keys = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            keys.append(rng.choice('0123456789'))
+        elif roll < 0.85:
+            if keys and keys[-1].isdigit():
+                keys.append(rng.choice('+-*/'))
+        elif roll < 0.95:
+            keys.append('\x08')
+        elif keys and keys[-1].isdigit():
+            keys.append('=')
+    return ''.join(keys)
+
+
+# Evaluator
+@benchmark('evaluate.short.cached')
+def bench_short_cached():
+    corpus = short_expressions()
+    cache = ExpressionCache(maxsize=len(corpus))
+    evaluate = cache.evaluate
+    return lambda: [evaluate(text) for text in corpus]
+
+
+@benchmark('evaluate.short.cold')
+def bench_short_cold():
+    corpus = short_expressions()
+    return lambda: [compile_expression(text).evaluate() for text in corpus]
+
+
+def _bench_mode(mode):
+    # Integer-safe operators so every mode does the same work; the corpus is
+    # compiled up front so only the backend arithmetic and formatting are timed
+    backend = get_backend(mode)
+    compiled = [compile_expression(text, backend) for text in short_expressions(ops=('+', '−', '×'))]
+    display = backend.format
+    return lambda: [display(expression._run(None)) for expression in compiled]
+
+
+for _mode in MODES:
+    benchmark(f'evaluate.mode.{_mode}')(lambda mode=_mode: _bench_mode(mode))
+
+
+@benchmark('evaluate.functions')
+def bench_functions():
+    compiled = compile_expression('sin(x)×cos(x)+ln(x+1)+sqrt(x)+mean(x, 2, 3)')
+    env = {'x': 0.75}
+    return lambda: compiled.evaluate(env)
+
+
+@benchmark('batch.functions')
+def bench_batch_functions():
+    from batch import evaluate_batch
+    columns = {'x': [i / 1000 for i in range(1, 10001)]}
+    return lambda: evaluate_batch('sin(x)×cos(x)+ln(x+1)+sqrt(x)+mean(x, 2, 3)', columns)
+
+
+# Units are compiled away, so each pair below should time about the same
+@benchmark('evaluate.units')
+def bench_units():
+    compiled = compile_expression('x[MB]/t[ms] to [GB/day]')
+    env = {'x': 512.0, 't': 40.0}
+    return lambda: compiled.evaluate(env)
+
+
+@benchmark('evaluate.units.plain')
+def bench_units_plain():
+    compiled = compile_expression('x/t×86.4')
+    env = {'x': 512.0, 't': 40.0}
+    return lambda: compiled.evaluate(env)
+
+
+@benchmark('evaluate.units.cold')
+def bench_units_cold():
+    # Parsing plus the dimension check, for a conversion never seen before
+    return lambda: compile_expression('(3[km] + 200[m]) / 1[h] to [mi/h]').evaluate()
+
+
+@benchmark('batch.units')
+def bench_batch_units():
+    from batch import evaluate_batch
+    columns = {'x': [float(i) for i in range(1, 10001)], 't': [i / 100 for i in range(1, 10001)]}
+    return lambda: evaluate_batch('x[MB]/t[ms] to [GB/day]', columns)
+
+
+@benchmark('batch.units.plain')
+def bench_batch_units_plain():
+    from batch import evaluate_batch
+    columns = {'x': [float(i) for i in range(1, 10001)], 't': [i / 100 for i in range(1, 10001)]}
+    return lambda: evaluate_batch('x/t×86.4', columns)
+
+
+@benchmark('evaluate.nested')
+def bench_nested():
+    text = nested_expression()
+    return lambda: compile_expression(text).evaluate()
+
+
+@benchmark('evaluate.long')
+def bench_long():
+    text = long_expression()
+    return lambda: compile_expression(text).evaluate()
+
+
+# Variables and user functions
+@benchmark('definitions.call')
+def bench_function_call():
+    definitions = Definitions()
+    definitions.define('rate = 1.07')
+    definitions.define('f(x) = x×rate')
+    definitions.define('g(a, b) = f(a)+f(b)×2')
+    compiled = compile_expression('g(3, 4)+f(ans)')
+    values = definitions.values
+    return lambda: compiled.evaluate(values)
+
+
+@benchmark('definitions.recompute')
+def bench_recompute():
+    # 100 variables, only 10 of which depend on M: changing M recomputes just those
+    definitions = Definitions()
+    for i in range(90):
+        definitions.define(f'v{i} = {i}×1.5+ans')
+    for i in range(10):
+        definitions.define(f'm{i} = M×{i}+v{i}')
+    value = [0]
+
+    def run():
+        value[0] += 1
+        definitions.assign('M', value[0])
+    return run
+
+
+# Engine input handling
+@benchmark('engine.keystrokes')
+def bench_keystrokes():
+    keys = keystroke_stream()
+
+    def run():
+        CalculatorEngine(cache=ExpressionCache()).feed(keys)
+    return run
+
+
+@benchmark('engine.paste')
+def bench_paste():
+    text = long_expression(5000)
+
+    def run():
+        CalculatorEngine().paste(text)
+    return run
+
+
+@benchmark('engine.handle_input')
+def bench_handle_input():
+    digits = '1234567890' * 10
+
+    def run():
+        engine = CalculatorEngine()
+        for digit in digits:
+            engine.handle_input(digit)
+            engine.handle_input('+')
+    return run
+
+
+def _calculate_corpus(profiled=False):
+    corpus = short_expressions()
+    engine = CalculatorEngine(cache=ExpressionCache(maxsize=len(corpus)))
+    if profiled:
+        from profiling import Profiler
+        Profiler().enable(engine=engine)
+
+    def run():
+        for text in corpus:
+            engine.expression = text
+            engine.expression_mode = True
+            engine.calculate()
+    return run
+
+
+@benchmark('engine.calculate')
+def bench_calculate():
+    return _calculate_corpus()
+
+
+@benchmark('engine.calculate.profiled')
+def bench_calculate_profiled():
+    # Same work with profiling enabled, to show the instrumentation overhead
+    return _calculate_corpus(profiled=True)
+
+
+@benchmark('engine.memory_add')
+def bench_memory_add():
+    # M+ on a long pending expression takes its value from the live preview
+    engine = CalculatorEngine()
+    engine.insert(long_expression())
+    engine.preview()
+    return engine.memory_add
+
+
+@benchmark('engine.rpn')
+def bench_rpn():
+    # 200 chained stack operations: each pops its operands, no text is parsed
+    keys = '1\r' + '3+2×7−5÷' * 50
+
+    def run():
+        engine = CalculatorEngine()
+        engine.set_rpn_mode(True)
+        engine.feed(keys)
+    return run
+
+
+@benchmark('engine.toggle_parentheses')
+def bench_toggle_parentheses():
+    def run():
+        engine = CalculatorEngine()
+        for _ in range(100):
+            engine.handle_input('2')
+            engine.toggle_parentheses()
+            engine.handle_input('3')
+            engine.toggle_parentheses()
+    return run
+
+
+@benchmark('preview.keystroke')
+def bench_preview():
+    evaluator = IncrementalEvaluator()
+    evaluator.append(long_expression())
+
+    def run():
+        evaluator.append('7')
+        evaluator.result()
+        evaluator.backspace()
+    return run
+
+
+# Session persistence
+def _session_directory(entries):
+    """A temporary session directory whose history already holds entries calculations"""
+    directory = tempfile.mkdtemp(prefix='calculator-session-')
+    atexit.register(shutil.rmtree, directory, True)
+    session = Session(directory)
+    history = session.history()
+    for number in range(entries):
+        history.append(HistoryEntry(f'{number}+1', (), None, str(number + 1)))
+    engine = CalculatorEngine(history=history)
+    engine.memory = 42
+    engine.feed('2×(3+')
+    session.snapshot(engine)
+    return session
+
+
+def _bench_snapshot(entries):
+    # One calculation and the snapshot after it; the cost should not grow with the history
+    session = _session_directory(entries)
+    engine = CalculatorEngine(history=session.history())
+    count = [0]
+
+    def run():
+        count[0] += 1
+        engine.expression = f'{count[0]}×3'
+        engine.expression_mode = True
+        engine.calculate()
+        session.snapshot(engine)
+    return run
+
+
+def _bench_restore(entries):
+    # Start-up with a saved session: reads state.json, not the history
+    directory = _session_directory(entries).directory
+
+    def run():
+        session = Session(directory)
+        if not session.restore(CalculatorEngine(history=session.history())):
+            raise RuntimeError("Nothing was restored")
+        session.history().archive.close()
+    return run
+
+
+for _entries in (1000, 100000):
+    benchmark(f'session.snapshot.{_entries // 1000}k')(lambda entries=_entries: _bench_snapshot(entries))
+    benchmark(f'session.restore.{_entries // 1000}k')(lambda entries=_entries: _bench_restore(entries))
+
+
+# GUI display updates
+class _StubVar:
+    """Stand-in for tk.StringVar when no display is available"""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class _StubRoot:
+    """Stand-in for the Tk root: after() callbacks are run explicitly by the benchmark"""
+
+    def __init__(self, clipboard=""):
+        self.clipboard = clipboard
+
+    def after(self, ms, func):
+        return 'after#stub'
+
+    def after_cancel(self, after_id):
+        pass
+
+    def clipboard_get(self):
+        return self.clipboard
+
+
+def _make_view():
+    from calculator import Calculator
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return Calculator(root), root
+    except Exception:
+        # No display: exercise the view's dispatch/sync code against stubs
+        view = Calculator.__new__(Calculator)
+        view.engine = CalculatorEngine()
+        view.display_var = _StubVar(view.engine.display)
+        view.preview_var = _StubVar()
+        view._shown = view.engine.display
+        view._preview_shown = ""
+        view.buttons = {}
+        view.root = _StubRoot()
+        view._pending_keys = []
+        view._flush_id = None
+        view.worker = Worker(view.root)
+        view._deferred = []
+        view._busy_shown = False
+        view.profiler = None
+        return view, None
+
+
+@benchmark('gui.button_presses')
+def bench_gui():
+    view, root = _make_view()
+    presses = [lambda d=d: view.handle_input(d) for d in '123'] + [
+        lambda: view.handle_input('+'), view.toggle_parentheses, lambda: view.handle_input('4'),
+        view.toggle_parentheses, view.calculate, view.clear_all]
+
+    def run():
+        for press in presses:
+            press()
+        if root is not None:
+            root.update_idletasks()
+    return run
+
+
+class _KeyEvent:
+    def __init__(self, char):
+        self.char = char
+
+
+@benchmark('gui.key_burst')
+def bench_key_burst():
+    # A burst of key events arriving within one frame, then the frame's single flush
+    view, root = _make_view()
+    events = [_KeyEvent(key) for key in keystroke_stream(500)]
+
+    def run():
+        for event in events:
+            view.on_key_press(event)
+        view.flush_input()
+        view.clear_all()
+    return run
+
+
+@benchmark('gui.paste')
+def bench_gui_paste():
+    view, root = _make_view()
+    text = long_expression(5000)
+
+    def run():
+        if root is not None:
+            root.clipboard_clear()
+            root.clipboard_append(text)
+        else:
+            view.root.clipboard = text
+        view.paste()
+        view.clear_all()
+    return run
+
+
+# Measurement
+def measure(func, min_time=0.5, samples=30):
+    """Time func, returning ops/sec, latency percentiles and allocations per op"""
+    func()
+    # Calibrate how many calls make one sample so timer overhead is negligible
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / samples or calls >= 1 << 20:
+            break
+        calls *= 2
+
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        latencies.append((time.perf_counter() - start) / calls)
+    latencies.sort()
+
+    tracemalloc.start()
+    before_size, _ = tracemalloc.get_traced_memory()
+    func()
+    after_size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        'ops_per_sec': len(latencies) / sum(latencies),
+        'p50_us': percentile(0.50) * 1e6,
+        'p90_us': percentile(0.90) * 1e6,
+        'p99_us': percentile(0.99) * 1e6,
+        'peak_bytes': peak - before_size,
+        'retained_bytes': after_size - before_size,
+    }
+
+
+def run_benchmarks(names, min_time):
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name]()
+        results[name] = stats = measure(func, min_time)
+        print(f"{name:30} {stats['ops_per_sec']:12.1f} ops/s  p50 {stats['p50_us']:10.1f} us  "
+              f"p99 {stats['p99_us']:10.1f} us  peak {stats['peak_bytes']:>9} B")
+    return results
+
+
+# Startup
+# Runs in a fresh interpreter; prints phase timings in milliseconds as JSON
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import tkinter as tk
+from calculator import Calculator
+timings = {'import': time.perf_counter() - start}
+try:
+    root = tk.Tk()
+except tk.TclError:
+    from engine import CalculatorEngine
+    CalculatorEngine()
+    timings['engine'] = time.perf_counter() - start
+else:
+    app = Calculator(root)
+    timings['constructed'] = time.perf_counter() - start
+
+    def exposed(event):
+        timings.setdefault('first_paint', time.perf_counter() - start)
+
+    def poll():
+        if 'first_paint' in timings and app.memory_frame.winfo_children():
+            timings['complete'] = time.perf_counter() - start
+            root.destroy()
+        else:
+            root.after(1, poll)
+    root.bind('<Expose>', exposed)
+    root.after(1, poll)
+    root.after(10000, root.destroy)
+    root.mainloop()
+print(json.dumps({phase: seconds * 1e3 for phase, seconds in timings.items()}))
+"""
+
+
+def measure_startup(runs=10):
+    """Launch the calculator runs times; return per-phase timing stats keyed 'startup.<phase>'"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    phases = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=here, check=True,
+                                capture_output=True, text=True).stdout
+        process_ms = (time.perf_counter() - start) * 1e3
+        timings = json.loads(output.splitlines()[-1])
+        timings['process'] = process_ms
+        for phase, ms in timings.items():
+            phases.setdefault(phase, []).append(ms)
+
+    results = {}
+    for phase, samples in phases.items():
+        samples.sort()
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        results[f'startup.{phase}'] = {
+            'ops_per_sec': 1e3 / (sum(samples) / len(samples)),
+            'p50_us': percentile(0.50) * 1e3,
+            'p90_us': percentile(0.90) * 1e3,
+            'p99_us': percentile(0.99) * 1e3,
+        }
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Print per-benchmark throughput changes; return the names that regressed"""
+    regressions = []
+    for name, base in sorted(baseline['results'].items()):
+        now = current['results'].get(name)
+        if now is None:
+            print(f"{name:30} missing from current run")
+            continue
+        change = now['ops_per_sec'] / base['ops_per_sec'] - 1
+        status = 'ok'
+        if change < -threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        print(f"{name:30} {base['ops_per_sec']:12.1f} -> {now['ops_per_sec']:12.1f} ops/s "
+              f"({change:+.1%})  {status}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="run benchmarks")
+    run.add_argument('--output', help="write results as a JSON baseline")
+    run.add_argument('--filter', default='', help="only run benchmarks whose name contains this")
+    run.add_argument('--min-time', type=float, default=0.5, help="seconds to spend per benchmark")
+    startup = commands.add_parser('startup', help="measure GUI startup and time to first paint")
+    startup.add_argument('--runs', type=int, default=10, help="launches to time (default: 10)")
+    startup.add_argument('--output', help="write results as a JSON baseline")
+    diff = commands.add_parser('compare', help="compare two JSON results")
+    diff.add_argument('baseline')
+    diff.add_argument('current')
+    diff.add_argument('--threshold', type=float, default=0.10,
+                      help="allowed fractional throughput drop (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        names = [name for name in BENCHMARKS if args.filter in name]
+        results = run_benchmarks(names, args.min_time)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+        return 0
+
+    if args.command == 'startup':
+        results = measure_startup(args.runs)
+        for name, stats in results.items():
+            print(f"{name:30} p50 {stats['p50_us'] / 1e3:8.1f} ms  p90 {stats['p90_us'] / 1e3:8.1f} ms")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    return 1 if compare(baseline, current, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
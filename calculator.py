@@ -1,27 +1,114 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-import math
-import re
+import os
+import sys
+
+try:
+    import tkinter as tk
+except ImportError:
+    # Python builds without Tk can still run --stream
+    tk = None
+
+from definitions import Definitions
+from engine import CalculatorEngine, key_action
+from functions import CONSTANTS, FUNCTIONS
+from history import HistoryStore
+from numeric import MAX_PRECISION, MODES
+from worker import Worker
+
+# argparse and the tkinter dialog modules are imported where they are first
+# used, so a plain GUI launch only pays for what it paints.
+
+# Pressed-state color for each button background
+ACTIVE_COLORS = {
+    '#B0C4DE': '#C0D4EE',  # Light steel blue
+    '#6495ED': '#74A5FD',  # Cornflower blue
+    '#708090': '#8090A0',  # Slate gray
+    '#9370DB': '#A380EB',  # Medium orchid
+    '#87CEEB': '#97DEFB',  # Sky blue
+    '#4682B4': '#5692C4',  # Steel blue
+    '#8A2BE2': '#9A3BF2',  # Blue violet
+}
+
+
+def _style(bg, fg, size):
+    return {
+        'bg': bg,
+        'fg': fg,
+        'activebackground': ACTIVE_COLORS.get(bg, bg),
+        'activeforeground': fg,
+        'font': ("Arial", size),
+        'relief': 'flat',
+        'bd': 0,
+        'cursor': 'hand2',
+    }
+
+
+# Complete Button options per kind of key, computed once at import
+BUTTON_STYLES = {
+    'function': _style('#B0C4DE', '#000000', 18),
+    'operator': _style('#6495ED', '#000000', 18),
+    'digit': _style('#708090', '#FFFFFF', 18),
+    'utility': _style('#6495ED', '#FFFFFF', 18),
+    'equals': _style('#4682B4', '#000000', 18),
+    'advanced': _style('#6495ED', '#000000', 14),
+    'delete': _style('#B0C4DE', '#000000', 14),
+    'memory': _style('#87CEEB', '#000000', 12),
+}
+
+# Variables and functions defined in the GUI are kept here between sessions
+DEFINITIONS_PATH = os.path.join(os.path.expanduser('~'), '.calculator_definitions.json')
+
+# Display, memory, mode and history are saved here and restored on the next start
+SESSION_DIR = os.path.join(os.path.expanduser('~'), '.calculator_session')
+
+# How often the session is snapshotted while the window is open
+SNAPSHOT_MS = 5000
+
+# Keystrokes are queued and applied at most once per frame (~60 Hz)
+FRAME_MS = 16
+
+# Shown under the display while a calculation runs on the worker thread
+BUSY_TEXT = "Calculating…"
+
+# Engine actions of keyboard keys that evaluate, and so run on the worker like the = button
+BACKGROUND_ACTIONS = ('calculate', 'calculate_operation')
 
 class Calculator:
-    def __init__(self, root):
+    def __init__(self, root, definitions=None, session=None, history_size=1000):
         self.root = root
         self.root.title("Calculator")
         self.root.geometry("350x550")
         self.root.resizable(True, True)  # Allow resizing
         self.root.configure(bg='#000000')
         
-        # Variables
+        # All arithmetic state lives in the headless engine; this class is the view.
+        # Without a session, entries beyond history_size are dropped
+        history = session.history(history_size) if session else HistoryStore(history_size)
+        self.engine = CalculatorEngine(definitions=definitions, history=history)
+        # Saved state from the last run is restored before anything is drawn
+        self.session = session
+        if session is not None:
+            session.restore(self.engine)
         self.display_var = tk.StringVar()
-        self.display_var.set("0")
-        self.num1 = None
-        self.operation = None
-        self.reset_display = False
-        self.memory = 0
-        self.expression_mode = False
-        self.expression = ""
-        
+        self._shown = self.engine.display
+        self._preview_shown = ""
+        self.display_var.set(self._shown)
+        # Created on first use (F9), so an unprofiled session never loads it
+        self.profiler = None
+        self.profile_panel = None
+        # Key presses waiting for the next frame
+        self._pending_keys = []
+        self._flush_id = None
+        # '=' and the single-operand keys run on a worker thread; input that
+        # arrives meanwhile waits in _deferred, except C, which cancels
+        self.worker = Worker(root, poll_ms=FRAME_MS)
+        self._deferred = []
+        self._busy_shown = False
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
         self.setup_ui()
+        self.setup_menu()
+        if session is not None:
+            self.root.after(SNAPSHOT_MS, self.snapshot)
         
     def setup_ui(self):
         # Main container
@@ -47,219 +134,464 @@ class Calculator:
         )
         self.display.pack(fill='x', pady=(20, 0), ipady=10)
         
+        # Live preview of the pending expression's result
+        self.preview_var = tk.StringVar()
+        self.preview = tk.Label(
+            display_frame,
+            textvariable=self.preview_var,
+            font=("Arial", 14),
+            anchor='e',
+            bg='#000000',
+            fg='#B0C4DE'
+        )
+        self.preview.pack(fill='x')
+        
         # Button frame
         button_frame = tk.Frame(main_frame, bg='#000000')
         button_frame.pack(fill='both', expand=True)
         
-        # Button configurations
-        button_config = {
-            'font': ("Arial", 18),
-            'relief': 'flat',
-            'bd': 0,
-            'cursor': 'hand2'
-        }
-        
         # Define all buttons with their properties - UPDATED COLOR SCHEME
         buttons = [
             # Row 0 - Special operations (Light steel blue)
-            ('C', 0, 0, '#B0C4DE', '#000000', self.clear_all),
-            ('( )', 0, 1, '#B0C4DE', '#000000', self.toggle_parentheses),
-            ('%', 0, 2, '#B0C4DE', '#000000', lambda: self.handle_input('%')),
-            ('÷', 0, 3, '#6495ED', '#000000', lambda: self.handle_input('÷')),
+            ('C', 0, 0, 'function', self.clear_all),
+            ('( )', 0, 1, 'function', self.toggle_parentheses),
+            ('%', 0, 2, 'function', lambda: self.handle_input('%')),
+            ('÷', 0, 3, 'operator', lambda: self.handle_input('÷')),
             
             # Row 1 - Numbers (Slate gray)
-            ('7', 1, 0, '#708090', '#FFFFFF', lambda: self.handle_input('7')),
-            ('8', 1, 1, '#708090', '#FFFFFF', lambda: self.handle_input('8')),
-            ('9', 1, 2, '#708090', '#FFFFFF', lambda: self.handle_input('9')),
-            ('×', 1, 3, '#6495ED', '#000000', lambda: self.handle_input('×')),
+            ('7', 1, 0, 'digit', lambda: self.handle_input('7')),
+            ('8', 1, 1, 'digit', lambda: self.handle_input('8')),
+            ('9', 1, 2, 'digit', lambda: self.handle_input('9')),
+            ('×', 1, 3, 'operator', lambda: self.handle_input('×')),
             
             # Row 2 - Numbers (Slate gray)
-            ('4', 2, 0, '#708090', '#FFFFFF', lambda: self.handle_input('4')),
-            ('5', 2, 1, '#708090', '#FFFFFF', lambda: self.handle_input('5')),
-            ('6', 2, 2, '#708090', '#FFFFFF', lambda: self.handle_input('6')),
-            ('−', 2, 3, '#6495ED', '#000000', lambda: self.handle_input('−')),
+            ('4', 2, 0, 'digit', lambda: self.handle_input('4')),
+            ('5', 2, 1, 'digit', lambda: self.handle_input('5')),
+            ('6', 2, 2, 'digit', lambda: self.handle_input('6')),
+            ('−', 2, 3, 'operator', lambda: self.handle_input('−')),
             
             # Row 3 - Numbers (Slate gray)
-            ('1', 3, 0, '#708090', '#FFFFFF', lambda: self.handle_input('1')),
-            ('2', 3, 1, '#708090', '#FFFFFF', lambda: self.handle_input('2')),
-            ('3', 3, 2, '#708090', '#FFFFFF', lambda: self.handle_input('3')),
-            ('+', 3, 3, '#6495ED', '#000000', lambda: self.handle_input('+')),
+            ('1', 3, 0, 'digit', lambda: self.handle_input('1')),
+            ('2', 3, 1, 'digit', lambda: self.handle_input('2')),
+            ('3', 3, 2, 'digit', lambda: self.handle_input('3')),
+            ('+', 3, 3, 'operator', lambda: self.handle_input('+')),
             
             # Row 4 - Mixed: utility, number, equals
-            ('+/−', 4, 0, '#6495ED', '#FFFFFF', self.toggle_sign),  
-            ('0', 4, 1, '#6495ED', '#FFFFFF', lambda: self.handle_input('0')),  
-            ('.', 4, 2, '#6495ED', '#FFFFFF', lambda: self.handle_input('.')),  
-            ('=', 4, 3, '#4682B4', '#000000', self.calculate),  
+            ('+/−', 4, 0, 'utility', self.toggle_sign),
+            ('0', 4, 1, 'utility', lambda: self.handle_input('0')),
+            ('.', 4, 2, 'utility', lambda: self.handle_input('.')),
+            ('=', 4, 3, 'equals', self.calculate),
         ]
         
         # Create buttons
         self.buttons = {}
-        for text, row, col, bg, fg, cmd in buttons:
-            btn = tk.Button(
-                button_frame,
-                text=text,
-                command=cmd,
-                bg=bg,
-                fg=fg,
-                activebackground=self.get_active_color(bg),
-                activeforeground=fg,
-                **button_config
-            )
-            btn.grid(row=row, column=col, padx=2, pady=2, sticky='nsew')
-            self.buttons[text] = btn
-        
-        # Second row of advanced functions (Light blue variations)
-        advanced_frame = tk.Frame(main_frame, bg='#000000')
-        advanced_frame.pack(fill='x', pady=(10, 0))
-        
-        advanced_buttons = [
-            ('√', 0, 0, '#6495ED', '#000000', lambda: self.calculate_operation('√')),
-            ('x²', 0, 1, '#6495ED', '#000000', lambda: self.calculate_operation('**')),
-            ('1/x', 0, 2, '#6495ED', '#000000', lambda: self.calculate_operation('1/x')),
-            ('del', 0, 3, '#B0C4DE', '#000000', self.backspace),  
-        ]
+        self._add_buttons(button_frame, buttons)
         
-        for text, row, col, bg, fg, cmd in advanced_buttons:
-            btn = tk.Button(
-                advanced_frame,
-                text=text,
-                command=cmd,
-                bg=bg,
-                fg=fg,
-                activebackground=self.get_active_color(bg),
-                activeforeground=fg,
-                font=("Arial", 14),
-                relief='flat',
-                bd=0,
-                cursor='hand2'
-            )
-            btn.grid(row=row, column=col, padx=2, pady=2, sticky='nsew')
-        
-        # Memory functions (Purple/Blue variations)
-        memory_frame = tk.Frame(main_frame, bg='#000000')
-        memory_frame.pack(fill='x', pady=(5, 0))
-        
-        memory_buttons = [
-            ('MC', 0, 0, '#87CEEB', '#000000', self.memory_clear),
-            ('MR', 0, 1, '#87CEEB', '#000000', self.memory_recall),
-            ('M+', 0, 2, '#87CEEB', '#000000', self.memory_add),
-            ('M-', 0, 3, '#87CEEB', '#000000', self.memory_subtract),
-        ]
-        
-        for text, row, col, bg, fg, cmd in memory_buttons:
-            btn = tk.Button(
-                memory_frame,
-                text=text,
-                command=cmd,
-                bg=bg,
-                fg=fg,
-                activebackground=self.get_active_color(bg),
-                activeforeground=fg,
-                font=("Arial", 12),
-                relief='flat',
-                bd=0,
-                cursor='hand2'
-            )
-            btn.grid(row=row, column=col, padx=2, pady=2, sticky='nsew')
+        # Advanced and memory rows are filled in once the first frame is up;
+        # their (empty) frames are packed now so the layout order is fixed
+        self.advanced_frame = tk.Frame(main_frame, bg='#000000')
+        self.advanced_frame.pack(fill='x', pady=(10, 0))
+        self.memory_frame = tk.Frame(main_frame, bg='#000000')
+        self.memory_frame.pack(fill='x', pady=(5, 0))
+        self.root.after_idle(self.setup_secondary_rows)
         
         # Configure grid weights for main buttons
         for i in range(5):
             button_frame.grid_rowconfigure(i, weight=1)
         for i in range(4):
             button_frame.grid_columnconfigure(i, weight=1)
-            advanced_frame.grid_columnconfigure(i, weight=1)
-            memory_frame.grid_columnconfigure(i, weight=1)
-        
-        # History storage
-        self.calculation_history = []
-        self.parentheses_count = 0
         
         # Keyboard bindings
         self.setup_keyboard_bindings()
         
+    def _add_buttons(self, frame, buttons):
+        for text, row, col, style, cmd in buttons:
+            btn = tk.Button(frame, text=text, command=cmd, **BUTTON_STYLES[style])
+            btn.grid(row=row, column=col, padx=2, pady=2, sticky='nsew')
+            self.buttons[text] = btn
+        
+    def setup_secondary_rows(self):
+        """Build the advanced-function and memory rows (deferred until after first paint)"""
+        # Second row of advanced functions (Light blue variations)
+        self._add_buttons(self.advanced_frame, [
+            ('√', 0, 0, 'advanced', lambda: self.calculate_operation('√')),
+            ('x²', 0, 1, 'advanced', lambda: self.calculate_operation('**')),
+            ('1/x', 0, 2, 'advanced', lambda: self.calculate_operation('1/x')),
+            ('del', 0, 3, 'delete', self.backspace),
+        ])
+        
+        # Memory functions (Purple/Blue variations); the last button shows the
+        # selected register and steps through M0-M9
+        self._add_buttons(self.memory_frame, [
+            ('MC', 0, 0, 'memory', self.memory_clear),
+            ('MR', 0, 1, 'memory', self.memory_recall),
+            ('MS', 0, 2, 'memory', self.memory_store),
+            ('M+', 0, 3, 'memory', self.memory_add),
+            ('M-', 0, 4, 'memory', self.memory_subtract),
+            ('M▸', 0, 5, 'memory', self.next_register),
+        ])
+        self.update_register_button()
+        
+        for i in range(4):
+            self.advanced_frame.grid_columnconfigure(i, weight=1)
+        for i in range(6):
+            self.memory_frame.grid_columnconfigure(i, weight=1)
+        
+    def setup_menu(self):
+        """Mode menu: numeric backend and decimal precision"""
+        self.mode_var = tk.StringVar(value=self.engine.backend.name)
+        self.precision = getattr(self.engine.backend, 'precision', 28)
+        menubar = tk.Menu(self.root)
+        mode_menu = tk.Menu(menubar, tearoff=0)
+        labels = {'float': "Float", 'decimal': "Decimal", 'fraction': "Exact fraction", 'int': "Big integer"}
+        for mode in MODES:
+            mode_menu.add_radiobutton(label=labels[mode], value=mode, variable=self.mode_var,
+                                      command=self.set_numeric_mode)
+        mode_menu.add_separator()
+        mode_menu.add_command(label="Decimal precision...", command=self.ask_precision)
+        mode_menu.add_separator()
+        self.rpn_var = tk.BooleanVar(value=self.engine.rpn_mode)
+        mode_menu.add_checkbutton(label="RPN stack", variable=self.rpn_var, accelerator="F8",
+                                  command=self.set_rpn_mode)
+        self.update_rpn_labels()
+        menubar.add_cascade(label="Mode", menu=mode_menu)
+        self.variables_menu = tk.Menu(menubar, tearoff=0, postcommand=self.build_variables_menu)
+        menubar.add_cascade(label="Variables", menu=self.variables_menu)
+        functions_menu = tk.Menu(menubar, tearoff=0)
+        categories = {}
+        for name, function in FUNCTIONS.items():
+            categories.setdefault(function.category, []).append(name)
+        for category, names in categories.items():
+            submenu = tk.Menu(functions_menu, tearoff=0)
+            for name in names:
+                submenu.add_command(label=f"{name}()", command=lambda name=name: self.insert_name(name + '('))
+            functions_menu.add_cascade(label=category, menu=submenu)
+        constants_menu = tk.Menu(functions_menu, tearoff=0)
+        for name in CONSTANTS:
+            constants_menu.add_command(label=name, command=lambda name=name: self.insert_name(name))
+        functions_menu.add_cascade(label="Constants", menu=constants_menu)
+        menubar.add_cascade(label="Functions", menu=functions_menu)
+        self.units_menu = tk.Menu(menubar, tearoff=0, postcommand=self.build_units_menu)
+        menubar.add_cascade(label="Units", menu=self.units_menu)
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        tools_menu.add_command(label="Profiling stats", accelerator="F9", command=self.toggle_profiling)
+        tools_menu.add_command(label="cProfile capture", accelerator="F10", command=self.toggle_capture)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        self.root.config(menu=menubar)
+        
+    def build_variables_menu(self):
+        """List ans, M and every definition; choosing one types it into the expression"""
+        menu = self.variables_menu
+        menu.delete(0, 'end')
+        menu.add_command(label="Define...", command=self.ask_definition)
+        menu.add_separator()
+        menu.add_command(label="ans", command=lambda: self.insert_name('ans'))
+        menu.add_command(label="M", command=lambda: self.insert_name('M'))
+        registers = tk.Menu(menu, tearoff=0)
+        for index, value in enumerate(self.engine.registers):
+            registers.add_command(label=f"M{index} = {self.engine.format_value(value)}",
+                                  command=lambda name=f'M{index}': self.insert_name(name))
+        menu.add_cascade(label="Registers", menu=registers)
+        definitions = self.engine.definitions
+        for name in definitions:
+            text, params = definitions.sources[name]
+            if name in definitions.errors:
+                # Kept so it is not lost, but it has no value until the error is fixed
+                text = f"{text}   ({definitions.errors[name]})"
+            inserted = name if params is None else name + '('
+            menu.add_command(label=text, command=lambda inserted=inserted: self.insert_name(inserted))
+        for text, error in definitions.rejected.items():
+            menu.add_command(label=f"{text}   ({error})", state='disabled')
+        
+    def build_units_menu(self):
+        """Common units by category, to tag a number with or to convert a result to"""
+        import units
+        menu = self.units_menu
+        menu.delete(0, 'end')
+        convert_menu = tk.Menu(menu, tearoff=0)
+        for category, names in units.CATALOG.items():
+            submenu = tk.Menu(menu, tearoff=0)
+            to_menu = tk.Menu(convert_menu, tearoff=0)
+            for name in names:
+                submenu.add_command(label=f"[{name}]", command=lambda name=name: self.insert_unit(name))
+                to_menu.add_command(label=f"to [{name}]",
+                                    command=lambda name=name: self.insert_unit(name, convert=True))
+            menu.add_cascade(label=category, menu=submenu)
+            convert_menu.add_cascade(label=category, menu=to_menu)
+        menu.add_separator()
+        menu.add_cascade(label="Convert to", menu=convert_menu)
+
+    def insert_unit(self, unit, convert=False):
+        """Tag the number being typed with a unit, or convert the expression to one"""
+        self.dispatch(self.engine.insert_unit, unit, convert)
+
+    def ask_definition(self):
+        """Prompt for a definition such as 'rate = 1.07' or 'f(x) = x×rate'"""
+        from tkinter import simpledialog
+        text = simpledialog.askstring("Define", "Variable or function (e.g. f(x) = x×1.07):",
+                                      parent=self.root)
+        if text:
+            self.dispatch(self.engine.define, text)
+        
+    def insert_name(self, name):
+        """Type a variable or function name into the expression"""
+        self.dispatch(self.engine.insert_name, name)
+        
+    def set_numeric_mode(self):
+        """Switch the engine to the backend selected in the Mode menu"""
+        self.dispatch(self.engine.set_numeric_mode, self.mode_var.get(), self.precision)
+        
+    def set_rpn_mode(self):
+        """Switch RPN stack mode on or off as checked in the Mode menu"""
+        if self.defer_while_busy(self.set_rpn_mode):
+            return
+        self.dispatch(self.engine.set_rpn_mode, self.rpn_var.get())
+        self.update_rpn_labels()
+        
+    def toggle_rpn_mode(self):
+        self.rpn_var.set(not self.rpn_var.get())
+        self.set_rpn_mode()
+        
+    def update_rpn_labels(self):
+        """Relabel = as Enter and ( ) as x⇄y (swap) while in RPN mode"""
+        rpn = self.engine.rpn_mode
+        self.buttons['='].config(text="Enter" if rpn else "=")
+        self.buttons['( )'].config(text="x⇄y" if rpn else "( )")
+        
+    def ask_precision(self):
+        """Prompt for the number of significant digits used in decimal mode"""
+        from tkinter import simpledialog
+        precision = simpledialog.askinteger("Decimal precision", "Significant digits:",
+                                            initialvalue=self.precision, minvalue=1,
+                                            maxvalue=MAX_PRECISION, parent=self.root)
+        if precision is not None:
+            self.precision = precision
+            if self.mode_var.get() == 'decimal':
+                self.set_numeric_mode()
+        
     def setup_keyboard_bindings(self):
         """Enable keyboard input"""
         self.root.bind('<Key>', self.on_key_press)
+        self.root.bind('<Control-v>', lambda event: self.paste())
+        self.root.bind('<Shift-Insert>', lambda event: self.paste())
+        self.root.bind('<F9>', lambda event: self.toggle_profiling())
+        self.root.bind('<F10>', lambda event: self.toggle_capture())
+        self.root.bind('<F8>', lambda event: self.toggle_rpn_mode())
+        # Memory keys as in common desktop calculators; Ctrl+digit selects a register
+        self.root.bind('<Control-l>', lambda event: self.memory_clear())
+        self.root.bind('<Control-r>', lambda event: self.memory_recall())
+        self.root.bind('<Control-m>', lambda event: self.memory_store())
+        self.root.bind('<Control-p>', lambda event: self.memory_add())
+        self.root.bind('<Control-q>', lambda event: self.memory_subtract())
+        for index in range(10):
+            self.root.bind(f'<Control-Key-{index}>', lambda event, index=index: self.select_register(index))
         self.root.focus_set()
         
     def on_key_press(self, event):
         """Handle keyboard input"""
-        key = event.char
-        if key.isdigit():
-            self.handle_input(key)
-        elif key == '.':
-            self.handle_input('.')
-        elif key in ['+', '-', '*', '/', '%']:
-            symbol_map = {'+': '+', '-': '−', '*': '×', '/': '÷', '%': '%'}
-            self.handle_input(symbol_map[key])
-        elif key in ['\r', '=']:
-            self.calculate()
-        elif key == '\x08':
-            self.backspace()
-        elif key.lower() == 'c':
-            self.clear_all()
-        elif key in ['(', ')']:
-            self.toggle_parentheses()
+        if key_action(event.char) is None:
+            return
+        # Queue the key; a burst (typing, key repeat, a macro) is applied in one pass
+        self._pending_keys.append(event.char)
+        if self._flush_id is None:
+            self._flush_id = self.root.after(FRAME_MS, self.flush_input)
+    
+    def flush_input(self):
+        """Apply all queued keys to the engine, then refresh the display once"""
+        if self._flush_id is not None:
+            self.root.after_cancel(self._flush_id)
+            self._flush_id = None
+        if self._pending_keys:
+            keys = ''.join(self._pending_keys)
+            self._pending_keys.clear()
+            # Typing is applied in bursts; each evaluating key (= or Enter) goes to
+            # the worker, and the keys after it wait for its result
+            start = 0
+            for index, key in enumerate(keys):
+                if key_action(key)[0] in BACKGROUND_ACTIONS:
+                    if start < index:
+                        self.dispatch(self.engine.feed, keys[start:index])
+                    self.dispatch_background(self.engine.press, key)
+                    start = index + 1
+            if start < len(keys):
+                self.dispatch(self.engine.feed, keys[start:])
     
+    def paste(self):
+        """Insert the clipboard contents as if typed, in a single display update"""
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            return
+        self.flush_input()
+        self.dispatch(self.engine.paste, text)
+    
+    # Profiling
+    def toggle_profiling(self):
+        """Start timing the hot paths and show the stats panel, or stop and close it"""
+        if self.profiler is not None and self.profiler.enabled:
+            self.profiler.disable()
+            if self.profile_panel is not None:
+                self.profile_panel.destroy()
+                self.profile_panel = None
+            return
+        if self.profiler is None:
+            from profiling import Profiler
+            self.profiler = Profiler()
+        self.profiler.enable(engine=self.engine, view=self)
+        self.show_profile_panel()
+        
+    def show_profile_panel(self):
+        """Toplevel with per-timer latency histograms, refreshed twice a second"""
+        panel = tk.Toplevel(self.root)
+        panel.title("Profiling")
+        panel.configure(bg='#000000')
+        panel.protocol("WM_DELETE_WINDOW", self.toggle_profiling)
+        text = tk.Text(panel, width=64, height=30, font=("Courier", 10), bg='#000000', fg='#FFFFFF')
+        text.pack(fill='both', expand=True)
+        buttons = tk.Frame(panel, bg='#000000')
+        buttons.pack(fill='x')
+        tk.Button(buttons, text="Reset", command=self.profiler.reset).pack(side='left')
+        tk.Button(buttons, text="Export...", command=self.export_profile).pack(side='left')
+        self.profile_panel = panel
+        self.profile_text = text
+        self.refresh_profile_panel()
+        
+    def refresh_profile_panel(self):
+        if self.profile_panel is None:
+            return
+        from profiling import histogram_lines
+        lines = []
+        for name, timer in sorted(self.profiler.timers.items()):
+            if timer.count:
+                lines.append(f"{name}: {timer.count} calls, mean {timer.mean * 1e6:.1f} us, "
+                             f"max {timer.maximum * 1e6:.1f} us")
+                lines.extend(histogram_lines(timer))
+        for name, value in self.profiler.stats()['counters'].items():
+            lines.append(f"{name}: {value}")
+        if self.profiler.capturing:
+            lines.append("cProfile capture running (F10 to stop)")
+        self.profile_text.delete('1.0', 'end')
+        self.profile_text.insert('1.0', "\n".join(lines) or "No calls yet")
+        self.profile_panel.after(500, self.refresh_profile_panel)
+        
+    def export_profile(self):
+        """Save the current stats as JSON or CSV, chosen by file extension"""
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(parent=self.profile_panel, defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if path:
+            self.profiler.export(path)
+        
+    def toggle_capture(self):
+        """Start a cProfile capture, or stop it, save calculator.prof and show the top functions"""
+        if self.profiler is None:
+            from profiling import Profiler
+            self.profiler = Profiler()
+        report = self.profiler.toggle_capture("calculator.prof")
+        if report:
+            window = tk.Toplevel(self.root)
+            window.title("cProfile (saved to calculator.prof)")
+            text = tk.Text(window, width=100, height=30, font=("Courier", 9))
+            text.pack(fill='both', expand=True)
+            text.insert('1.0', report)
+        
     def get_active_color(self, color):
         """Get lighter/darker color for button press effect"""
-        # Updated active colors for new color scheme
-        if color == '#B0C4DE':  # Light steel blue
-            return '#C0D4EE'
-        elif color == '#6495ED':  # Cornflower blue
-            return '#74A5FD'
-        elif color == '#708090':  # Slate gray
-            return '#8090A0'
-        elif color == '#9370DB':  # Medium orchid
-            return '#A380EB'
-        elif color == '#87CEEB':  # Sky blue
-            return '#97DEFB'
-        elif color == '#4682B4':  # Steel blue
-            return '#5692C4'
-        elif color == '#8A2BE2':  # Blue violet
-            return '#9A3BF2'
-        return color
+        return ACTIVE_COLORS.get(color, color)
     
     def handle_input(self, input_char):
         """Handle all input (numbers, operators, etc.)"""
-        current = self.display_var.get()
-        
-        # If we're starting fresh or after an error
-        if current == "0" and input_char.isdigit():
-            self.expression = input_char
-            self.display_var.set(input_char)
-            self.expression_mode = True
+        self.dispatch(self.engine.handle_input, input_char)
+    
+    def dispatch(self, action, *args):
+        """Run an engine action, then report errors and sync the display once"""
+        if self._pending_keys:
+            # Keys typed before this action must be applied first
+            self.flush_input()
+        if self.worker.busy:
+            if self._cancels(action, args):
+                self.worker.cancel()
+            self._deferred.append((self.dispatch, (action,) + args))
             return
-        elif current == "Error":
-            if input_char.isdigit():
-                self.expression = input_char
-                self.display_var.set(input_char)
-                self.expression_mode = True
+        action(*args)
+        self.report()
+    
+    def dispatch_background(self, action, *args):
+        """Run an engine action on the worker thread; the display updates when it ends"""
+        if self._pending_keys:
+            self.flush_input()
+        if self.worker.busy:
+            self._deferred.append((self.dispatch_background, (action,) + args))
             return
-        
-        # If we need to reset after a calculation
-        if self.reset_display:
-            if input_char.isdigit() or input_char == '.':
-                self.expression = input_char
-                self.display_var.set(input_char)
-                self.expression_mode = True
-                self.reset_display = False
-                return
-            elif input_char in ['+', '−', '×', '÷', '%']:
-                # Continue with the result
-                self.expression = current + input_char
-                self.expression_mode = True
-                self.reset_display = False
-            else:
-                self.reset_display = False
-        
-        # Add to expression
-        if not self.expression_mode:
-            self.expression = current
-            self.expression_mode = True
-        
-        self.expression += input_char
-        self.display_var.set(self.expression)
+        job = lambda: action(*args)
+        if self.profiler is not None and self.profiler.capturing:
+            # An F10 capture would otherwise miss the worker thread
+            job = self.profiler.profiled(job)
+        if not self.worker.submit(job, self.background_done):
+            self.show_busy(True)
+    
+    def background_done(self, cancelled):
+        """Show a finished background action's result, then replay input that arrived meanwhile"""
+        if self._busy_shown:
+            self.show_busy(False)
+        self.report(quiet=cancelled)
+        deferred, self._deferred = self._deferred, []
+        for action, args in deferred:
+            action(*args)
+    
+    def _cancels(self, action, args):
+        """True for input that clears the calculator: the C button or the 'c' key"""
+        if action == self.engine.clear_all:
+            return True
+        return action == self.engine.feed and any(key_action(key) == ('clear_all', ()) for key in args[0])
+    
+    def report(self, quiet=False):
+        """Show the engine's error, if any (unless quiet), and sync the display"""
+        if self.engine.error and not quiet:
+            from tkinter import messagebox
+            messagebox.showerror("Error", self.engine.error)
+        self.sync_display()
+    
+    def show_busy(self, busy):
+        """Grey out the display and show BUSY_TEXT while the worker is calculating"""
+        self._busy_shown = busy
+        self.display.config(fg='#808080' if busy else '#000000')
+        self.preview_var.set(BUSY_TEXT if busy else self._preview_shown)
+        self.root.config(cursor='watch' if busy else '')
+    
+    def snapshot(self):
+        """Save the session every SNAPSHOT_MS, skipping moments when a calculation is running"""
+        if not self.worker.busy:
+            try:
+                self.session.snapshot(self.engine)
+            except OSError:
+                # Disk full or directory gone; the next snapshot tries again
+                pass
+        self.root.after(SNAPSHOT_MS, self.snapshot)
+    
+    def close(self):
+        """Stop any running calculation, save the session and close the window"""
+        # The cancelled job must have stopped before its engine and history are saved
+        self.worker.shutdown(wait=True)
+        if self.session is not None:
+            try:
+                self.session.snapshot(self.engine)
+                self.session.close()
+            except OSError:
+                pass
+        self.root.destroy()
+    
+    def sync_display(self):
+        """Push the engine's display text to Tk only when it has changed"""
+        if self._shown != self.engine.display:
+            self._shown = self.engine.display
+            self.display_var.set(self._shown)
+        preview = self.engine.preview()
+        if preview == self._shown:
+            preview = ""
+        if self._preview_shown != preview:
+            self._preview_shown = preview
+            self.preview_var.set(preview)
     
     def append_number(self, number):
         """Add number to display - now handled by handle_input"""
@@ -298,275 +630,186 @@ class Calculator:
     
     def calculate_operation(self, op):
         """Calculate single-operand operations"""
-        try:
-            if self.expression_mode and self.expression:
-                # If we're in expression mode, evaluate the expression first
-                try:
-                    current = self.evaluate_expression(self.expression)
-                except:
-                    current = float(self.display_var.get())
-            else:
-                current = float(self.display_var.get())
-            
-            if op == '√':
-                if current < 0:
-                    raise ValueError("Cannot calculate square root of negative number!")
-                result = math.sqrt(current)
-                history_entry = f"√({current}) = {result}"
-            elif op == '**':
-                result = current ** 2
-                history_entry = f"({current})² = {result}"
-            elif op == '1/x':
-                if current == 0:
-                    raise ZeroDivisionError("Cannot divide by zero!")
-                result = 1 / current
-                history_entry = f"1/({current}) = {result}"
-            
-            # Format and display result
-            if result == int(result) and abs(result) < 1e10:
-                result = int(result)
-            else:
-                result = round(result, 10)
-                if abs(result) >= 1e10 or abs(result) <= 1e-10:
-                    result = f"{result:.2e}"
-            
-            self.display_var.set(str(result))
-            self.expression = str(result)
-            self.calculation_history.append(history_entry)
-            self.reset_display = True
-            self.expression_mode = False
-            
-        except (ValueError, OverflowError, ZeroDivisionError) as e:
-            messagebox.showerror("Error", str(e))
-            self.display_var.set("Error")
-            self.expression = ""
-            self.expression_mode = False
+        self.dispatch_background(self.engine.calculate_operation, op)
     
     def evaluate_expression(self, expression):
         """Safely evaluate mathematical expression with parentheses support"""
-        # Replace display symbols with Python operators
-        expression = expression.replace('×', '*')
-        expression = expression.replace('÷', '/')
-        expression = expression.replace('−', '-')
-        
-        # Remove any invalid characters (keep only numbers, operators, parentheses, and decimal points)
-        expression = re.sub(r'[^0-9+\-*/().% ]', '', expression)
-        
-        # Check for balanced parentheses
-        if expression.count('(') != expression.count(')'):
-            raise ValueError("Unmatched parentheses")
-        
-        # Check for empty parentheses
-        if '()' in expression:
-            raise ValueError("Empty parentheses not allowed")
-        
-        # Prevent dangerous operations
-        if any(dangerous in expression.lower() for dangerous in ['import', '__', 'exec', 'eval', 'open', 'file']):
-            raise ValueError("Invalid expression")
-        
-        try:
-            # Use eval with restricted globals for safety
-            result = eval(expression, {"__builtins__": {}, "abs": abs, "pow": pow}, {})
-            return float(result)
-        except ZeroDivisionError:
-            raise ZeroDivisionError("Cannot divide by zero!")
-        except Exception as e:
-            raise ValueError("Invalid expression")
+        return self.engine.evaluate_expression(expression)
     
     def calculate(self):
         """Perform calculation with expression support"""
-        try:
-            if self.expression_mode and self.expression:
-                # Evaluate the entire expression
-                result = self.evaluate_expression(self.expression)
-                
-                # Format result
-                if result == int(result) and abs(result) < 1e10:
-                    result = int(result)
-                else:
-                    result = round(result, 10)
-                    if abs(result) >= 1e10 or abs(result) <= 1e-10:
-                        result = f"{result:.2e}"
-                
-                # Store in history
-                history_entry = f"{self.expression} = {result}"
-                self.calculation_history.append(history_entry)
-                
-                # Display result
-                self.display_var.set(str(result))
-                self.expression = str(result)
-                self.reset_display = True
-                self.expression_mode = False
-                
-            elif self.num1 is not None and self.operation is not None:
-                # Legacy calculation mode for backward compatibility
-                num2 = float(self.display_var.get())
-                
-                if self.operation == '+':
-                    result = self.num1 + num2
-                    symbol = '+'
-                elif self.operation == '-':
-                    result = self.num1 - num2
-                    symbol = '−'
-                elif self.operation == '*':
-                    result = self.num1 * num2
-                    symbol = '×'
-                elif self.operation == '/':
-                    if num2 == 0:
-                        raise ZeroDivisionError("Cannot divide by zero!")
-                    result = self.num1 / num2
-                    symbol = '÷'
-                elif self.operation == '%':
-                    if num2 == 0:
-                        raise ZeroDivisionError("Cannot find modulo with zero!")
-                    result = self.num1 % num2
-                    symbol = '%'
-                
-                # Format result
-                if result == int(result) and abs(result) < 1e10:
-                    result = int(result)
-                else:
-                    result = round(result, 10)
-                    if abs(result) >= 1e10 or abs(result) <= 1e-10:
-                        result = f"{result:.2e}"
-                
-                # Store in history
-                history_entry = f"{self.num1} {symbol} {num2} = {result}"
-                self.calculation_history.append(history_entry)
-                
-                # Display result
-                self.display_var.set(str(result))
-                
-                # Reset for next calculation
-                self.num1 = None
-                self.operation = None
-                self.reset_display = True
-                self.expression_mode = False
-                
-                # Reset operation button colors
-                self.update_operation_buttons("")
-                
-        except (ValueError, ZeroDivisionError, OverflowError) as e:
-            messagebox.showerror("Error", str(e))
-            self.display_var.set("Error")
-            self.num1 = None
-            self.operation = None
-            self.expression = ""
-            self.expression_mode = False
+        legacy = self.engine.operation is not None
+        self.dispatch_background(self.engine.calculate)
+        if legacy:
+            # Reset operation button colors
+            self.update_operation_buttons("")
     
     def clear_all(self):
         """Clear everything"""
-        self.display_var.set("0")
-        self.num1 = None
-        self.operation = None
-        self.reset_display = False
-        self.parentheses_count = 0
-        self.expression = ""
-        self.expression_mode = False
+        self.dispatch(self.engine.clear_all)
         self.update_operation_buttons("")
     
     def backspace(self):
         """Remove last character"""
-        if self.expression_mode and self.expression:
-            if len(self.expression) > 1:
-                self.expression = self.expression[:-1]
-                self.display_var.set(self.expression)
-            else:
-                self.expression = ""
-                self.display_var.set("0")
-                self.expression_mode = False
-        else:
-            current = self.display_var.get()
-            if current != "Error":
-                if len(current) > 1:
-                    self.display_var.set(current[:-1])
-                else:
-                    self.display_var.set("0")
+        self.dispatch(self.engine.backspace)
     
     def toggle_sign(self):
         """Toggle positive/negative"""
-        if self.expression_mode and self.expression:
-            # In expression mode, add/remove negative at the current position
-            if self.expression.startswith('-'):
-                self.expression = self.expression[1:]
-            else:
-                self.expression = '-' + self.expression
-            self.display_var.set(self.expression)
-        else:
-            current = self.display_var.get()
-            if current != "0" and current != "Error":
-                if current.startswith('-'):
-                    self.display_var.set(current[1:])
-                else:
-                    self.display_var.set('-' + current)
+        self.dispatch(self.engine.toggle_sign)
     
     def toggle_parentheses(self):
         """Add opening or closing parenthesis based on context"""
-        if not self.expression_mode:
-            self.expression = self.display_var.get()
-            self.expression_mode = True
-        
-        # Count current open parentheses
-        open_parens = self.expression.count('(')
-        close_parens = self.expression.count(')')
-        
-        # Determine whether to add opening or closing parenthesis
-        if open_parens == close_parens:
-            # Add opening parenthesis
-            # If last character is a number or closing paren, add multiplication
-            if self.expression and (self.expression[-1].isdigit() or self.expression[-1] == ')'):
-                self.expression += '×('
-            else:
-                self.expression += '('
-        else:
-            # Add closing parenthesis if we have unmatched opening ones
-            # But only if the last character is a number or closing paren
-            if self.expression and (self.expression[-1].isdigit() or self.expression[-1] == ')'):
-                self.expression += ')'
-            else:
-                # If last character is an operator, we might want to add opening paren instead
-                self.expression += '('
-        
-        self.display_var.set(self.expression)
+        self.dispatch(self.engine.toggle_parentheses)
     
     # Memory functions
     def memory_clear(self):
         """Clear memory"""
-        self.memory = 0
+        self.dispatch(self.engine.memory_clear)
     
     def memory_recall(self):
         """Recall from memory"""
-        self.display_var.set(str(self.memory))
-        self.expression = str(self.memory)
-        self.expression_mode = True
-        self.reset_display = False
+        self.dispatch(self.engine.memory_recall)
+    
+    def memory_store(self):
+        """Store current value in memory"""
+        self.dispatch_memory(self.engine.memory_store)
     
     def memory_add(self):
         """Add current value to memory"""
-        try:
-            if self.expression_mode and self.expression:
-                current = self.evaluate_expression(self.expression)
-            else:
-                current = float(self.display_var.get())
-            self.memory += current
-        except (ValueError, ZeroDivisionError):
-            pass
+        self.dispatch_memory(self.engine.memory_add)
     
     def memory_subtract(self):
         """Subtract current value from memory"""
+        self.dispatch_memory(self.engine.memory_subtract)
+    
+    def defer_while_busy(self, action, *args):
+        """Apply typed keys, then queue action(*args) if the worker is busy; True if queued
+
+        View actions that read engine state queue themselves whole, so they
+        see the engine as the running calculation leaves it.
+        """
+        if self._pending_keys:
+            self.flush_input()
+        if self.worker.busy:
+            self._deferred.append((action, args))
+            return True
+        return False
+
+    def dispatch_memory(self, action):
+        """Run a memory key, on the worker when the expression has to be evaluated in full"""
+        if self.defer_while_busy(self.dispatch_memory, action):
+            return
+        if self.engine.needs_evaluation():
+            self.dispatch_background(action)
+        else:
+            self.dispatch(action)
+    
+    def select_register(self, index):
+        """Make the memory keys act on register index"""
+        if self.defer_while_busy(self.select_register, index):
+            return
+        self.dispatch(self.engine.select_register, index)
+        self.update_register_button()
+    
+    def next_register(self):
+        """Step the selected register through M0-M9"""
+        if self.defer_while_busy(self.next_register):
+            return
+        self.select_register((self.engine.register + 1) % len(self.engine.registers))
+    
+    def update_register_button(self):
+        if 'M▸' in self.buttons:
+            self.buttons['M▸'].config(text=f"M{self.engine.register}▸")
+
+
+def _engine_property(name):
+    """Expose an engine attribute on the view for scripts written against Calculator"""
+    return property(
+        lambda self: getattr(self.engine, name),
+        lambda self, value: setattr(self.engine, name, value),
+    )
+
+
+for _name in ('expression', 'expression_mode', 'reset_display', 'memory', 'num1',
+              'operation', 'calculation_history', 'parentheses_count', 'expression_cache'):
+    setattr(Calculator, _name, _engine_property(_name))
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Calculator")
+    parser.add_argument('--stream', action='store_true',
+                        help="evaluate expressions line by line instead of opening the GUI")
+    parser.add_argument('file', nargs='?',
+                        help="file of expressions for --stream (default: stdin)")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="worker processes for --stream (default: 1)")
+    parser.add_argument('--mode', choices=MODES, default='float',
+                        help="numeric mode for --stream (default: float)")
+    parser.add_argument('--precision', type=int, default=None,
+                        help=f"significant digits in decimal mode, at most {MAX_PRECISION} (default: 28)")
+    parser.add_argument('--definitions', default=DEFINITIONS_PATH,
+                        help=f"file of saved variables and functions (default: {DEFINITIONS_PATH})")
+    parser.add_argument('--rates', default=None,
+                        help="JSON file of currency exchange rates "
+                             "(default: $CALCULATOR_RATES or ~/.calculator_rates.json)")
+    parser.add_argument('--session', default=SESSION_DIR,
+                        help=f"directory the GUI saves its state and history in (default: {SESSION_DIR})")
+    parser.add_argument('--no-session', action='store_true',
+                        help="start with a fresh calculator and save nothing on exit")
+    parser.add_argument('--history-size', type=int, default=1000,
+                        help="calculations kept in memory; with --no-session older ones are "
+                             "dropped, otherwise they stay in the session journal (default: 1000)")
+    parser.add_argument('--profile', action='store_true',
+                        help="open the GUI with profiling enabled (same as pressing F9)")
+    parser.add_argument('--max-bits', type=int, default=None,
+                        help="largest exact integer result in bits (default: 1000000)")
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help="deepest nesting of parentheses and signs (default: 100)")
+    parser.add_argument('--max-tokens', type=int, default=None,
+                        help="longest expression in tokens (default: 10000)")
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help="seconds one calculation may take (default: 2)")
+    args = parser.parse_args(argv)
+    if args.precision is not None and not 1 <= args.precision <= MAX_PRECISION:
+        parser.error(f"--precision must be between 1 and {MAX_PRECISION}")
+    if args.history_size < 1:
+        parser.error("--history-size must be at least 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    changes = {name: getattr(args, name) for name in ('max_bits', 'max_depth', 'max_tokens', 'time_budget')
+               if getattr(args, name) is not None}
+    if changes:
+        import limits
+        limits.configure(**changes)
+    if args.rates:
+        import units
         try:
-            if self.expression_mode and self.expression:
-                current = self.evaluate_expression(self.expression)
-            else:
-                current = float(self.display_var.get())
-            self.memory -= current
-        except (ValueError, ZeroDivisionError):
-            pass
+            units.load_rates(args.rates)
+        except (OSError, ValueError) as e:
+            print(f"Cannot load rates: {e}", file=sys.stderr)
+            return 2
+    if args.stream:
+        import stream
+        return 1 if stream.run(args.file, jobs=args.jobs, mode=args.mode, precision=args.precision) else 0
+    if tk is None:
+        print("tkinter is not available; use --stream to calculate without the GUI", file=sys.stderr)
+        return 2
 
-def main():
     root = tk.Tk()
-    app = Calculator(root)
+    session = None
+    if not args.no_session:
+        from session import Session
+        session = Session(args.session)
+    app = Calculator(root, Definitions(args.definitions), session, args.history_size)
+    if args.mode != 'float' or args.precision:
+        app.precision = args.precision or app.precision
+        app.mode_var.set(args.mode)
+        app.set_numeric_mode()
+    if args.profile:
+        app.toggle_profiling()
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""Named variables and user-defined functions for the evaluator
+
+    rate = 1.07
+    f(x) = x×rate
+    total = f(ans) + M + M3
+
+Each definition is parsed and compiled once. Variables keep their current
+value in ``values``, which doubles as the evaluation environment; functions
+are stored there as callables wrapping their compiled body. A dependency
+graph records which names each definition uses, so when a value changes
+only the definitions that (transitively) depend on it are recomputed, in
+dependency order.
+
+Definitions can be saved to a JSON file and are reloaded from it. One that
+cannot be computed when loaded (1/a while a is 0, or 1.07 in integer mode)
+keeps its text and an entry in ``errors`` and is saved again unchanged;
+only remove() deletes a definition.
+"""
+import json
+import os
+import re
+
+import limits
+from expression import ExpressionError, compile_expression
+from numeric import FLOAT
+
+
+DEFINITION_PATTERN = re.compile(r"""
+    \s*(?P<name>[A-Za-z_][A-Za-z_0-9]*)\s*
+    (?:\((?P<params>[^()]*)\))?\s*
+    =(?P<body>.*)
+""", re.VERBOSE | re.DOTALL)
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z_0-9]*\Z")
+
+# Memory registers, visible to expressions as M0 to M9; M is another name for M0
+REGISTER_NAMES = tuple(f'M{index}' for index in range(10))
+
+# Names the calculator keeps up to date: the last result and the memory registers
+BOUND_NAMES = dict({'ans': 0, 'M': 0}, **dict.fromkeys(REGISTER_NAMES, 0))
+
+
+def is_definition(text):
+    """True if text looks like 'name = expr' or 'f(x) = expr'"""
+    return DEFINITION_PATTERN.fullmatch(text) is not None
+
+
+class _Scope(dict):
+    """Function-call locals; names that are not parameters resolve in the parent"""
+
+    __slots__ = ('parent',)
+
+    def __missing__(self, name):
+        return self.parent[name]
+
+
+class Definitions:
+    """Variables and functions, compiled once and recomputed only when their inputs change"""
+
+    def __init__(self, path=None, backend=FLOAT, bound=None):
+        self.path = path
+        self.backend = backend
+        # Evaluation environment: variable values and function callables
+        self.values = {}
+        # Errors for definitions whose last computation or compilation failed
+        self.errors = {}
+        # Loaded texts that are not definitions at all, with the reason; kept for save()
+        self.rejected = {}
+        # name -> (source text, parameter tuple or None for variables)
+        self.sources = {}
+        # Names set from outside (ans, M) rather than defined by an expression
+        self.bound = set()
+        self._compiled = {}
+        self._dependencies = {}
+        self._dependents = {}
+        # Bumped on every change, so callers can tell when cached results are stale
+        self.version = 0
+        # Bound names get their initial values before anything saved can refer to
+        # them; with nothing defined yet there is nothing to recompute
+        bound = BOUND_NAMES if bound is None else bound
+        self.bound.update(bound)
+        self.values.update(bound)
+        if path and os.path.exists(path):
+            self.load()
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def define(self, text, save=True, strict=True):
+        """Add or replace a definition; returns (name, value), value None for functions
+
+        With strict false, a variable whose value cannot be computed is still
+        defined, without a value and with the reason in errors.
+        """
+        match = DEFINITION_PATTERN.fullmatch(text)
+        if match is None:
+            raise ExpressionError("Definitions look like 'name = expression' or 'f(x) = expression'")
+        name, body = match.group('name'), match.group('body').strip()
+        if name in self.bound:
+            raise ExpressionError(f"'{name}' is set by the calculator and cannot be redefined")
+        params = None
+        if match.group('params') is not None:
+            params = tuple(param.strip() for param in match.group('params').split(',') if param.strip())
+            for param in params:
+                if not IDENTIFIER.match(param):
+                    raise ExpressionError(f"Invalid parameter name '{param}'")
+            if len(set(params)) != len(params):
+                raise ExpressionError("Duplicate parameter name")
+
+        compiled = compile_expression(body, self.backend)
+        dependencies = compiled.names - set(params or ())
+        if name in dependencies or any(name in self._closure(dep) for dep in dependencies):
+            raise ExpressionError(f"Circular definition of '{name}'")
+        value = error = None
+        if params is None:
+            try:
+                value = compiled.evaluate(self.values)
+            except (ValueError, ArithmeticError) as e:
+                if strict:
+                    raise
+                error = str(e)
+
+        self._unlink(name)
+        self._compiled[name] = compiled
+        self.sources[name] = (f"{name}({', '.join(params)}) = {body}" if params is not None
+                              else f"{name} = {body}", params)
+        self._dependencies[name] = dependencies
+        for dep in dependencies:
+            self._dependents.setdefault(dep, set()).add(name)
+        if params is not None:
+            self.values[name] = self._function(name, params, compiled)
+        elif error is None:
+            self.values[name] = value
+        else:
+            self.values.pop(name, None)
+        if error is None:
+            self.errors.pop(name, None)
+        else:
+            self.errors[name] = error
+        self._changed(name)
+        if save:
+            self.save()
+        return name, value
+
+    def assign(self, name, value):
+        """Set a calculator-provided value such as ans or M and update its dependents"""
+        self.bound.add(name)
+        if name in self.values and self.values[name] is value:
+            return
+        self.values[name] = value
+        self._changed(name)
+
+    def remove(self, name, save=True):
+        """Delete a definition; refused while other definitions use it"""
+        if name not in self.sources:
+            raise ExpressionError(f"Unknown definition '{name}'")
+        users = sorted(user for user in self._dependents.get(name, ()) if user in self.sources)
+        if users:
+            raise ExpressionError(f"'{name}' is used by {', '.join(users)}")
+        self._unlink(name)
+        del self.sources[name]
+        self._compiled.pop(name, None)
+        self.values.pop(name, None)
+        self.errors.pop(name, None)
+        self._changed(name)
+        if save:
+            self.save()
+
+    def set_backend(self, backend, bound=None):
+        """Recompile every definition for another numeric backend
+
+        bound gives the bound names' values converted for the new backend;
+        they are set before anything is recompiled.
+        """
+        self.backend = backend
+        texts = [self.sources[name][0] for name in self.ordered()]
+        for name in list(self.sources):
+            self._unlink(name)
+            self.values.pop(name, None)
+        self.sources.clear()
+        self._compiled.clear()
+        self.errors.clear()
+        for name, value in (bound or {}).items():
+            self.bound.add(name)
+            self.values[name] = value
+        self._load_texts(texts)
+        self.version += 1
+
+    def ordered(self, names=None):
+        """Definition names (all, or those in names) with each after the ones it uses"""
+        names = self.sources if names is None else names
+        order, seen = [], set()
+        for root in names:
+            if root in seen:
+                continue
+            # Iterative depth-first post-order walk
+            stack = [(root, iter(sorted(self._dependencies[root])))]
+            seen.add(root)
+            while stack:
+                name, children = stack[-1]
+                for child in children:
+                    if child in names and child not in seen:
+                        seen.add(child)
+                        stack.append((child, iter(sorted(self._dependencies[child]))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(name)
+        return order
+
+    # Persistence
+    def save(self):
+        """Write the definitions to path atomically (no-op without a path)"""
+        if not self.path:
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'definitions': [self.sources[name][0] for name in self.ordered()]
+                                      + list(self.rejected)},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        """Read definitions saved by save(); returns the texts that failed to load"""
+        with open(self.path, encoding='utf-8') as f:
+            texts = json.load(f).get('definitions', [])
+        return self._load_texts(texts)
+
+    def _load_texts(self, texts):
+        failed = []
+        for text in texts:
+            try:
+                name, _ = self.define(text, save=False, strict=False)
+            except (ValueError, ArithmeticError) as e:
+                self._keep(text, str(e))
+                failed.append(text)
+            else:
+                if name in self.errors:
+                    failed.append(text)
+        return failed
+
+    def _keep(self, text, error):
+        """Hold on to a definition that cannot be compiled, so it is saved and can be fixed later"""
+        match = DEFINITION_PATTERN.fullmatch(text)
+        if match is None or match.group('name') in self.bound:
+            self.rejected[text] = error
+            return
+        name = match.group('name')
+        params = None
+        if match.group('params') is not None:
+            params = tuple(param.strip() for param in match.group('params').split(',') if param.strip())
+        self._unlink(name)
+        self._compiled.pop(name, None)
+        self.values.pop(name, None)
+        self.sources[name] = (text.strip(), params)
+        self._dependencies[name] = set()
+        self.errors[name] = error
+        self._changed(name)
+
+    # Dependency tracking
+    def _closure(self, name):
+        """Every defined name that name depends on, directly or indirectly"""
+        found = set()
+        stack = [name]
+        while stack:
+            for dep in self._dependencies.get(stack.pop(), ()):
+                if dep not in found:
+                    found.add(dep)
+                    stack.append(dep)
+        return found
+
+    def _unlink(self, name):
+        for dep in self._dependencies.pop(name, ()):
+            users = self._dependents.get(dep)
+            if users is not None:
+                users.discard(name)
+
+    def _affected(self, name):
+        """Definitions depending on name, in the order they must be recomputed"""
+        affected = set()
+        stack = [name]
+        while stack:
+            for user in self._dependents.get(stack.pop(), ()):
+                if user not in affected:
+                    affected.add(user)
+                    stack.append(user)
+        return self.ordered(affected)
+
+    def _changed(self, name):
+        self.version += 1
+        for other in self._affected(name):
+            if self.sources[other][1] is not None:
+                # Functions read their globals at call time; nothing to recompute
+                continue
+            try:
+                self.values[other] = self._compiled[other].evaluate(self.values)
+                self.errors.pop(other, None)
+            except (ValueError, ArithmeticError) as e:
+                self.values.pop(other, None)
+                self.errors[other] = str(e)
+
+    def _function(self, name, params, body):
+        values = self.values
+        arity = len(params)
+
+        def function(*args):
+            if len(args) != arity:
+                raise ExpressionError(f"{name}() takes {arity} argument{'s' if arity != 1 else ''}, "
+                                      f"got {len(args)}")
+            limits.check_time()
+            scope = _Scope(zip(params, args))
+            scope.parent = values
+            return body.evaluate(scope)
+        function.__name__ = name
+        return function
@@ -0,0 +1,789 @@
+"""Headless calculator core: all arithmetic state and input handling, no GUI"""
+import re
+
+from definitions import REGISTER_NAMES, Definitions
+from expression import default_cache
+from history import HistoryEntry, HistoryStore
+from limits import budget
+from numeric import FLOAT, backend_spec, format_result, get_backend
+from preview import IncrementalEvaluator
+from rpn import OPERATORS as STACK_OPERATORS, RPNStack
+
+
+OPERATOR_KEYS = {'+': '+', '-': '−', '*': '×', '/': '÷', '%': '%'}
+
+# Keys that type themselves (or their display symbol) into the expression
+_TYPED_TABLE = str.maketrans(OPERATOR_KEYS)
+# A run of such keys, or any other single key
+_KEY_RUN = re.compile(r"[0-9.+\-*/%]+|.", re.DOTALL)
+
+# Characters accepted from the clipboard (whitespace is dropped first); letters
+# and commas allow variables and function calls such as sin(x) or nCr(5,2), and
+# brackets units such as 100[MB/s]to[GB/day]
+PASTE_CHARACTERS = (frozenset('0123456789.(),_×÷−[]^·µ') | frozenset(OPERATOR_KEYS)
+                    | frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+# A unit in brackets, kept as typed
+_UNIT_TEXT = re.compile(r"(\[[^\[\]]*\])")
+
+# Characters inserted as they are, rather than as a key press
+_LITERAL = frozenset('(),_[]^·')
+
+# Single-operand operations applied to a result with a unit, as expressions
+UNIT_OPERATIONS = {'√': 'sqrt({})', '**': '({})**2', '1/x': '1/({})'}
+
+# Stack values shown under the display in RPN mode, below x
+STACK_PREVIEW = 4
+
+# Seconds the live preview may take on the Tk thread before it shows nothing
+PREVIEW_BUDGET = 0.1
+
+# Any letter: text without one cannot refer to a variable
+_NAME = re.compile(r"[A-Za-z_]")
+
+
+def key_action(key):
+    """Map a keyboard character to (method name, args), or None if unbound"""
+    if key.isdigit():
+        return ('handle_input', (key,))
+    elif key == '.':
+        return ('handle_input', ('.',))
+    elif key in OPERATOR_KEYS:
+        return ('handle_input', (OPERATOR_KEYS[key],))
+    elif key in ['\r', '\n', '=']:
+        return ('calculate', ())
+    elif key == '\x08':
+        return ('backspace', ())
+    elif key.lower() == 'c':
+        return ('clear_all', ())
+    elif key in ['(', ')']:
+        return ('toggle_parentheses', ())
+    return None
+
+
+class CalculatorEngine:
+    """Calculator state machine driven by button/keyboard events
+
+    The display text lives in ``self.display``. Errors are not raised from
+    the event methods; the message is stored in ``self.error`` and the
+    display shows "Error", mirroring what the GUI presents.
+    """
+
+    def __init__(self, cache=None, history=None, definitions=None):
+        # Variables and user functions; ans and M are kept in sync by the engine
+        self.definitions = definitions if definitions is not None else Definitions()
+        self.display = "0"
+        self.num1 = None
+        self.operation = None
+        self.reset_display = False
+        # Memory registers M0-M9; memory is M0, and the memory keys act on self.register
+        self.registers = [0] * len(REGISTER_NAMES)
+        self.register = 0
+        self.memory = 0
+        self.expression_mode = False
+        self.expression = ""
+        # The default store keeps the newest 1000 entries and drops older ones;
+        # pass one with a spill path (as sessions do) to keep them all
+        self.calculation_history = history if history is not None else HistoryStore()
+        self.parentheses_count = 0
+        self.error = None
+        self.expression_cache = cache if cache is not None else default_cache
+        # Numeric backend for expressions and single-operand operations
+        self.backend = FLOAT
+        self._preview = IncrementalEvaluator(env=self.definitions.values)
+        self._preview_version = self.definitions.version
+        # RPN mode: operators act on the stack; a number being typed stays on
+        # the display (entering is True) until Enter or an operator pushes it
+        self.rpn_mode = False
+        self.stack = RPNStack()
+        self.entering = False
+
+    @property
+    def memory(self):
+        return self.registers[0]
+
+    @memory.setter
+    def memory(self, value):
+        self.set_register(0, value)
+
+    def set_register(self, index, value):
+        """Store value in register index; expressions see it as M<index>, and M0 also as M"""
+        self.registers[index] = value
+        self.definitions.assign(REGISTER_NAMES[index], value)
+        if index == 0:
+            self.definitions.assign('M', value)
+
+    def set_numeric_mode(self, mode, precision=None):
+        """Switch between float, decimal, fraction and int arithmetic"""
+        backend = get_backend(mode, precision)
+        bound = {}
+        current = dict(zip(REGISTER_NAMES, self.registers), ans=self.definitions.values.get('ans', 0))
+        for name, value in current.items():
+            try:
+                bound[name] = backend.coerce(value)
+            except (ValueError, ArithmeticError):
+                bound[name] = backend.coerce(0)
+        bound['M'] = bound['M0']
+        self.backend = backend
+        # Definitions are recompiled with ans and the registers already
+        # converted, so no value from the previous backend is mixed into the
+        # new arithmetic
+        self.definitions.set_backend(backend, bound)
+        self.registers = [bound[name] for name in REGISTER_NAMES]
+        self.stack.set_backend(backend)
+        if self.rpn_mode and not self.entering:
+            self._show_top()
+
+    def define(self, text):
+        """Add a variable or function definition such as 'f(x)=x×1.07'"""
+        self.error = None
+        try:
+            self.definitions.define(text)
+        except (ValueError, ArithmeticError) as e:
+            self.error = str(e)
+
+    def insert_name(self, name):
+        """Type a variable name, or a function name and '(', into the expression"""
+        self.error = None
+        if self.rpn_mode:
+            # There is no expression to type into: push the variable's value
+            value = self.definitions.values.get(name.rstrip('('))
+            if value is None or callable(value):
+                self._set_error(ValueError("Only variables can be used in RPN mode"))
+            else:
+                self._rpn_push(value)
+            return
+        if self.reset_display or self.display == "Error" or (not self.expression_mode and self.display == "0"):
+            self.expression = ""
+        elif not self.expression_mode:
+            self.expression = self.display
+        if self.expression and (self.expression[-1].isalnum() or self.expression[-1] in '._)'):
+            # Juxtaposition is not multiplication in the grammar, so make it explicit
+            self.expression += '×'
+        self.expression += name
+        self.display = self.expression
+        self.expression_mode = True
+        self.reset_display = False
+
+    def insert_unit(self, unit, convert=False):
+        """Tag the number being typed with a unit such as 'MB/s', or with convert, add 'to [unit]'
+
+        Either continues the expression, or the last result, which keeps its unit.
+        """
+        self.error = None
+        if self.rpn_mode:
+            self._set_error(ValueError("RPN mode takes numbers and operators only"))
+            return
+        if self.display == "Error":
+            return
+        if not self.expression_mode:
+            self.expression = self.display
+        self.expression += f" to [{unit}]" if convert else f"[{unit}]"
+        self.display = self.expression
+        self.expression_mode = True
+        self.reset_display = False
+
+    def format_value(self, value):
+        """Display form of a value produced by the current backend"""
+        if self.backend is FLOAT:
+            return format_result(value)
+        return self.backend.format(value)
+
+    def press(self, key):
+        """Apply a single keyboard character; returns False if the key is unbound"""
+        action = key_action(key)
+        if action is None:
+            return False
+        name, args = action
+        getattr(self, name)(*args)
+        return True
+
+    def feed(self, keys):
+        """Apply a stream of keyboard characters
+
+        Runs of digits and operators are typed in one step by insert(); any
+        error raised along the way is left in ``self.error``, even if later
+        keys succeeded, so a burst reports its failure once.
+        """
+        error = None
+        for match in _KEY_RUN.finditer(keys):
+            run = match.group()
+            if len(run) > 1 or run in OPERATOR_KEYS or run.isdigit() or run == '.':
+                self.insert(run.translate(_TYPED_TABLE))
+            else:
+                self.press(run)
+            if self.error:
+                error = self.error
+        self.error = error
+        return self.display
+
+    def insert(self, text):
+        """Type text into the expression; the same result as handle_input() per character
+
+        Characters go through handle_input() only until the buffer reaches the
+        plain "append to the expression" state, after which the rest of the
+        text is appended in one operation. Parentheses, commas, names and units
+        are inserted literally.
+        """
+        self.error = None
+        if self.rpn_mode:
+            for char in text:
+                if char in _LITERAL or char.isalpha():
+                    self._set_error(ValueError("RPN mode takes numbers and operators only"))
+                    return
+                self._rpn_input(char)
+                if self.error:
+                    return
+            return
+        i = 0
+        while i < len(text) and not (self.expression_mode and not self.reset_display
+                                     and self.display == self.expression
+                                     and self.display not in ("0", "Error")):
+            char = text[i]
+            if char in _LITERAL or char.isalpha():
+                self._insert_literal(char)
+            else:
+                self.handle_input(char)
+            i += 1
+        if i < len(text):
+            self.expression += text[i:]
+            self.display = self.expression
+
+    def _insert_literal(self, char):
+        if self.reset_display or self.display == "Error" or (not self.expression_mode and self.display == "0"):
+            # Start a new expression, as typing a digit would
+            if char not in '),':
+                self.expression = self.display = char
+                self.expression_mode = True
+                self.reset_display = False
+            return
+        if not self.expression_mode:
+            self.expression = self.display
+            self.expression_mode = True
+        self.expression += char
+        self.display = self.expression
+
+    def paste(self, text):
+        """Insert an expression from the clipboard, e.g. "(12.5 + 3) * 4" """
+        self.error = None
+        text = ''.join(text.split())
+        for char in text:
+            if char not in PASTE_CHARACTERS:
+                self.error = f"Cannot paste '{char}'"
+                return
+        # Operators become display symbols, except inside a unit such as [MB/s]
+        parts = _UNIT_TEXT.split(text)
+        parts[::2] = [part.translate(_TYPED_TABLE) for part in parts[::2]]
+        self.insert(''.join(parts))
+
+    def handle_input(self, input_char):
+        """Handle all input (numbers, operators, etc.)"""
+        self.error = None
+        if self.rpn_mode:
+            self._rpn_input(input_char)
+            return
+        current = self.display
+
+        # If we're starting fresh or after an error
+        if current == "0" and input_char.isdigit():
+            self.expression = input_char
+            self.display = input_char
+            self.expression_mode = True
+            return
+        elif current == "Error":
+            if input_char.isdigit():
+                self.expression = input_char
+                self.display = input_char
+                self.expression_mode = True
+            return
+
+        # If we need to reset after a calculation
+        if self.reset_display:
+            if input_char.isdigit() or input_char == '.':
+                self.expression = input_char
+                self.display = input_char
+                self.expression_mode = True
+                self.reset_display = False
+                return
+            elif input_char in ['+', '−', '×', '÷', '%']:
+                # Continue with the result
+                self.expression = current + input_char
+                self.expression_mode = True
+                self.reset_display = False
+            else:
+                self.reset_display = False
+
+        # Add to expression
+        if not self.expression_mode:
+            self.expression = current
+            self.expression_mode = True
+
+        self.expression += input_char
+        self.display = self.expression
+
+    def preview(self):
+        """Live result of the pending expression, formatted for display, or "" if none
+
+        In RPN mode, the stack below the value on the display instead.
+        """
+        if self.rpn_mode:
+            return self._stack_preview()
+        if not self.expression_mode or not self.expression:
+            return ""
+        if '[' in self.expression:
+            # The incremental evaluator knows no units; compile the whole text
+            try:
+                with budget(PREVIEW_BUDGET):
+                    compiled = self.expression_cache.compile(self.expression, self.backend)
+                    value = compiled.evaluate(self.definitions.values)
+                text = str(self.format_value(value))
+                return f"{text}[{compiled.unit}]" if compiled.unit else text
+            except (ValueError, ArithmeticError):
+                return ""
+        try:
+            # Parsing that runs out of time picks up where it stopped next time
+            with budget(PREVIEW_BUDGET):
+                value = self._synced_preview().result()
+            if value is None:
+                return ""
+            return str(self.format_value(value))
+        except (ValueError, ArithmeticError):
+            return ""
+
+    def _synced_preview(self):
+        """The incremental evaluator, brought up to date with the expression"""
+        if self._preview_version != self.definitions.version:
+            # Cached parse states hold variable values; start over after any
+            # change, unless the text uses no names (as after M+ on plain numbers)
+            if self._preview.backend is not self.backend or _NAME.search(self._preview.text):
+                self._preview = IncrementalEvaluator(env=self.definitions.values, backend=self.backend)
+            self._preview_version = self.definitions.version
+        # Only the characters changed since the last call are re-parsed; each
+        # keystroke applies at most a few operators, all bounded by limits.py
+        # and checked against the preview's time budget
+        self._preview.sync(self.expression)
+        return self._preview
+
+    def _stack_preview(self):
+        values = self.stack.values
+        # While a number is being typed, all of the stack sits below it
+        end = len(values) if self.entering else len(values) - 1
+        start = max(0, end - STACK_PREVIEW)
+        try:
+            shown = [str(self.format_value(values[i])) for i in range(start, end)]
+        except (ValueError, ArithmeticError):
+            return ""
+        return ('…   ' if start else '') + '   '.join(shown)
+
+    def evaluate_expression(self, expression):
+        """Safely evaluate mathematical expression with parentheses support"""
+        with budget():
+            return self.expression_cache.evaluate(expression, self.definitions.values, self.backend)
+
+    def _unit(self, expression):
+        """Label of the unit expression evaluates to, or None for a plain number"""
+        if '[' not in expression:
+            return None
+        return self.expression_cache.compile(expression, self.backend).unit
+
+    def _display_value(self):
+        if '[' in self.display:
+            # A result with its unit, such as 8640[GB/day]: the number in that unit
+            return self.evaluate_expression(self.display)
+        return self.backend.parse(self.display)
+
+    def calculate_operation(self, op):
+        """Calculate single-operand operations"""
+        self.error = None
+        if self.rpn_mode:
+            try:
+                self._rpn_enter()
+                value, result = self.stack.unary(op)
+            except (ValueError, ArithmeticError) as e:
+                self._set_error(e)
+                return
+            self._rpn_result((value,), op, result)
+            return
+        text = self.expression if self.expression_mode and self.expression else self.display
+        if '[' in text:
+            # Apply the operation inside the expression, so the unit follows it
+            self.expression = UNIT_OPERATIONS[op].format(text)
+            self.expression_mode = True
+            self.calculate()
+            return
+        try:
+            if self.expression_mode and self.expression:
+                # If we're in expression mode, evaluate the expression first
+                try:
+                    current = self.evaluate_expression(self.expression)
+                except (ValueError, ArithmeticError):
+                    current = self.backend.parse(self.display)
+            else:
+                current = self.backend.parse(self.display)
+
+            result = self.backend.unary(op, current)
+            self.definitions.assign('ans', result)
+            if self.backend is FLOAT:
+                history_entry = HistoryEntry(None, (current,), op, result)
+            else:
+                # Exact values are recorded in their display form
+                history_entry = HistoryEntry(None, (self.format_value(current),), op,
+                                             self.format_value(result), backend_spec(self.backend))
+
+            result = self.format_value(result)
+
+            self.display = str(result)
+            self.expression = str(result)
+            self.calculation_history.append(history_entry)
+            self.reset_display = True
+            self.expression_mode = False
+
+        except (ValueError, ArithmeticError) as e:
+            self._set_error(e)
+
+    def calculate(self):
+        """Perform calculation with expression support"""
+        self.error = None
+        if self.rpn_mode:
+            # Enter: push the number being typed, or duplicate x
+            try:
+                if self.entering:
+                    self._rpn_enter()
+                elif self.stack.values:
+                    self.stack.duplicate()
+            except (ValueError, ArithmeticError) as e:
+                self._set_error(e)
+                return
+            self._show_top()
+            return
+        try:
+            if self.expression_mode and self.expression:
+                # Evaluate the entire expression
+                value = self.evaluate_expression(self.expression)
+                unit = self._unit(self.expression)
+                self.definitions.assign('ans', value)
+                result = self.format_value(value)
+
+                # Store in history
+                history_entry = HistoryEntry(self.expression, (), None, result, backend_spec(self.backend))
+                self.calculation_history.append(history_entry)
+
+                # Display result, with its unit in a form that can be calculated with
+                self.display = f"{result}[{unit}]" if unit else str(result)
+                self.expression = self.display
+                self.reset_display = True
+                self.expression_mode = False
+
+            elif self.num1 is not None and self.operation is not None:
+                # Legacy calculation mode for backward compatibility
+                num2 = float(self.display)
+
+                if self.operation == '+':
+                    result = self.num1 + num2
+                    symbol = '+'
+                elif self.operation == '-':
+                    result = self.num1 - num2
+                    symbol = '−'
+                elif self.operation == '*':
+                    result = self.num1 * num2
+                    symbol = '×'
+                elif self.operation == '/':
+                    if num2 == 0:
+                        raise ZeroDivisionError("Cannot divide by zero!")
+                    result = self.num1 / num2
+                    symbol = '÷'
+                elif self.operation == '%':
+                    if num2 == 0:
+                        raise ZeroDivisionError("Cannot find modulo with zero!")
+                    result = self.num1 % num2
+                    symbol = '%'
+
+                result = format_result(result)
+
+                # Store in history
+                history_entry = HistoryEntry(None, (self.num1, num2), symbol, result)
+                self.calculation_history.append(history_entry)
+
+                # Display result
+                self.display = str(result)
+
+                # Reset for next calculation
+                self.num1 = None
+                self.operation = None
+                self.reset_display = True
+                self.expression_mode = False
+
+        except (ValueError, ArithmeticError) as e:
+            self._set_error(e)
+            self.num1 = None
+            self.operation = None
+
+    def _set_error(self, error):
+        self.error = str(error)
+        self.display = "Error"
+        self.expression = ""
+        self.expression_mode = False
+        self.entering = False
+
+    def clear_all(self):
+        """Clear everything"""
+        self.error = None
+        self.display = "0"
+        self.num1 = None
+        self.operation = None
+        self.reset_display = False
+        self.parentheses_count = 0
+        self.expression = ""
+        self.expression_mode = False
+        self.stack.clear()
+        self.entering = False
+
+    def backspace(self):
+        """Remove last character"""
+        self.error = None
+        if self.rpn_mode:
+            if self.entering:
+                self.display = self.display[:-1]
+                if self.display in ("", "-"):
+                    self.entering = False
+                    self._show_top()
+            elif self.stack.values:
+                # Nothing typed: drop x
+                self.stack.drop()
+                self._show_top()
+            return
+        if self.expression_mode and self.expression:
+            if len(self.expression) > 1:
+                self.expression = self.expression[:-1]
+                self.display = self.expression
+            else:
+                self.expression = ""
+                self.display = "0"
+                self.expression_mode = False
+        else:
+            current = self.display
+            if current != "Error":
+                if len(current) > 1:
+                    self.display = current[:-1]
+                else:
+                    self.display = "0"
+
+    def toggle_sign(self):
+        """Toggle positive/negative"""
+        self.error = None
+        if self.rpn_mode:
+            if self.entering:
+                self.display = self.display[1:] if self.display.startswith('-') else '-' + self.display
+            elif self.stack.values:
+                self.stack.negate()
+                self._show_top()
+            return
+        if self.expression_mode and self.expression:
+            # In expression mode, add/remove negative at the current position
+            if self.expression.startswith('-'):
+                self.expression = self.expression[1:]
+            else:
+                self.expression = '-' + self.expression
+            self.display = self.expression
+        else:
+            current = self.display
+            if current != "0" and current != "Error":
+                if current.startswith('-'):
+                    self.display = current[1:]
+                else:
+                    self.display = '-' + current
+
+    def toggle_parentheses(self):
+        """Add opening or closing parenthesis based on context"""
+        self.error = None
+        if self.rpn_mode:
+            # Parentheses have no use on a stack; the key swaps x and y instead
+            try:
+                self._rpn_enter()
+                self.stack.swap()
+            except (ValueError, ArithmeticError) as e:
+                self._set_error(e)
+                return
+            self._show_top()
+            return
+        if not self.expression_mode:
+            self.expression = self.display
+            self.expression_mode = True
+
+        # Count current open parentheses
+        open_parens = self.expression.count('(')
+        close_parens = self.expression.count(')')
+
+        # Determine whether to add opening or closing parenthesis
+        if open_parens == close_parens:
+            # Add opening parenthesis
+            # If last character is a number or closing paren, add multiplication
+            if self.expression and (self.expression[-1].isdigit() or self.expression[-1] == ')'):
+                self.expression += '×('
+            else:
+                self.expression += '('
+        else:
+            # Add closing parenthesis if we have unmatched opening ones
+            # But only if the last character is a number or closing paren
+            if self.expression and (self.expression[-1].isdigit() or self.expression[-1] == ')'):
+                self.expression += ')'
+            else:
+                # If last character is an operator, we might want to add opening paren instead
+                self.expression += '('
+
+        self.display = self.expression
+
+    # Memory functions; index defaults to the selected register
+    def select_register(self, index):
+        """Choose the register (0-9) that MC, MR, MS, M+ and M- act on"""
+        self.error = None
+        if not 0 <= index < len(self.registers):
+            raise ValueError(f"No memory register {index}")
+        self.register = index
+
+    def memory_clear(self, index=None):
+        """Clear memory"""
+        self.error = None
+        self.set_register(self.register if index is None else index, 0)
+
+    def memory_recall(self, index=None):
+        """Recall from memory"""
+        self.error = None
+        value = self.registers[self.register if index is None else index]
+        if self.rpn_mode:
+            self._rpn_push(value)
+            return
+        self.display = str(value)
+        self.expression = str(value)
+        self.expression_mode = True
+        self.reset_display = False
+
+    def memory_store(self, index=None):
+        """Store current value in memory"""
+        self.error = None
+        try:
+            self.set_register(self.register if index is None else index, self.current_value())
+        except (ValueError, ArithmeticError):
+            pass
+
+    def memory_add(self, index=None):
+        """Add current value to memory"""
+        self.error = None
+        index = self.register if index is None else index
+        try:
+            self.set_register(index, self.registers[index] + self.current_value())
+        except (ValueError, ArithmeticError):
+            pass
+
+    def memory_subtract(self, index=None):
+        """Subtract current value from memory"""
+        self.error = None
+        index = self.register if index is None else index
+        try:
+            self.set_register(index, self.registers[index] - self.current_value())
+        except (ValueError, ArithmeticError):
+            pass
+
+    def needs_evaluation(self):
+        """True if current_value() has to evaluate the expression in full, which may be slow"""
+        if self.rpn_mode:
+            return False
+        if self.expression_mode and self.expression:
+            evaluator = self._synced_preview()
+            return not evaluator.complete() or evaluator.result() is None
+        return '[' in self.display
+
+    def current_value(self):
+        """Numeric value of the pending expression, or of the display"""
+        if self.rpn_mode:
+            if not self.entering and self.stack.values:
+                return self.stack.top
+            return self.backend.parse(self.display)
+        if self.expression_mode and self.expression:
+            # The live preview has usually parsed this text already; a full
+            # evaluation is only needed when it cannot give the value
+            evaluator = self._synced_preview()
+            if evaluator.complete():
+                value = evaluator.result()
+                if value is not None:
+                    return value
+            return self.evaluate_expression(self.expression)
+        return self._display_value()
+
+    # RPN (stack) mode
+    def set_rpn_mode(self, enabled):
+        """Switch between expression entry and RPN, carrying the current value across"""
+        self.error = None
+        if enabled == self.rpn_mode:
+            return
+        value = None
+        if self.display not in ("0", "Error"):
+            try:
+                value = self.current_value()
+            except (ValueError, ArithmeticError):
+                pass
+        self.clear_all()
+        self.rpn_mode = enabled
+        if value is None:
+            return
+        if enabled:
+            self.stack.push(value)
+            self._show_top()
+        else:
+            self.display = self.expression = str(self.format_value(value))
+            self.reset_display = True
+
+    def _rpn_input(self, char):
+        """Type a digit or decimal point into x, or apply an operator to the stack"""
+        if char.isdigit() or char == '.':
+            if not self.entering:
+                self.display = '0.' if char == '.' else char
+                self.entering = True
+            elif char == '.':
+                if '.' not in self.display:
+                    self.display += char
+            elif self.display in ('0', '-0'):
+                self.display = self.display[:-1] + char
+            else:
+                self.display += char
+            return
+        if char not in STACK_OPERATORS:
+            return
+        try:
+            self._rpn_enter()
+            a, b, result = self.stack.apply(char)
+        except (ValueError, ArithmeticError) as e:
+            self._set_error(e)
+            return
+        self._rpn_result((a, b), char, result)
+
+    def _rpn_enter(self):
+        """Push the number being typed, if any"""
+        if self.entering:
+            value = self.backend.parse(self.display)
+            self.entering = False
+            self.stack.push(value)
+
+    def _rpn_push(self, value):
+        try:
+            self._rpn_enter()
+        except (ValueError, ArithmeticError) as e:
+            self._set_error(e)
+            return
+        self.stack.push(value)
+        self._show_top()
+
+    def _rpn_result(self, operands, op, result):
+        """Record a stack operation in ans and the history, and show its result"""
+        self.definitions.assign('ans', result)
+        if self.backend is FLOAT:
+            history_entry = HistoryEntry(None, operands, op, result)
+        else:
+            history_entry = HistoryEntry(None, tuple(self.format_value(value) for value in operands), op,
+                                         self.format_value(result), backend_spec(self.backend))
+        self.calculation_history.append(history_entry)
+        self._show_top()
+
+    def _show_top(self):
+        top = self.stack.top
+        self.display = "0" if top is None else str(self.format_value(top))
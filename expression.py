@@ -0,0 +1,636 @@
+"""Expression engine: tokenizer, parser and closure compiler for calculator input"""
+import operator
+import re
+import threading
+from collections import OrderedDict
+from decimal import Overflow as DecimalOverflow
+
+import functions
+import limits
+from numeric import FLOAT
+
+
+class ExpressionError(ValueError):
+    """Invalid expression, optionally pointing at the offending character"""
+
+    def __init__(self, message, position=None):
+        self.message = message
+        self.position = position
+        # position is a 0-based index into the source text; the message is 1-based
+        if position is not None:
+            message = f"{message} at position {position + 1}"
+        super().__init__(message)
+
+    def __reduce__(self):
+        # Rebuild from the raw parts so errors survive pickling across processes
+        return (type(self), (self.message, self.position))
+
+
+class LimitError(ExpressionError):
+    """Evaluation refused or stopped because it would exceed a limit in limits.py"""
+
+
+class CalculationCancelled(ExpressionError):
+    """Evaluation stopped because its budget's cancel event was set"""
+
+
+# Display symbols are accepted directly alongside their ASCII equivalents
+SYMBOLS = {'×': '*', '÷': '/', '−': '-'}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<op>\*\*|××|//|÷÷|[-+*/%×÷−])
+  | (?P<paren>[()])
+  | (?P<comma>,)
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<unit>\[[^\[\]]*\])
+""", re.VERBOSE)
+
+
+class Token:
+    """A single lexical token with its position in the source text"""
+
+    def __init__(self, kind, value, text, pos):
+        self.kind = kind
+        self.value = value
+        self.text = text
+        self.pos = pos
+
+
+def tokenize(text):
+    """Split expression text into tokens, normalizing display symbols"""
+    tokens = []
+    pos = 0
+    length = len(text)
+    max_tokens = limits.current.max_tokens
+    while pos < length:
+        match = TOKEN_PATTERN.match(text, pos)
+        if match is None:
+            raise ExpressionError(f"Invalid character '{text[pos]}'", pos)
+        if max_tokens is not None and len(tokens) >= max_tokens:
+            raise LimitError(f"Expression is longer than {max_tokens} tokens", pos)
+        kind = match.lastgroup
+        lexeme = match.group()
+        if kind == 'number':
+            if '.' in lexeme or 'e' in lexeme or 'E' in lexeme:
+                tokens.append(Token('number', float(lexeme), lexeme, pos))
+            else:
+                try:
+                    value = int(lexeme)
+                except ValueError:
+                    # Longer than Python's int-from-string digit limit
+                    raise LimitError("Number has too many digits", pos)
+                tokens.append(Token('number', value, lexeme, pos))
+        elif kind == 'op':
+            value = ''.join(SYMBOLS.get(c, c) for c in lexeme)
+            tokens.append(Token('op', value, lexeme, pos))
+        elif kind in ('paren', 'comma'):
+            tokens.append(Token(lexeme, lexeme, lexeme, pos))
+        elif kind == 'name':
+            tokens.append(Token('name', lexeme, lexeme, pos))
+        elif kind == 'unit':
+            tokens.append(Token('unit', lexeme[1:-1], lexeme, pos))
+        pos = match.end()
+    tokens.append(Token('end', None, '', length))
+    return tokens
+
+
+# AST nodes
+class Number:
+    def __init__(self, value, pos, text=None):
+        self.value = value
+        self.pos = pos
+        # Source spelling, so exact backends can build the literal without float rounding
+        self.text = text if text is not None else str(value)
+
+
+class Name:
+    def __init__(self, name, pos):
+        self.name = name
+        self.pos = pos
+
+
+class Call:
+    def __init__(self, name, args, pos):
+        self.name = name
+        self.args = args
+        self.pos = pos
+
+
+class UnaryOp:
+    def __init__(self, op, operand, pos):
+        self.op = op
+        self.operand = operand
+        self.pos = pos
+
+
+class BinaryOp:
+    def __init__(self, op, left, right, pos):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.pos = pos
+
+
+class Quantity:
+    """operand[unit]; units.resolve() rewrites these into plain arithmetic"""
+
+    def __init__(self, operand, unit, pos):
+        self.operand = operand
+        self.unit = unit
+        self.pos = pos
+
+
+class Convert:
+    """operand to [unit]"""
+
+    def __init__(self, operand, unit, pos):
+        self.operand = operand
+        self.unit = unit
+        self.pos = pos
+
+
+class Parser:
+    """Recursive-descent parser following Python's arithmetic precedence
+
+    convert  := expr ('to' unit)*
+    expr     := term (('+' | '-') term)*
+    term     := unary (('*' | '/' | '//' | '%') unary)*
+    unary    := ('+' | '-') unary | power
+    power    := quantity ('**' unary)?
+    quantity := atom unit?
+    atom     := number | name | name '(' [convert (',' convert)*] ')' | '(' convert ')'
+    unit     := '[' unit text ']'
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.index = 0
+        # Nesting of parentheses, calls and signs, checked against limits.current.max_depth
+        self.depth = 0
+        self.max_depth = limits.current.max_depth
+
+    def parse(self):
+        if self.tokens[0].kind == 'end':
+            raise ExpressionError("Empty expression")
+        node = self.parse_convert()
+        token = self.peek()
+        if token.kind == ')':
+            raise ExpressionError("Unmatched parentheses", token.pos)
+        if token.kind != 'end':
+            raise ExpressionError(f"Unexpected '{token.text}'", token.pos)
+        return node
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def advance(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def parse_convert(self):
+        node = self.parse_expr()
+        while (self.peek().kind == 'name' and self.peek().value == 'to'
+               and self.tokens[self.index + 1].kind == 'unit'):
+            self.advance()
+            unit = self.advance()
+            node = Convert(node, unit.value, unit.pos)
+        return node
+
+    def parse_expr(self):
+        node = self.parse_term()
+        while self.peek().kind == 'op' and self.peek().value in ('+', '-'):
+            token = self.advance()
+            node = BinaryOp(token.value, node, self.parse_term(), token.pos)
+        return node
+
+    def parse_term(self):
+        node = self.parse_unary()
+        while self.peek().kind == 'op' and self.peek().value in ('*', '/', '//', '%'):
+            token = self.advance()
+            node = BinaryOp(token.value, node, self.parse_unary(), token.pos)
+        return node
+
+    def parse_unary(self):
+        # Every level of nesting passes through here once
+        token = self.peek()
+        if self.max_depth is not None and self.depth > self.max_depth:
+            raise LimitError(f"Expression is nested more than {self.max_depth} levels deep", token.pos)
+        self.depth += 1
+        if token.kind == 'op' and token.value in ('+', '-'):
+            self.advance()
+            node = UnaryOp(token.value, self.parse_unary(), token.pos)
+        else:
+            node = self.parse_power()
+        self.depth -= 1
+        return node
+
+    def parse_power(self):
+        node = self.parse_atom()
+        if self.peek().kind == 'unit':
+            unit = self.advance()
+            node = Quantity(node, unit.value, unit.pos)
+        if self.peek().kind == 'op' and self.peek().value == '**':
+            token = self.advance()
+            node = BinaryOp('**', node, self.parse_unary(), token.pos)
+        return node
+
+    def parse_atom(self):
+        token = self.advance()
+        if token.kind == 'number':
+            return Number(token.value, token.pos, token.text)
+        if token.kind == 'name':
+            if self.peek().kind == '(':
+                return self.parse_call(token)
+            return Name(token.value, token.pos)
+        if token.kind == '(':
+            if self.peek().kind == ')':
+                raise ExpressionError("Empty parentheses not allowed", token.pos)
+            node = self.parse_convert()
+            closing = self.advance()
+            if closing.kind == 'end':
+                raise ExpressionError("Unmatched parentheses", token.pos)
+            if closing.kind != ')':
+                raise ExpressionError(f"Unexpected '{closing.text}'", closing.pos)
+            return node
+        if token.kind == 'end':
+            raise ExpressionError("Incomplete expression", token.pos)
+        raise ExpressionError(f"Unexpected '{token.text}'", token.pos)
+
+
+    def parse_call(self, name):
+        opening = self.advance()
+        args = []
+        if self.peek().kind != ')':
+            args.append(self.parse_convert())
+            while self.peek().kind == ',':
+                self.advance()
+                args.append(self.parse_convert())
+        closing = self.advance()
+        if closing.kind == 'end':
+            raise ExpressionError("Unmatched parentheses", opening.pos)
+        if closing.kind != ')':
+            raise ExpressionError(f"Unexpected '{closing.text}'", closing.pos)
+        return Call(name.value, args, name.pos)
+
+
+def parse(text):
+    """Parse expression text into an AST"""
+    try:
+        return Parser(text).parse()
+    except RecursionError:
+        raise ExpressionError("Expression is nested too deeply")
+
+
+def names(node):
+    """Return the set of variable and function names referenced by an AST"""
+    found = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Name):
+            found.add(node.name)
+        elif isinstance(node, (UnaryOp, Quantity, Convert)):
+            stack.append(node.operand)
+        elif isinstance(node, BinaryOp):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, Call):
+            found.add(node.name)
+            stack.extend(node.args)
+    return found
+
+
+def _power(pos):
+    check_power = limits.check_power
+
+    def power(a, b):
+        try:
+            check_power(a, b)
+        except LimitError as e:
+            raise LimitError(e.message, pos)
+        result = a ** b
+        if isinstance(result, complex):
+            raise ExpressionError("Result is not a real number", pos)
+        return result
+    return power
+
+
+check_product = limits.check_product
+
+# Steps of an operator chain evaluated between time budget checks
+CHAIN_BLOCK = 16
+
+
+def _multiply(a, b):
+    # Integer products are exact, so they are bounded like the exact modes' ones
+    product = a * b
+    if type(product) is int:
+        check_product(product)
+    return product
+
+
+BINARY_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': _multiply,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '%': operator.mod,
+}
+
+
+def _binary_function(node, backend):
+    if backend is FLOAT:
+        return _power(node.pos) if node.op == '**' else BINARY_OPS[node.op]
+    return backend.operations(_power(node.pos))[node.op]
+
+
+def _compile_binary(node, left, right, backend):
+    if backend is not FLOAT:
+        func = _binary_function(node, backend)
+        return lambda env: func(left(env), right(env))
+    # Specialize the common operators to skip an extra call per node
+    if node.op == '+':
+        return lambda env: left(env) + right(env)
+    if node.op == '-':
+        return lambda env: left(env) - right(env)
+    if node.op == '*':
+        def multiply(env):
+            product = left(env) * right(env)
+            if type(product) is int:
+                check_product(product)
+            return product
+        return multiply
+    if node.op == '/':
+        return lambda env: left(env) / right(env)
+    func = _binary_function(node, backend)
+    return lambda env: func(left(env), right(env))
+
+
+def _library_call(library, backend, pos):
+    """Apply a library function to evaluated arguments in the backend's number type"""
+    name = library.name
+    precise = None
+    if library.decimal and hasattr(backend, 'context'):
+        precise = getattr(backend.context, library.decimal)
+
+    def apply(values):
+        library.check_arity(len(values))
+        limits.check_time()
+        try:
+            if precise is not None:
+                return precise(*values)
+            result = library.scalar(*values)
+        except ExpressionError as e:
+            raise type(e)(e.message, pos)
+        except (ValueError, TypeError):
+            raise ExpressionError(f"Invalid argument for {name}()", pos)
+        return result if backend is FLOAT else backend.coerce(result)
+    return apply
+
+
+def _compile_call(node, args, backend):
+    name, pos = node.name, node.pos
+    library = functions.lookup(name)
+    apply = _library_call(library, backend, pos) if library is not None else None
+
+    def call(env):
+        # Definitions in the environment shadow library functions of the same name
+        try:
+            function = env[name]
+        except (KeyError, TypeError):
+            if apply is None:
+                raise ExpressionError(f"Unknown function '{name}'", pos)
+            return apply([arg(env) for arg in args])
+        if not callable(function):
+            raise ExpressionError(f"'{name}' is not a function", pos)
+        return function(*[arg(env) for arg in args])
+    return call
+
+
+def _compile(node, backend=FLOAT):
+    """Turn an AST node into a closure taking an environment mapping"""
+    if isinstance(node, Number):
+        if backend is FLOAT:
+            value = node.value
+        else:
+            try:
+                value = backend.literal(node.text)
+            except ExpressionError as e:
+                raise type(e)(e.message, node.pos)
+        return lambda env: value
+    if isinstance(node, Name):
+        name, pos = node.name, node.pos
+        constant = functions.CONSTANTS.get(name, _UNSET)
+        if constant is not _UNSET and backend is not FLOAT:
+            constant = backend.coerce(constant)
+
+        def lookup(env):
+            try:
+                value = env[name]
+            except (KeyError, TypeError):
+                if constant is not _UNSET:
+                    return constant
+                raise ExpressionError(f"Unknown variable '{name}'", pos)
+            if callable(value):
+                # A user function named without its arguments
+                raise ExpressionError(f"'{name}' is a function", pos)
+            return value
+        return lookup
+    if isinstance(node, Call):
+        return _compile_call(node, [_compile(arg, backend) for arg in node.args], backend)
+    if isinstance(node, UnaryOp):
+        operand = _compile(node.operand, backend)
+        if node.op == '-':
+            if backend is FLOAT:
+                return lambda env: -operand(env)
+            negate = backend.negate
+            return lambda env: negate(operand(env))
+        return operand
+    if isinstance(node, BinaryOp):
+        # Walk the left spine iteratively so long flat chains like 1+2+...+n
+        # compile into one loop instead of recursing once per operator
+        steps = []
+        while isinstance(node, BinaryOp):
+            steps.append(node)
+            node = node.left
+        first = _compile(node, backend)
+        steps.reverse()
+        if len(steps) == 1:
+            return _compile_binary(steps[0], first, _compile(steps[0].right, backend), backend)
+        chain = [(_binary_function(step, backend), _compile(step.right, backend)) for step in steps]
+        if len(chain) <= CHAIN_BLOCK:
+            def evaluate_chain(env):
+                value = first(env)
+                for func, right in chain:
+                    value = func(value, right(env))
+                return value
+            return evaluate_chain
+        # A chain can be thousands of steps long; the time budget is checked
+        # after each block of steps, each of them bounded by max_bits
+        blocks = [chain[i:i + CHAIN_BLOCK] for i in range(0, len(chain), CHAIN_BLOCK)]
+        check_time = limits.check_time
+
+        def evaluate_blocks(env):
+            value = first(env)
+            for block in blocks:
+                for func, right in block:
+                    value = func(value, right(env))
+                check_time()
+            return value
+        return evaluate_blocks
+    raise TypeError(f"Unknown node {node!r}")
+
+
+_UNSET = object()
+
+
+class CompiledExpression:
+    """An expression parsed and compiled once, ready to be evaluated repeatedly"""
+
+    def __init__(self, text, tree, backend=FLOAT):
+        self.text = text
+        self.backend = backend
+        # Label of the result's unit, or None; units are checked and compiled
+        # away here, so evaluating a unit expression is plain arithmetic
+        self.unit = None
+        if '[' in text:
+            import units
+            tree, self.unit = units.resolve(tree, backend)
+        self.tree = tree
+        self.names = frozenset(names(tree))
+        # Expressions built only from literals always produce the same result
+        self.is_constant = not self.names
+        self._value = _UNSET
+        try:
+            self._code = _compile(tree, backend)
+        except RecursionError:
+            raise ExpressionError("Expression is nested too deeply")
+
+    def evaluate(self, env=None):
+        """Evaluate the compiled expression; a float unless compiled for another backend"""
+        if self._value is not _UNSET:
+            return self._value
+        value = self._run(env)
+        if self.is_constant:
+            self._value = value
+        return value
+
+    def _run(self, env):
+        try:
+            value = self.backend.finish(self._code(env))
+        except ZeroDivisionError:
+            raise ZeroDivisionError("Cannot divide by zero!")
+        except (OverflowError, DecimalOverflow):
+            raise ExpressionError("Result is too large")
+        except ArithmeticError:
+            # decimal signals such as InvalidOperation (e.g. 0÷0 or a negative base to a fractional power)
+            raise ExpressionError("Invalid operation")
+        except RecursionError:
+            raise ExpressionError("Expression is nested too deeply")
+        except TypeError:
+            # A value of the wrong kind reached an operator; never let it escape as a crash
+            raise ExpressionError("Invalid operation")
+        limits.check_result(value)
+        return value
+
+
+def normalize(text):
+    """Map display symbols to ASCII so equivalent inputs share a cache entry
+
+    The mapping is one character to one character, so error positions
+    reported against the normalized text still match the original input.
+    """
+    return text.translate(_NORMALIZE_TABLE)
+
+
+_NORMALIZE_TABLE = str.maketrans(SYMBOLS)
+
+
+class ExpressionCache:
+    """Bounded LRU cache mapping normalized expression text to compiled expressions"""
+
+    def __init__(self, maxsize=256):
+        if maxsize < 0:
+            raise ValueError("Cache size cannot be negative")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def compile(self, text, backend=FLOAT):
+        """Return the compiled form of text for a numeric backend, compiling it on a miss"""
+        normalized = normalize(text)
+        key = normalized if backend is FLOAT else (backend.key, normalized)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        # Compile outside the lock; parse errors are raised and never cached
+        compiled = CompiledExpression(normalized, parse(normalized), backend)
+        if self.maxsize:
+            with self._lock:
+                self._entries[key] = compiled
+                self._entries.move_to_end(key)
+                self._evict()
+        return compiled
+
+    def evaluate(self, text, env=None, backend=FLOAT):
+        """Evaluate text, reusing the compiled form and any memoized constant result"""
+        return self.compile(text, backend).evaluate(env)
+
+    def resize(self, maxsize):
+        """Change the capacity, evicting least recently used entries if needed"""
+        if maxsize < 0:
+            raise ValueError("Cache size cannot be negative")
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current occupancy"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+# Shared cache used by the calculator and the module-level helpers
+default_cache = ExpressionCache()
+
+
+def compile_expression(text, backend=FLOAT):
+    """Parse and compile expression text"""
+    return CompiledExpression(text, parse(text), backend)
+
+
+def evaluate(text, env=None, backend=FLOAT):
+    """Evaluate expression text through the shared cache"""
+    return default_cache.evaluate(text, env, backend)
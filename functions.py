@@ -0,0 +1,265 @@
+"""Scientific function library available inside expressions
+
+Every function is registered once with a scalar implementation, used by the
+interactive evaluator, and an optional vectorized one used by batch.py when
+NumPy is installed. Vectorized implementations are named rather than
+imported: ``'numpy:sin'`` or ``'scipy.special:gamma'`` is resolved the first
+time it is needed, so importing this module loads no heavy backend, and a
+missing optional package simply falls back to mapping the scalar version.
+
+    sin(pi÷6)        log(8, 2)       nCr(5, 2)       mean(2, 4, 9)
+"""
+import importlib
+import math
+import statistics
+
+import limits
+
+# Constants usable by name in expressions
+CONSTANTS = {
+    'pi': math.pi,
+    'e': math.e,
+    'tau': math.tau,
+}
+
+FUNCTIONS = {}
+
+
+class Function:
+    """A library function: scalar and vectorized implementations plus its arity"""
+
+    __slots__ = ('name', 'scalar', 'min_args', 'max_args', 'vector', 'decimal', 'category', 'doc',
+                 '_resolved')
+
+    def __init__(self, name, scalar, min_args, max_args, vector, decimal, category, doc):
+        self.name = name
+        self.scalar = scalar
+        self.min_args = min_args
+        # None means any number of arguments
+        self.max_args = max_args
+        self.vector = vector
+        self.decimal = decimal
+        self.category = category
+        self.doc = doc
+        self._resolved = None
+
+    def check_arity(self, count):
+        if count < self.min_args or (self.max_args is not None and count > self.max_args):
+            if self.max_args is None:
+                expected = f"at least {self.min_args}"
+            elif self.min_args == self.max_args:
+                expected = str(self.min_args)
+            else:
+                expected = f"{self.min_args} to {self.max_args}"
+            raise _error(f"{self.name}() takes {expected} argument{'s' if expected.split()[-1] != '1' else ''}, "
+                         f"got {count}")
+
+    def vectorized(self):
+        """The NumPy-level implementation, imported on first use; None if unavailable"""
+        if self._resolved is None:
+            self._resolved = _resolve(self.vector) if self.vector else False
+        return self._resolved or None
+
+
+def _error(message):
+    # Imported lazily: expression.py imports this module at load time
+    from expression import ExpressionError
+    return ExpressionError(message)
+
+
+_modules = {}
+
+
+def _resolve(spec):
+    """Turn 'module:attribute' (or a callable taking numpy) into a callable, or None"""
+    if callable(spec):
+        numpy = _import('numpy')
+        return spec(numpy) if numpy is not None else None
+    module_name, _, attribute = spec.partition(':')
+    module = _import(module_name)
+    return getattr(module, attribute, None) if module is not None else None
+
+
+def _import(name):
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    return _modules[name]
+
+
+def register(name, args=1, vector=None, decimal=None, category='', doc=''):
+    """Decorator registering a scalar implementation under name
+
+    args is the argument count, or a (min, max) pair with max None for
+    variadic functions. vector is 'module:attribute' for a NumPy-compatible
+    implementation (or a callable building one from the numpy module);
+    decimal names a decimal.Context method giving a full-precision result in
+    Decimal mode.
+    """
+    min_args, max_args = (args, args) if isinstance(args, int) else args
+
+    def decorate(scalar):
+        FUNCTIONS[name] = Function(name, scalar, min_args, max_args, vector, decimal, category,
+                                   doc or (scalar.__doc__ or '').strip())
+        return scalar
+    return decorate
+
+
+def lookup(name):
+    """The registered Function for name, or None"""
+    return FUNCTIONS.get(name)
+
+
+def _whole(name, value):
+    """value as a non-negative int, for functions defined only on whole numbers"""
+    if value != int(value) or value < 0:
+        raise _error(f"{name}() needs a whole number that is not negative")
+    return int(value)
+
+
+# Trigonometry (radians)
+register('sin', vector='numpy:sin', category='Trigonometry')(math.sin)
+register('cos', vector='numpy:cos', category='Trigonometry')(math.cos)
+register('tan', vector='numpy:tan', category='Trigonometry')(math.tan)
+register('asin', vector='numpy:arcsin', category='Trigonometry')(math.asin)
+register('acos', vector='numpy:arccos', category='Trigonometry')(math.acos)
+register('atan', vector='numpy:arctan', category='Trigonometry')(math.atan)
+register('atan2', args=2, vector='numpy:arctan2', category='Trigonometry')(math.atan2)
+register('sinh', vector='numpy:sinh', category='Trigonometry')(math.sinh)
+register('cosh', vector='numpy:cosh', category='Trigonometry')(math.cosh)
+register('tanh', vector='numpy:tanh', category='Trigonometry')(math.tanh)
+register('degrees', vector='numpy:degrees', category='Trigonometry')(math.degrees)
+register('radians', vector='numpy:radians', category='Trigonometry')(math.radians)
+
+
+# Logarithms and exponentials
+register('exp', vector='numpy:exp', decimal='exp', category='Logarithms')(math.exp)
+register('ln', vector='numpy:log', decimal='ln', category='Logarithms')(math.log)
+register('log10', vector='numpy:log10', decimal='log10', category='Logarithms')(math.log10)
+register('log2', vector='numpy:log2', category='Logarithms')(math.log2)
+
+
+@register('log', args=(1, 2), vector=lambda np: lambda x, base=None: (
+    np.log10(x) if base is None else np.log(x) / np.log(base)), category='Logarithms')
+def log(x, base=None):
+    """Base-10 logarithm, or logarithm to the given base"""
+    return math.log10(x) if base is None else math.log(x, base)
+
+
+# Powers and roots
+register('sqrt', vector='numpy:sqrt', decimal='sqrt', category='Powers')(math.sqrt)
+
+
+# math.cbrt is new in Python 3.11
+_cbrt = getattr(math, 'cbrt', lambda x: x ** (1 / 3))
+
+
+@register('cbrt', vector='numpy:cbrt', category='Powers')
+def cbrt(x):
+    """Real cube root; exact for perfect cubes"""
+    # Both the power and some libm cube roots are a bit off for exact cubes:
+    # 27 ** (1/3) and glibc's cbrt(27) are 3.0000000000000004
+    root = _cbrt(abs(x))
+    if math.isfinite(root):
+        nearest = round(root)
+        if nearest ** 3 == abs(x):
+            root = float(nearest)
+    return math.copysign(root, x)
+
+
+register('pow', args=2, vector='numpy:power', decimal='power', category='Powers')(math.pow)
+register('hypot', args=2, vector='numpy:hypot', category='Powers')(math.hypot)
+register('abs', vector='numpy:abs', decimal='abs', category='Powers')(abs)
+
+
+# Factorials and combinatorics
+@register('fact', vector='scipy.special:factorial', category='Combinatorics')
+def fact(n):
+    """n! for whole numbers"""
+    n = _whole('fact', n)
+    limits.check_factorial(n)
+    return math.factorial(n)
+
+
+register('gamma', vector='scipy.special:gamma', category='Combinatorics')(math.gamma)
+register('lgamma', vector='scipy.special:gammaln', category='Combinatorics')(math.lgamma)
+
+
+@register('nCr', args=2, vector='scipy.special:comb', category='Combinatorics')
+def ncr(n, r):
+    """Combinations of r items from n"""
+    n, r = _whole('nCr', n), _whole('nCr', r)
+    if r <= n:
+        limits.check_factorial(n, r, n - r)
+    return math.comb(n, r)
+
+
+@register('nPr', args=2, vector='scipy.special:perm', category='Combinatorics')
+def npr(n, r):
+    """Ordered arrangements of r items from n"""
+    n, r = _whole('nPr', n), _whole('nPr', r)
+    if r <= n:
+        limits.check_factorial(n, n - r)
+    return math.perm(n, r)
+
+
+# Statistics over the arguments (row-wise across columns in batch evaluation)
+def _stacked(reduce):
+    return lambda np: lambda *columns: reduce(np, np.vstack(columns))
+
+
+@register('sum', args=(1, None), vector=_stacked(lambda np, rows: rows.sum(axis=0)),
+          category='Statistics')
+def total(*values):
+    """Sum of the arguments"""
+    result = 0
+    for value in values:
+        result = result + value
+    return result
+
+
+@register('mean', args=(1, None), vector=_stacked(lambda np, rows: rows.mean(axis=0)),
+          category='Statistics')
+def mean(*values):
+    """Arithmetic mean of the arguments"""
+    if all(type(value) is float for value in values):
+        # statistics.mean is exact but slow; floats only need a correctly rounded sum
+        return math.fsum(values) / len(values)
+    return statistics.mean(values)
+
+
+@register('median', args=(1, None), vector=_stacked(lambda np, rows: np.median(rows, axis=0)),
+          category='Statistics')
+def median(*values):
+    """Median of the arguments"""
+    return statistics.median(values)
+
+
+@register('stdev', args=(2, None), vector=_stacked(lambda np, rows: rows.std(axis=0, ddof=1)),
+          category='Statistics')
+def stdev(*values):
+    """Sample standard deviation of the arguments"""
+    return statistics.stdev(values)
+
+
+@register('pstdev', args=(1, None), vector=_stacked(lambda np, rows: rows.std(axis=0)),
+          category='Statistics')
+def pstdev(*values):
+    """Population standard deviation of the arguments"""
+    return statistics.pstdev(values)
+
+
+@register('min', args=(1, None), vector=_stacked(lambda np, rows: rows.min(axis=0)),
+          category='Statistics')
+def minimum(*values):
+    """Smallest argument"""
+    return min(values)
+
+
+@register('max', args=(1, None), vector=_stacked(lambda np, rows: rows.max(axis=0)),
+          category='Statistics')
+def maximum(*values):
+    """Largest argument"""
+    return max(values)
@@ -0,0 +1,446 @@
+"""Bounded calculation history with an indexed, memory-mapped archive on disk"""
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import deque, namedtuple
+
+
+class HistoryEntry(namedtuple('HistoryEntry', ['expression', 'operands', 'op', 'result', 'mode'],
+                              defaults=(None,))):
+    """One calculation, kept as typed fields rather than a formatted string
+
+    Expression evaluations set ``expression``; single-operand operations and
+    the legacy two-operand mode set ``op`` and ``operands`` instead. ``mode``
+    names the numeric backend (numeric.backend_spec) for calculations not
+    made in float; their operands and result are in display form.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if self.expression is not None:
+            return f"{self.expression} = {self.result}"
+        if self.op == '√':
+            return f"√({self.operands[0]}) = {self.result}"
+        if self.op == '**':
+            return f"({self.operands[0]})² = {self.result}"
+        if self.op == '1/x':
+            return f"1/({self.operands[0]}) = {self.result}"
+        left, right = self.operands
+        return f"{left} {self.op} {right} = {self.result}"
+
+
+# Operators tracked by the archive's operator index, in bit order
+OPERATORS = ('+', '−', '×', '÷', '%', '√', '²', '1/x')
+
+# ASCII spellings accepted when querying by operator
+OPERATOR_ALIASES = {'-': '−', '*': '×', '/': '÷', '**': '²', 'x²': '²'}
+
+# Index record: payload offset, payload length, numeric result, operator bitmask
+INDEX_RECORD = struct.Struct('<QIdH2x')
+# Result index entry: numeric result, record number
+RESULT_RECORD = struct.Struct('<dQ')
+COUNT = struct.Struct('<Q')
+POSTING = struct.Struct('<QQ')
+
+# Records past the secondary indexes that HistoryStore.close() tolerates before rebuilding them
+REINDEX_TAIL = 4096
+
+
+def operator_mask(entry):
+    """Bitmask of the OPERATORS that appear in an entry"""
+    if entry.expression is not None:
+        text = entry.expression.replace('-', '−').replace('*', '×').replace('/', '÷')
+        symbols = [symbol for symbol in OPERATORS[:5] if symbol in text]
+    else:
+        symbols = [OPERATOR_ALIASES.get(entry.op, entry.op)]
+    mask = 0
+    for symbol in symbols:
+        if symbol in OPERATORS:
+            mask |= 1 << OPERATORS.index(symbol)
+    return mask
+
+
+def numeric_result(result):
+    """Result as a float for indexing; NaN when it is not a number"""
+    try:
+        return float(result)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class HistoryFile:
+    """Append-only binary history archive with fixed-size records and secondary indexes
+
+    The archive is a set of files sharing one base path:
+
+    - ``path``: entry payloads (compact JSON, back to back)
+    - ``path.idx``: one fixed-size INDEX_RECORD per entry, so record n is at
+      a known offset and random access is O(1) through mmap
+    - ``path.ridx``: (result, record) pairs sorted by result, for equality and
+      range lookups by binary search
+    - ``path.oidx``: per-operator posting lists of record numbers
+
+    The secondary indexes cover the first ``indexed`` records and are rebuilt
+    by reindex(); records appended since then are scanned directly, so
+    lookups stay correct between rebuilds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._recover()
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        self._count = os.path.getsize(path + '.idx') // INDEX_RECORD.size
+        # Records known to be on disk; sync() only pays for the ones after these
+        self._synced = self._count
+        self._maps = {}
+
+    def _recover(self):
+        """Drop index records left incomplete by a crash mid-append
+
+        Payloads are written before their index records, so after a crash the
+        index can end in a partial record or in records whose payload never
+        reached the disk; everything before them is intact.
+        """
+        index_path = self.path + '.idx'
+        if not os.path.exists(index_path):
+            return
+        data_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        size = os.path.getsize(index_path)
+        count = size // INDEX_RECORD.size
+        with open(index_path, 'r+b') as f:
+            while count:
+                f.seek((count - 1) * INDEX_RECORD.size)
+                offset, length, _, _ = INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))
+                if offset + length <= data_size:
+                    break
+                count -= 1
+            if count * INDEX_RECORD.size != size:
+                f.truncate(count * INDEX_RECORD.size)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += self._count
+        if not 0 <= number < self._count:
+            raise IndexError("history record out of range")
+        offset, length, _, _ = INDEX_RECORD.unpack_from(self._map('.idx'), number * INDEX_RECORD.size)
+        payload = self._map('')[offset:offset + length]
+        # Records written before entries had a mode have four fields
+        expression, operands, op, result, *mode = json.loads(payload.decode('utf-8'))
+        return HistoryEntry(expression, tuple(operands), op, result, *mode)
+
+    def __iter__(self):
+        for number in range(self._count):
+            yield self[number]
+
+    def append(self, entry):
+        """Append an entry and its fixed-size index record"""
+        payload = json.dumps(list(entry), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        offset = self._data.tell()
+        self._data.write(payload)
+        self._index.write(INDEX_RECORD.pack(offset, len(payload), numeric_result(entry.result),
+                                            operator_mask(entry)))
+        self._count += 1
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def sync(self):
+        """Flush and force appended records to disk, payloads before index records"""
+        if self._synced == self._count:
+            return
+        self._data.flush()
+        os.fsync(self._data.fileno())
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._synced = self._count
+
+    def close(self):
+        self.flush()
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+        self._data.close()
+        self._index.close()
+
+    @property
+    def indexed(self):
+        """Number of records covered by the secondary indexes"""
+        ridx = self._map('.ridx')
+        return COUNT.unpack_from(ridx, 0)[0] if ridx else 0
+
+    def reindex(self):
+        """Rebuild the result and operator indexes over every record"""
+        idx = self._map('.idx')
+        results = []
+        postings = [array('Q') for _ in OPERATORS]
+        for number in range(self._count):
+            _, _, value, mask = INDEX_RECORD.unpack_from(idx, number * INDEX_RECORD.size)
+            if not math.isnan(value):
+                results.append((value, number))
+            for bit, numbers in enumerate(postings):
+                if mask & (1 << bit):
+                    numbers.append(number)
+        results.sort()
+
+        self._write_atomic('.ridx', [COUNT.pack(self._count)] +
+                           [RESULT_RECORD.pack(value, number) for value, number in results])
+        # Operator index header: per-operator (start, count) into the postings that follow
+        header, start = [], 0
+        for numbers in postings:
+            header.append(POSTING.pack(start, len(numbers)))
+            start += len(numbers)
+        self._write_atomic('.oidx', [COUNT.pack(self._count)] + header +
+                           [numbers.tobytes() for numbers in postings])
+
+    def find_results(self, low, high=None):
+        """Record numbers whose result lies in [low, high] (equality when high is None)"""
+        if high is None:
+            high = low
+        found = []
+        ridx = self._map('.ridx')
+        indexed = self.indexed
+        if ridx:
+            size = (len(ridx) - COUNT.size) // RESULT_RECORD.size
+
+            def value_at(i):
+                return RESULT_RECORD.unpack_from(ridx, COUNT.size + i * RESULT_RECORD.size)[0]
+
+            i = bisect_left(_KeyView(value_at, size), low)
+            while i < size:
+                value, number = RESULT_RECORD.unpack_from(ridx, COUNT.size + i * RESULT_RECORD.size)
+                if value > high:
+                    break
+                found.append(number)
+                i += 1
+            found.sort()
+        found.extend(self._scan_tail(indexed, lambda value, mask: low <= value <= high))
+        return found
+
+    def find_operator(self, symbol):
+        """Record numbers of entries that use an operator (display or ASCII symbol)"""
+        symbol = OPERATOR_ALIASES.get(symbol, symbol)
+        if symbol not in OPERATORS:
+            raise ValueError(f"Unknown operator: {symbol}")
+        bit = OPERATORS.index(symbol)
+        found = []
+        oidx = self._map('.oidx')
+        indexed = COUNT.unpack_from(oidx, 0)[0] if oidx else 0
+        if oidx:
+            base = COUNT.size + POSTING.size * len(OPERATORS)
+            start, count = POSTING.unpack_from(oidx, COUNT.size + bit * POSTING.size)
+            numbers = array('Q')
+            numbers.frombytes(oidx[base + start * 8:base + (start + count) * 8])
+            found.extend(numbers)
+        found.extend(self._scan_tail(indexed, lambda value, mask: mask & (1 << bit)))
+        return found
+
+    def replay(self, numbers=None, evaluate=None, env=None):
+        """Re-run entries through the evaluator, yielding (number, entry, replayed, matches)
+
+        Each entry is re-run in the numeric mode it was made in. env supplies
+        variables and functions, e.g. the calculator's definitions.values.
+        evaluate(text, env, backend) defaults to the shared expression cache.
+        replayed is the freshly formatted result, or the error message if the
+        entry no longer evaluates. Use it to catch evaluator regressions.
+        """
+        from expression import default_cache
+        from numeric import FLOAT, backend_from_spec, format_result
+
+        evaluate = evaluate or default_cache.evaluate
+        for number in (range(self._count) if numbers is None else numbers):
+            entry = self[number]
+            try:
+                backend = backend_from_spec(entry.mode)
+                if entry.expression is not None:
+                    value = evaluate(entry.expression, env, backend)
+                    replayed = format_result(value) if backend is FLOAT else backend.format(value)
+                elif entry.op in ('√', '**', '1/x'):
+                    if backend is FLOAT:
+                        replayed = backend.unary(entry.op, entry.operands[0])
+                    else:
+                        replayed = backend.format(backend.unary(entry.op, backend.parse(entry.operands[0])))
+                else:
+                    # Legacy two-operand entries have no expression to re-run
+                    continue
+            except (ValueError, TypeError, ArithmeticError) as e:
+                # TypeError: an entry from before modes were recorded, with exact operands
+                yield number, entry, str(e), False
+                continue
+            yield number, entry, replayed, str(replayed) == str(entry.result)
+
+    def _scan_tail(self, start, predicate):
+        idx = self._map('.idx')
+        found = []
+        for number in range(start, self._count):
+            _, _, value, mask = INDEX_RECORD.unpack_from(idx, number * INDEX_RECORD.size)
+            if predicate(value, mask):
+                found.append(number)
+        return found
+
+    def _map(self, suffix):
+        """Read-only mmap of one of the archive files, remapped when it has grown"""
+        if suffix in ('', '.idx'):
+            self.flush()
+        path = self.path + suffix
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        mapped = self._maps.get(suffix)
+        if mapped is not None and len(mapped) == size:
+            return mapped
+        if mapped is not None:
+            mapped.close()
+            del self._maps[suffix]
+        if not size:
+            return b''
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[suffix] = mapped
+        return mapped
+
+    def _write_atomic(self, suffix, chunks):
+        mapped = self._maps.pop(suffix, None)
+        if mapped is not None:
+            mapped.close()
+        temporary = self.path + suffix + '.tmp'
+        with open(temporary, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temporary, self.path + suffix)
+
+
+class _KeyView:
+    """Sequence view over sorted keys in an mmap, so bisect can search it in place"""
+
+    def __init__(self, key_at, size):
+        self.key_at = key_at
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        return self.key_at(i)
+
+
+class HistoryStore:
+    """Ring buffer of the most recent entries; older ones spill to an indexed archive
+
+    Without a spill path, entries beyond the capacity are dropped. With one,
+    they are appended to a HistoryFile and read back lazily when the history
+    is iterated, so memory stays flat however long the session.
+
+    With persist=True every entry is appended to the archive as it is
+    recorded and the buffer only caches the newest ones. The archive is then
+    a complete journal: sync() makes what was recorded since the last sync
+    durable, and a later HistoryStore on the same path continues it without
+    reading the earlier entries until they are asked for.
+    """
+
+    def __init__(self, capacity=1000, spill_path=None, persist=False):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        if persist and not spill_path:
+            raise ValueError("A persistent history needs a spill path")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.persist = persist
+        self._recent = deque()
+        self.archive = HistoryFile(spill_path) if spill_path else None
+
+    @property
+    def spilled(self):
+        """Number of entries held in the on-disk archive"""
+        return len(self.archive) if self.archive is not None else 0
+
+    def __len__(self):
+        if self.persist:
+            return self.spilled
+        return self.spilled + len(self._recent)
+
+    def __iter__(self):
+        """Iterate over the full history, oldest first"""
+        recent = list(self._recent)
+        if self.archive is not None:
+            # A persistent archive also holds the buffered entries; stop short of them
+            end = len(self.archive) - len(recent) if self.persist else len(self.archive)
+            for number in range(end):
+                yield self.archive[number]
+        yield from recent
+
+    def append(self, entry):
+        """Record an entry, spilling the oldest one if the buffer is full"""
+        self._recent.append(entry)
+        if self.persist:
+            self.archive.append(entry)
+        if len(self._recent) > self.capacity:
+            oldest = self._recent.popleft()
+            if self.archive is not None and not self.persist:
+                self.archive.append(oldest)
+
+    def sync(self):
+        """Make a persistent history's new entries durable; costs only what was appended"""
+        if self.persist:
+            self.archive.sync()
+
+    def recent(self, count=None):
+        """Return up to count of the newest in-memory entries, oldest first"""
+        entries = list(self._recent)
+        return entries if count is None else entries[-count:]
+
+    def search(self, low=None, high=None, op=None):
+        """Entries with a result in [low, high] and/or using an operator, oldest first
+
+        The archive is searched through its indexes; the in-memory buffer,
+        bounded by the capacity, is scanned directly.
+        """
+        archived = None
+        if self.archive is not None:
+            if low is not None:
+                archived = set(self.archive.find_results(low, high))
+            if op is not None:
+                by_op = set(self.archive.find_operator(op))
+                archived = by_op if archived is None else archived & by_op
+            if archived is None:
+                archived = range(len(self.archive))
+            for number in sorted(archived):
+                yield self.archive[number]
+            if self.persist:
+                # The archive already held the buffered entries
+                return
+
+        high = low if high is None else high
+        for entry in list(self._recent):
+            if low is not None and not low <= numeric_result(entry.result) <= high:
+                continue
+            if op is not None and not operator_mask(entry) & operator_mask(HistoryEntry(None, (), op, None)):
+                continue
+            yield entry
+
+    def clear(self):
+        """Forget all entries, including any spilled to disk"""
+        self._recent.clear()
+        if self.archive is not None:
+            self.archive.close()
+            for suffix in ('', '.idx', '.ridx', '.oidx'):
+                if os.path.exists(self.spill_path + suffix):
+                    os.remove(self.spill_path + suffix)
+            self.archive = HistoryFile(self.spill_path)
+
+    def close(self):
+        """Flush the archive, rebuilding its indexes if they have fallen behind"""
+        if self.archive is not None:
+            archive = self.archive
+            # Searches scan records past the indexes directly, so a short tail
+            # is cheaper than an O(n) rebuild on every exit
+            if archive.indexed > len(archive) or len(archive) - archive.indexed > REINDEX_TAIL:
+                archive.reindex()
+            archive.close()
+            self.archive = None
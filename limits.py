@@ -0,0 +1,209 @@
+"""Resource limits for evaluation: size, nesting, number growth and time
+
+Evaluation never runs arbitrary code, but some inputs are still too costly.
+Power towers such as 9**9**9 produce integers with hundreds of millions of
+digits, and deep nesting or huge pastes make the parser recurse or churn.
+The guards below reject these before the work starts, with an error that
+names the limit:
+
+    max_tokens    tokens in one expression
+    max_depth     nesting of parentheses, calls and signs
+    max_bits      bit length of an integer (or a fraction's numerator and
+                  denominator) that an operation may produce
+    max_magnitude absolute value of a float or Decimal result (None: any
+                  finite value)
+    time_budget   wall-clock seconds one calculation may take
+
+The time budget is cooperative. Calculator entry points run inside
+``budget()``, and the code paths that can take long (powers, library and
+user function calls, long operator chains) call ``check_time()``. Exact
+results of powers, factorials, products, sums and quotients are checked
+against max_bits, so no single step can outlast the budget by much. The
+same checks stop a calculation early when its budget's cancel event is
+set.
+
+    limits.configure(max_bits=4096, time_budget=0.5)
+"""
+import math
+import threading
+import time
+from fractions import Fraction
+
+
+class Limits:
+    """Evaluation limits; None disables a limit"""
+
+    __slots__ = ('max_tokens', 'max_depth', 'max_bits', 'max_magnitude', 'time_budget')
+
+    def __init__(self, max_tokens=10000, max_depth=100, max_bits=1000000, max_magnitude=None,
+                 time_budget=2.0):
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.max_bits = max_bits
+        self.max_magnitude = max_magnitude
+        self.time_budget = time_budget
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"Limits({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+# The limits in force; read at each check, so configure() applies immediately
+current = Limits()
+
+
+class _Deadline(threading.local):
+    # Class defaults keep lookups cheap on threads that never set a budget
+    deadline = None
+    seconds = None
+    cancel = None
+
+
+_local = _Deadline()
+_clock = time.monotonic
+
+
+def configure(limits=None, **changes):
+    """Replace the limits in force (with limits), or change individual ones"""
+    global current
+    if limits is None:
+        limits = Limits(**dict(current.as_dict(), **changes))
+    elif changes:
+        limits = Limits(**dict(limits.as_dict(), **changes))
+    current = limits
+    return current
+
+
+def _error(message):
+    # Imported lazily: expression.py imports this module at load time
+    from expression import LimitError
+    return LimitError(message)
+
+
+def _cancelled():
+    from expression import CalculationCancelled
+    return CalculationCancelled("Calculation cancelled")
+
+
+# Time budget
+class budget:
+    """Context manager running a calculation under the time budget
+
+    seconds defaults to the configured budget. cancel is a threading.Event;
+    setting it from another thread makes the calculation raise
+    CalculationCancelled at its next check. Nested budgets keep the outer
+    deadline and cancel event, so a calculation that evaluates other
+    expressions is timed as a whole.
+    """
+
+    __slots__ = ('seconds', 'cancel', 'owner')
+
+    def __init__(self, seconds=None, cancel=None):
+        self.seconds = seconds
+        self.cancel = cancel
+        self.owner = False
+
+    def __enter__(self):
+        state = _local
+        if state.deadline is None and state.cancel is None:
+            seconds = current.time_budget if self.seconds is None else self.seconds
+            if seconds is not None:
+                state.deadline = _clock() + seconds
+                state.seconds = seconds
+            state.cancel = self.cancel
+            self.owner = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            _local.deadline = _local.cancel = None
+            self.owner = False
+
+
+def check_time():
+    """Raise if the running calculation is past its deadline or has been cancelled"""
+    state = _local
+    if state.cancel is not None and state.cancel.is_set():
+        raise _cancelled()
+    deadline = state.deadline
+    if deadline is not None and _clock() > deadline:
+        raise _error(f"Calculation took longer than {state.seconds:g} seconds")
+
+
+# Number growth
+def check_bits(bits):
+    """Raise LimitError if an integer result of about this many bits is too large"""
+    limit = current.max_bits
+    if limit is not None and bits > limit:
+        raise _error(f"Result would exceed {limit} bits")
+
+
+def int_bits(value):
+    """Bit length of an int, or of a Fraction's larger part; 0 for float and Decimal"""
+    if type(value) is int:
+        return value.bit_length()
+    if type(value) is Fraction:
+        return max(value.numerator.bit_length(), value.denominator.bit_length())
+    return 0
+
+
+def check_power(base, exponent):
+    """Reject base ** exponent before computing it if the exact result would be too large"""
+    check_time()
+    if type(exponent) is not int and getattr(exponent, 'denominator', None) != 1:
+        # Float and Decimal powers overflow quickly on their own
+        return
+    if type(base) is int:
+        if exponent <= 0 or -1 <= base <= 1:
+            # A negative exponent gives a float
+            return
+        largest = abs(base)
+    elif type(base) is Fraction:
+        # Exact fractions grow just as fast under negative exponents
+        exponent = abs(exponent)
+        largest = max(abs(base.numerator), base.denominator)
+    else:
+        return
+    limit = current.max_bits
+    # bit_length() * exponent bounds the result from above; only near the limit
+    # is the exact size worth a logarithm
+    if limit is not None and largest.bit_length() * exponent > limit:
+        check_bits(int(math.log2(largest) * exponent))
+
+
+def check_product(product):
+    """Return an exact product, or raise LimitError if it has grown past the limit
+
+    Checking after each multiplication keeps every operand within the
+    limit, so one multiplication costs at most a few milliseconds.
+    """
+    limit = current.max_bits
+    if limit is not None and (product.bit_length() if type(product) is int
+                              else int_bits(product)) > limit:
+        check_bits(int_bits(product))
+    return product
+
+
+def check_factorial(n, *divisors):
+    """Reject n! divided by the factorials of divisors if the result would be too large"""
+    check_time()
+    if current.max_bits is None or n < 2:
+        return
+    log = math.lgamma(n + 1) - sum(math.lgamma(k + 1) for k in divisors)
+    check_bits(int(log / math.log(2)))
+
+
+def check_result(value):
+    """Raise LimitError if a finished result is larger than the limits allow"""
+    kind = type(value)
+    if kind is float and value - value != 0:
+        # inf or nan: float arithmetic overflowed without raising
+        raise _error("Result is not a number" if value != value else "Result is too large")
+    if kind is int or kind is Fraction:
+        check_bits(int_bits(value))
+        return
+    limit = current.max_magnitude
+    if limit is not None and abs(value) > limit:
+        raise _error(f"Result exceeds {limit:g}")
@@ -0,0 +1,365 @@
+"""Numeric backends for the evaluator: float, Decimal, exact Fraction and big int
+
+A backend turns number literals into values, supplies the arithmetic for each
+operator and formats results for the display. Values stay in the backend's own
+type from literal to result, so the Decimal, Fraction and int modes never
+round-trip through float.
+"""
+import decimal
+import math
+import operator
+from fractions import Fraction
+
+import limits
+
+
+# Largest decimal precision. A single libmpdec power, ln or exp cannot be
+# interrupted by the time budget and its cost grows with about the cube of
+# the precision: 2**0.5 takes ~30 ms at 1000 digits but ~9 s at 10000.
+MAX_PRECISION = 1000
+
+
+def format_result(result):
+    """Format a numeric result the way the display shows it"""
+    if result == int(result) and abs(result) < 1e10:
+        return int(result)
+    result = round(result, 10)
+    if abs(result) >= 1e10 or abs(result) <= 1e-10:
+        result = f"{result:.2e}"
+    return result
+
+
+def unary_operation(op, value):
+    """Apply a single-operand operation (√, ** for x², 1/x) in float arithmetic"""
+    if op == '√':
+        if value < 0:
+            raise ValueError("Cannot calculate square root of negative number!")
+        return math.sqrt(value)
+    elif op == '**':
+        return value ** 2
+    elif op == '1/x':
+        if value == 0:
+            raise ZeroDivisionError("Cannot divide by zero!")
+        return 1 / value
+    raise ValueError(f"Unknown operation: {op}")
+
+
+def _fraction(text):
+    """Fraction(text), refusing decimal exponents whose power of ten exceeds max_bits"""
+    mantissa, e, exponent = text.lower().partition('e')
+    if e:
+        try:
+            exponent = int(exponent)
+        except ValueError:
+            exponent = 0
+        # Fraction builds 10**exponent in full; each power of ten adds log2(10) bits
+        limits.check_bits(int(abs(exponent) * math.log2(10)))
+    return Fraction(text)
+
+
+def _error(message):
+    # Imported lazily: expression.py imports this module at load time
+    from expression import ExpressionError
+    return ExpressionError(message)
+
+
+class FloatBackend:
+    """The calculator's default: Python int/float arithmetic, float results"""
+
+    name = 'float'
+    key = 'float'
+
+    def literal(self, text):
+        if '.' in text or 'e' in text or 'E' in text:
+            return float(text)
+        return int(text)
+
+    def operations(self, power):
+        return {
+            '+': operator.add,
+            '-': operator.sub,
+            '*': operator.mul,
+            '/': operator.truediv,
+            '//': operator.floordiv,
+            '%': operator.mod,
+            '**': power,
+        }
+
+    def negate(self, value):
+        return -value
+
+    def finish(self, value):
+        return float(value)
+
+    def format(self, value):
+        return str(format_result(value))
+
+    def parse(self, text):
+        return float(text)
+
+    def coerce(self, value):
+        return float(value)
+
+    def unary(self, op, value):
+        return unary_operation(op, value)
+
+
+class DecimalBackend(FloatBackend):
+    """decimal.Decimal arithmetic under its own context (precision, rounding)"""
+
+    name = 'decimal'
+
+    def __init__(self, precision=28, rounding=decimal.ROUND_HALF_EVEN):
+        if not 1 <= precision <= MAX_PRECISION:
+            raise ValueError(f"Decimal precision must be between 1 and {MAX_PRECISION} digits")
+        self.context = decimal.Context(prec=precision, rounding=rounding)
+        self.precision = precision
+
+    @property
+    def key(self):
+        return ('decimal', self.precision, self.context.rounding)
+
+    def literal(self, text):
+        return self.context.create_decimal(text)
+
+    def operations(self, power):
+        context = self.context
+
+        def decimal_power(a, b):
+            return context.power(a, b)
+
+        # divide_int and remainder truncate toward zero; Python's // and %
+        # (and so the other modes) round the quotient toward negative infinity
+        def floor_divide(a, b):
+            quotient = context.divide_int(a, b)
+            remainder = context.remainder(a, b)
+            if remainder and remainder.is_signed() != b.is_signed():
+                quotient = context.subtract(quotient, 1)
+            return quotient
+
+        def modulo(a, b):
+            remainder = context.remainder(a, b)
+            if remainder and remainder.is_signed() != b.is_signed():
+                remainder = context.add(remainder, b)
+            return remainder
+        return {
+            '+': context.add,
+            '-': context.subtract,
+            '*': context.multiply,
+            '/': context.divide,
+            '//': floor_divide,
+            '%': modulo,
+            '**': decimal_power,
+        }
+
+    def negate(self, value):
+        return self.context.minus(value)
+
+    def finish(self, value):
+        return self.coerce(value)
+
+    def format(self, value):
+        if value == value.to_integral_value() and value.adjusted() < self.precision:
+            return f"{value:f}"
+        return str(value.normalize(self.context))
+
+    def parse(self, text):
+        return self.context.create_decimal(text)
+
+    def coerce(self, value):
+        if isinstance(value, decimal.Decimal):
+            return self.context.plus(value)
+        if isinstance(value, Fraction):
+            return self.context.divide(decimal.Decimal(value.numerator), decimal.Decimal(value.denominator))
+        return self.context.create_decimal(str(value) if isinstance(value, float) else value)
+
+    def unary(self, op, value):
+        if op == '√':
+            if value < 0:
+                raise ValueError("Cannot calculate square root of negative number!")
+            return self.context.sqrt(value)
+        elif op == '**':
+            return self.context.multiply(value, value)
+        elif op == '1/x':
+            if value == 0:
+                raise ZeroDivisionError("Cannot divide by zero!")
+            return self.context.divide(decimal.Decimal(1), value)
+        raise ValueError(f"Unknown operation: {op}")
+
+
+def _checked_multiply(a, b):
+    """Multiply exact values, refusing products beyond limits.current.max_bits"""
+    return limits.check_product(a * b)
+
+
+def _checked(operation):
+    """operation, refusing exact results beyond limits.current.max_bits"""
+    check_product = limits.check_product
+    return lambda a, b: check_product(operation(a, b))
+
+
+def _exact_sqrt(value):
+    """Square root of a non-negative int, or None if it is not a perfect square"""
+    root = math.isqrt(value)
+    return root if root * root == value else None
+
+
+def _scientific(numerator, denominator=1):
+    """numerator/denominator in scientific notation, for integers too long for str()"""
+    context = decimal.Context(prec=12, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    return f"{context.divide(decimal.Decimal(numerator), decimal.Decimal(denominator)):.10E}"
+
+
+class FractionBackend(FloatBackend):
+    """Exact rational arithmetic with fractions.Fraction"""
+
+    name = 'fraction'
+    key = 'fraction'
+
+    def literal(self, text):
+        return _fraction(text)
+
+    def operations(self, power):
+        def exact_power(a, b):
+            if b.denominator != 1:
+                raise _error("Exact mode supports only whole-number powers")
+            limits.check_power(a, b)
+            return a ** b.numerator
+        operations = super().operations(exact_power)
+        # Sums and quotients of fractions grow their denominators as products do
+        for symbol in ('+', '-', '/', '%'):
+            operations[symbol] = _checked(operations[symbol])
+        operations['*'] = _checked_multiply
+        return operations
+
+    def finish(self, value):
+        return Fraction(value)
+
+    def format(self, value):
+        try:
+            return str(value)
+        except ValueError:
+            # Numerator or denominator beyond Python's int-to-str digit limit
+            return _scientific(value.numerator, value.denominator)
+
+    def parse(self, text):
+        return _fraction(text)
+
+    def coerce(self, value):
+        return Fraction(str(value)) if isinstance(value, float) else Fraction(value)
+
+    def unary(self, op, value):
+        if op == '√':
+            if value < 0:
+                raise ValueError("Cannot calculate square root of negative number!")
+            numerator = _exact_sqrt(value.numerator)
+            denominator = _exact_sqrt(value.denominator)
+            if numerator is None or denominator is None:
+                raise ValueError("Square root is not an exact fraction")
+            return Fraction(numerator, denominator)
+        elif op == '**':
+            return _checked_multiply(value, value)
+        elif op == '1/x':
+            if value == 0:
+                raise ZeroDivisionError("Cannot divide by zero!")
+            return 1 / value
+        raise ValueError(f"Unknown operation: {op}")
+
+
+class IntegerBackend(FloatBackend):
+    """Arbitrary-size integer arithmetic; non-integer results are errors"""
+
+    name = 'int'
+    key = 'int'
+
+    def literal(self, text):
+        if not text.isdigit():
+            raise _error("Integer mode does not accept decimals")
+        return int(text)
+
+    def operations(self, power):
+        def int_power(a, b):
+            if b < 0:
+                raise _error("Result is not an integer")
+            limits.check_power(a, b)
+            return a ** b
+        return dict(super().operations(int_power), **{'*': _checked_multiply, '/': self._divide})
+
+    @staticmethod
+    def _divide(a, b):
+        quotient, remainder = divmod(a, b)
+        if remainder:
+            raise _error("Result is not an integer")
+        return quotient
+
+    def finish(self, value):
+        return int(value)
+
+    def format(self, value):
+        try:
+            return str(value)
+        except ValueError:
+            # Beyond Python's int-to-str digit limit: show it in scientific notation
+            return _scientific(value)
+
+    def parse(self, text):
+        return int(text)
+
+    def coerce(self, value):
+        if value != int(value):
+            raise ValueError("Value is not an integer")
+        return int(value)
+
+    def unary(self, op, value):
+        if op == '√':
+            if value < 0:
+                raise ValueError("Cannot calculate square root of negative number!")
+            root = _exact_sqrt(value)
+            if root is None:
+                raise ValueError("Square root is not an integer")
+            return root
+        elif op == '**':
+            return _checked_multiply(value, value)
+        elif op == '1/x':
+            if value == 0:
+                raise ZeroDivisionError("Cannot divide by zero!")
+            if value not in (1, -1):
+                raise ValueError("Result is not an integer")
+            return value
+        raise ValueError(f"Unknown operation: {op}")
+
+
+FLOAT = FloatBackend()
+
+
+def backend_spec(backend):
+    """Text naming a backend for storage, such as 'fraction' or 'decimal:50'; None for float"""
+    if backend is FLOAT:
+        return None
+    if backend.name == 'decimal':
+        return f"decimal:{backend.precision}"
+    return backend.name
+
+
+def backend_from_spec(spec):
+    """The backend named by backend_spec()"""
+    if spec is None:
+        return FLOAT
+    mode, _, precision = spec.partition(':')
+    return get_backend(mode, int(precision) if precision else None)
+
+
+MODES = ('float', 'decimal', 'fraction', 'int')
+
+
+def get_backend(mode='float', precision=None):
+    """Return the backend for a numeric mode; precision applies to decimal mode"""
+    if mode == 'float':
+        return FLOAT
+    if mode == 'decimal':
+        return DecimalBackend(precision or 28)
+    if mode == 'fraction':
+        return FractionBackend()
+    if mode == 'int':
+        return IntegerBackend()
+    raise ValueError(f"Unknown numeric mode: {mode}")
@@ -0,0 +1,102 @@
+"""Process-pool evaluation of large expression batches"""
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import count, islice
+
+import limits
+from expression import default_cache
+from limits import budget
+from numeric import FLOAT
+
+
+# error is None on success, otherwise the exception evaluation raised
+Evaluation = namedtuple('Evaluation', ['index', 'expression', 'value', 'error'])
+
+
+def evaluate_chunk(start, expressions, backend=FLOAT):
+    """Evaluate a chunk of expressions, returning errors as values"""
+    results = []
+    for index, expression in enumerate(expressions, start):
+        try:
+            with budget():
+                value = default_cache.evaluate(expression, backend=backend)
+        except (ValueError, ArithmeticError) as e:
+            results.append(Evaluation(index, expression, None, e))
+        else:
+            results.append(Evaluation(index, expression, value, None))
+    return results
+
+
+def _initialize_process(limit_values, rates_path):
+    # Spawned workers start from the defaults; give them the parent's settings
+    limits.configure(**limit_values)
+    if rates_path is not None:
+        import units
+        try:
+            units.load_rates(rates_path)
+        except (OSError, ValueError):
+            # As at import: a file gone since leaves the base currency alone
+            pass
+
+
+def process_pool(workers):
+    """ProcessPoolExecutor whose workers use this process's limits and currency rates"""
+    units = sys.modules.get('units')
+    rates_path = units.rates_path if units is not None else None
+    return ProcessPoolExecutor(max_workers=workers, initializer=_initialize_process,
+                               initargs=(limits.current.as_dict(), rates_path))
+
+
+def _chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    for start in count(0, chunksize):
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+
+
+def parallel_evaluate(iterable, workers=None, chunksize=1024, ordered=True, backend=FLOAT):
+    """Evaluate expressions across worker processes, yielding Evaluation results
+
+    Expressions are dispatched in chunks of chunksize, with at most two chunks
+    per worker in flight, so arbitrarily long iterables use constant memory.
+    With ordered=True results come back in input order; otherwise each chunk
+    is yielded as soon as it finishes and callers should use the index field.
+    workers defaults to the CPU count; workers=1 evaluates in this process.
+    backend selects the numeric mode (see numeric.py).
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(iterable, chunksize)
+
+    if workers == 1:
+        for start, chunk in chunks:
+            yield from evaluate_chunk(start, chunk, backend)
+        return
+
+    window = workers * 2
+    with process_pool(workers) as executor:
+        if ordered:
+            pending = deque()
+            for start, chunk in chunks:
+                pending.append(executor.submit(evaluate_chunk, start, chunk, backend))
+                if len(pending) >= window:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for start, chunk in chunks:
+                pending.add(executor.submit(evaluate_chunk, start, chunk, backend))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
@@ -0,0 +1,289 @@
+"""Incremental evaluation for the live result preview
+
+The evaluator keeps one immutable parse state per character of the input: a
+shunting-yard operand stack and operator stack (as shared linked tuples), the
+token being typed, and whether an operand is expected next. Appending a
+character derives one new state from the previous one, and backspace simply
+drops the last state, so typing costs O(1) amortized regardless of how long
+the expression is. Producing the preview only folds the operators still
+pending on the stack.
+
+The grammar and precedence match expression.py, so the preview always agrees
+with what ``=`` will produce, in whichever numeric backend is selected.
+"""
+from collections import namedtuple
+
+import limits
+from expression import SYMBOLS, ExpressionError, _multiply, _power
+from numeric import FLOAT
+
+
+# (symbol, precedence, right associative)
+BINARY = {
+    '+': ('+', 1, False),
+    '-': ('-', 1, False),
+    '*': ('*', 2, False),
+    '/': ('/', 2, False),
+    '//': ('//', 2, False),
+    '%': ('%', 2, False),
+    '**': ('**', 4, True),
+}
+NEGATE = ('neg', 3, True)
+POSITIVE = ('pos', 3, True)
+OPEN = ('(', 0, False)
+
+
+def _binary(op, a, b):
+    if op == '+':
+        return a + b
+    if op == '-':
+        return a - b
+    if op == '*':
+        return _multiply(a, b)
+    if op == '/':
+        return a / b
+    if op == '//':
+        return a // b
+    if op == '%':
+        return a % b
+    limits.check_power(a, b)
+    result = a ** b
+    if isinstance(result, complex):
+        raise ExpressionError("Result is not a real number")
+    return result
+
+
+# values and ops are linked stacks: None or (top, rest)
+State = namedtuple('State', ['values', 'ops', 'token', 'expect_operand', 'error'])
+
+INITIAL = State(None, None, '', True, None)
+
+
+def _apply(values, op, backend=FLOAT):
+    """Apply one operator to the top of the value stack"""
+    if op is NEGATE:
+        value, rest = values
+        return (backend.negate(value), rest)
+    if op is POSITIVE:
+        return values
+    b, (a, rest) = values
+    if backend is FLOAT:
+        return (_binary(op[0], a, b), rest)
+    return (backend.operations(_power(None))[op[0]](a, b), rest)
+
+
+def _reduce(state, precedence, right_assoc, backend):
+    """Pop and apply operators that bind at least as tightly as the incoming one"""
+    values, ops = state.values, state.ops
+    while ops is not None:
+        top = ops[0]
+        if top is OPEN or top[1] < precedence or (right_assoc and top[1] == precedence):
+            break
+        values = _apply(values, top, backend)
+        ops = ops[1]
+    return values, ops
+
+
+def _flush(state, env, backend):
+    """Turn the token being typed into a value on the stack"""
+    token = state.token
+    if not token:
+        return state
+    if token[0].isdigit() or token[0] == '.':
+        if token[-1] in 'eE+-':
+            raise ExpressionError("Incomplete number")
+        try:
+            if backend is FLOAT:
+                value = float(token) if any(c in token for c in '.eE') else int(token)
+            else:
+                value = backend.literal(token)
+        except (ValueError, ArithmeticError):
+            raise ExpressionError(f"Invalid number '{token}'")
+    else:
+        try:
+            value = env[token]
+        except (KeyError, TypeError):
+            raise ExpressionError(f"Unknown variable '{token}'")
+        if callable(value):
+            raise ExpressionError(f"'{token}' is a function")
+    return state._replace(values=(value, state.values), token='', expect_operand=False)
+
+
+def _continues_token(token, char):
+    if not token:
+        return False
+    if token[0].isdigit() or token[0] == '.':
+        if char.isdigit() or char == '.':
+            return True
+        if char in 'eE':
+            return 'e' not in token and 'E' not in token
+        return char in '+-' and token[-1] in 'eE'
+    return char.isalnum() or char == '_'
+
+
+def step(state, char, before=None, previous_char=None, env=None, backend=FLOAT):
+    """Derive the parse state after appending char
+
+    before is the state preceding the previous character and previous_char
+    that character; they let a second '*' or '/' upgrade the operator just
+    pushed to '**' or '//'.
+    """
+    if state.error is not None:
+        return state
+    try:
+        return _step(state, char, before, previous_char, env, backend)
+    except (ExpressionError, ArithmeticError) as e:
+        return state._replace(error=str(e))
+
+
+def _step(state, char, before, previous_char, env, backend):
+    if _continues_token(state.token, char):
+        return state._replace(token=state.token + char)
+    char = SYMBOLS.get(char, char)
+
+    # A doubled '*' or '/' replaces the binary operator pushed for the first one
+    if (char in '*/' and previous_char is not None and SYMBOLS.get(previous_char, previous_char) == char
+            and before is not None and before.error is None
+            and state.ops is not None and state.ops[0] is BINARY[char]):
+        return _push_binary(_flush(before, env, backend), BINARY[char * 2], backend)
+
+    state = _flush(state, env, backend)
+    if char.isspace():
+        return state
+    if char.isdigit() or char == '.' or char.isalpha() or char == '_':
+        if not state.expect_operand:
+            raise ExpressionError(f"Unexpected '{char}'")
+        return state._replace(token=char)
+    if char == '(':
+        if not state.expect_operand:
+            raise ExpressionError("Unexpected '('")
+        return state._replace(ops=(OPEN, state.ops))
+    if char == ')':
+        if state.expect_operand:
+            raise ExpressionError("Unexpected ')'")
+        values, ops = _reduce(state, 1, False, backend)
+        if ops is None:
+            raise ExpressionError("Unmatched parentheses")
+        return state._replace(values=values, ops=ops[1])
+    if char in BINARY:
+        if state.expect_operand:
+            if char == '-':
+                return state._replace(ops=(NEGATE, state.ops))
+            if char == '+':
+                return state._replace(ops=(POSITIVE, state.ops))
+            raise ExpressionError(f"Unexpected '{char}'")
+        return _push_binary(state, BINARY[char], backend)
+    raise ExpressionError(f"Invalid character '{char}'")
+
+
+def _push_binary(state, op, backend):
+    values, ops = _reduce(state, op[1], op[2], backend)
+    return State(values, (op, ops), '', True, None)
+
+
+def result(state, env=None, backend=FLOAT):
+    """Value of the expression so far, or None if it is empty or invalid
+
+    Unclosed parentheses are closed and a trailing operator is ignored, so
+    ``(2+3×`` previews as 5.
+    """
+    if state.error is not None:
+        return None
+    try:
+        state = _flush(state, env, backend)
+        values, ops = state.values, state.ops
+        expect_operand = state.expect_operand
+        # Drop a dangling operator (and any unary signs or '(' before its operand)
+        while expect_operand and ops is not None:
+            top, ops = ops
+            if top is not OPEN and top is not NEGATE and top is not POSITIVE:
+                expect_operand = False
+        if expect_operand or values is None:
+            return None
+        while ops is not None:
+            if ops[0] is not OPEN:
+                values = _apply(values, ops[0], backend)
+            ops = ops[1]
+        value = backend.finish(values[0])
+        limits.check_result(value)
+        return value
+    except (ExpressionError, ArithmeticError):
+        return None
+
+
+class IncrementalEvaluator:
+    """Keeps per-character parse states so edits at the end of the text are O(1)"""
+
+    def __init__(self, env=None, backend=FLOAT):
+        self.env = env
+        self.backend = backend
+        self.text = ""
+        self._states = [INITIAL]
+
+    def append(self, chars):
+        """Extend the text by chars
+
+        If the caller's time budget runs out, the LimitError propagates and
+        text ends at the last character stepped; the next sync resumes there.
+        """
+        states = self._states
+        start = len(self.text)
+        previous_char = self.text[-1] if self.text else None
+        try:
+            for i, char in enumerate(chars):
+                if states[-1].error is not None:
+                    # Every later state keeps the error; no need to step through them
+                    states.extend([states[-1]] * (len(chars) - i))
+                    break
+                limits.check_time()
+                before = states[-2] if len(states) > 1 else None
+                states.append(step(states[-1], char, before, previous_char, self.env, self.backend))
+                previous_char = char
+        finally:
+            self.text += chars[:len(states) - 1 - start]
+
+    def backspace(self, count=1):
+        """Drop the last count characters"""
+        count = min(count, len(self.text))
+        if count:
+            del self._states[-count:]
+            self.text = self.text[:-count]
+
+    def sync(self, text):
+        """Bring the evaluator in line with text, reusing the longest common prefix"""
+        current = self.text
+        if text == current:
+            return
+        if text.startswith(current):
+            self.append(text[len(current):])
+            return
+        if current.startswith(text):
+            self.backspace(len(current) - len(text))
+            return
+        common = 0
+        for a, b in zip(current, text):
+            if a != b:
+                break
+            common += 1
+        self.backspace(len(current) - common)
+        self.append(text[common:])
+
+    def result(self):
+        """Current preview value, or None if the text is empty or invalid"""
+        return result(self._states[-1], self.env, self.backend)
+
+    def complete(self):
+        """True unless the text ends in an operator or leaves a parenthesis open
+
+        result() fills those gaps in for the preview; a caller that needs the
+        value ``=`` would give checks this first.
+        """
+        state = self._states[-1]
+        if state.error is not None or (state.expect_operand and not state.token):
+            return False
+        ops = state.ops
+        while ops is not None:
+            if ops[0] is OPEN:
+                return False
+            ops = ops[1]
+        return True
@@ -0,0 +1,289 @@
+"""Opt-in timers and counters for the calculator's hot paths
+
+Nothing here runs until a Profiler is enabled: instrumentation works by
+replacing methods on the instances being watched with timed wrappers, and
+disabling removes the wrappers again, so the uninstrumented code paths carry
+no checks or extra calls at all.
+
+    profiler = Profiler()
+    profiler.enable(engine=engine)
+    ...
+    profiler.export('profile.json')   # or .csv
+"""
+import cProfile
+import csv
+import functools
+import io
+import json
+import math
+import pstats
+import time
+
+
+# Histogram bucket upper bounds in microseconds (powers of two); the last bucket is unbounded
+BUCKETS = tuple(2 ** i for i in range(18))
+
+# Methods timed on each instrumented object, as (attribute, timer name)
+ENGINE_METHODS = (
+    ('handle_input', 'engine.handle_input'),
+    ('calculate', 'engine.calculate'),
+    ('calculate_operation', 'engine.calculate_operation'),
+    ('evaluate_expression', 'engine.evaluate_expression'),
+    ('format_value', 'engine.format_value'),
+    ('preview', 'engine.preview'),
+    # Typed and pasted text reaches the engine through these, not handle_input
+    ('feed', 'engine.feed'),
+    ('paste', 'engine.paste'),
+)
+CACHE_METHODS = (
+    ('compile', 'expression.compile'),
+)
+VIEW_METHODS = (
+    ('sync_display', 'view.sync_display'),
+)
+# Methods counted rather than timed, as (attribute, counter name)
+ENGINE_COUNTERS = (
+    ('_set_error', 'engine.errors'),
+)
+
+
+class Timer:
+    """Call count, total/min/max duration and a log2 latency histogram"""
+
+    __slots__ = ('name', 'count', 'total', 'minimum', 'maximum', 'buckets')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        # Smallest i with 2**i >= the duration in microseconds, capped at the overflow bucket
+        index = max(math.ceil(seconds * 1e6) - 1, 0).bit_length()
+        self.buckets[min(index, len(BUCKETS))] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Upper bound of the histogram bucket holding the p-th percentile, in microseconds"""
+        if not self.count:
+            return 0.0
+        target = p * self.count
+        seen = 0
+        for i, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= target:
+                return float(BUCKETS[i]) if i < len(BUCKETS) else self.maximum * 1e6
+        return self.maximum * 1e6
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1e3,
+            'mean_us': self.mean * 1e6,
+            'min_us': (self.minimum or 0.0) * 1e6,
+            'max_us': self.maximum * 1e6,
+            'p50_us': self.percentile(0.50),
+            'p99_us': self.percentile(0.99),
+            'buckets': dict(zip([f"<={bound}us" for bound in BUCKETS] + [f">{BUCKETS[-1]}us"],
+                                self.buckets)),
+        }
+
+
+class Profiler:
+    """Timers around engine, expression cache and view methods, plus cProfile capture"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.timers = {}
+        self.counters = {}
+        self.enabled = False
+        self._patched = []
+        self._profile = None
+        # Profiles of jobs run on other threads during the capture
+        self._thread_profiles = []
+        self._cache = None
+
+    def enable(self, engine=None, view=None):
+        """Start timing the given engine (and its expression cache) and view"""
+        if self.enabled:
+            return
+        self.enabled = True
+        if engine is not None:
+            self.instrument(engine, ENGINE_METHODS)
+            self.instrument(engine, ENGINE_COUNTERS, self._counted)
+            self._cache = engine.expression_cache
+            self.instrument(engine.expression_cache, CACHE_METHODS)
+        if view is not None:
+            self.instrument(view, VIEW_METHODS)
+            if hasattr(view, 'display_var'):
+                self.instrument(view.display_var, (('set', 'display.set'),))
+
+    def disable(self):
+        """Remove every wrapper, restoring the original methods"""
+        for obj, attribute in reversed(self._patched):
+            try:
+                delattr(obj, attribute)
+            except AttributeError:
+                pass
+        self._patched.clear()
+        self.enabled = False
+
+    def instrument(self, obj, methods, wrap=None):
+        """Shadow obj's methods with timed (or other) wrappers stored on the instance"""
+        wrap = wrap or self._wrap
+        for attribute, name in methods:
+            method = getattr(obj, attribute, None)
+            if method is None or attribute in vars(obj):
+                continue
+            setattr(obj, attribute, wrap(method, name))
+            self._patched.append((obj, attribute))
+
+    def _wrap(self, method, name):
+        """Time each call; calls that raise are also counted as name.errors, and
+        calls returning "" (an empty preview) as name.blank"""
+        clock = self.clock
+        timer = self.timer(name)
+        count = self.count
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                count(f"{name}.errors")
+                raise
+            finally:
+                timer.add(clock() - start)
+            if isinstance(result, str) and not result:
+                count(f"{name}.blank")
+            return result
+        return timed
+
+    def _counted(self, method, name):
+        count = self.count
+
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            count(name)
+            return method(*args, **kwargs)
+        return counted
+
+    def timer(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer(name)
+        return timer
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        for name in list(self.timers):
+            self.timers[name] = Timer(name)
+        self.counters.clear()
+
+    def stats(self):
+        """Timer summaries and counters, including the expression cache's hit/miss counts"""
+        counters = dict(self.counters)
+        if self._cache is not None:
+            for key, value in self._cache.stats().items():
+                counters[f"expression.cache.{key}"] = value
+        return {
+            'timers': {name: timer.as_dict() for name, timer in sorted(self.timers.items())},
+            'counters': counters,
+        }
+
+    def export(self, path):
+        """Write stats to path as CSV if it ends in .csv, otherwise JSON"""
+        stats = self.stats()
+        if path.lower().endswith('.csv'):
+            columns = ['count', 'total_ms', 'mean_us', 'min_us', 'max_us', 'p50_us', 'p99_us']
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                bucket_names = [f"<={bound}us" for bound in BUCKETS] + [f">{BUCKETS[-1]}us"]
+                writer.writerow(['name'] + columns + bucket_names)
+                for name, timer in stats['timers'].items():
+                    writer.writerow([name] + [timer[column] for column in columns] +
+                                    [timer['buckets'][bucket] for bucket in bucket_names])
+                for name, value in stats['counters'].items():
+                    writer.writerow([name, value])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, indent=2)
+
+    # cProfile capture
+    @property
+    def capturing(self):
+        return self._profile is not None
+
+    def start_capture(self):
+        if self._profile is None:
+            self._thread_profiles = []
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def profiled(self, action):
+        """action wrapped to be profiled into the running capture from whichever thread calls it
+
+        Before Python 3.12, cProfile sees only the thread that enabled it; from
+        3.12 one profiler covers every thread and a second cannot be enabled.
+        """
+        profiles = self._thread_profiles
+
+        def run():
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # The capture's own profiler already sees this thread
+                return action()
+            try:
+                return action()
+            finally:
+                profile.disable()
+                profiles.append(profile)
+        return run
+
+    def stop_capture(self, path=None, limit=25):
+        """Stop cProfile, optionally dump raw stats to path; returns the top functions as text"""
+        if self._profile is None:
+            return ""
+        profile, self._profile = self._profile, None
+        profile.disable()
+        report = io.StringIO()
+        stats = pstats.Stats(profile, *self._thread_profiles, stream=report)
+        if path:
+            stats.dump_stats(path)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return report.getvalue()
+
+    def toggle_capture(self, path=None):
+        """Start capturing, or stop and return the report"""
+        if self.capturing:
+            return self.stop_capture(path)
+        self.start_capture()
+        return None
+
+
+def histogram_lines(timer, width=30):
+    """Text rendering of a timer's non-empty histogram buckets"""
+    peak = max(timer.buckets) or 1
+    lines = []
+    bounds = [f"<={bound}us" for bound in BUCKETS] + [f">{BUCKETS[-1]}us"]
+    for label, hits in zip(bounds, timer.buckets):
+        if hits:
+            lines.append(f"  {label:>10} {'#' * max(1, hits * width // peak):<{width}} {hits}")
+    return lines
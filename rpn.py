@@ -0,0 +1,98 @@
+"""Operand stack for RPN (stack) mode
+
+    3 Enter 4 +            7
+    2 Enter 3 Enter 4 × +  14
+
+Numbers are pushed as they are entered and each operator pops its operands
+and pushes the result, in the backend's own number type. Nothing is kept as
+text, so a chain of operations costs O(1) per key however long it gets.
+"""
+import limits
+from expression import SYMBOLS, ExpressionError, _power
+from numeric import FLOAT
+
+
+# Display operators the stack applies (the same keys as expression mode)
+OPERATORS = ('+', '−', '×', '÷', '%')
+
+
+class RPNStack:
+    """Values in one numeric backend; operations leave the stack unchanged when they fail"""
+
+    def __init__(self, backend=FLOAT):
+        self.values = []
+        self.backend = backend
+        self._operations = backend.operations(_power(None))
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def top(self):
+        """The newest value (x), or None when the stack is empty"""
+        return self.values[-1] if self.values else None
+
+    def set_backend(self, backend):
+        """Convert every value for another backend; values it cannot represent become 0"""
+        values = []
+        for value in self.values:
+            try:
+                values.append(backend.coerce(value))
+            except (ValueError, ArithmeticError):
+                values.append(backend.coerce(0))
+        self.values = values
+        self.backend = backend
+        self._operations = backend.operations(_power(None))
+
+    def push(self, value):
+        self.values.append(value)
+
+    def apply(self, symbol):
+        """Replace the top two values a, b with 'a symbol b'; returns (a, b, result)"""
+        if len(self.values) < 2:
+            raise ExpressionError(f"{symbol} needs two numbers on the stack")
+        a, b = self.values[-2], self.values[-1]
+        if b == 0 and symbol == '÷':
+            raise ZeroDivisionError("Cannot divide by zero!")
+        if b == 0 and symbol == '%':
+            raise ZeroDivisionError("Cannot find modulo with zero!")
+        result = self.backend.finish(self._operations[SYMBOLS.get(symbol, symbol)](a, b))
+        limits.check_result(result)
+        del self.values[-1]
+        self.values[-1] = result
+        return a, b, result
+
+    def unary(self, op):
+        """Apply a single-operand operation (√, ** for x², 1/x) to the top value; returns (x, result)"""
+        if not self.values:
+            raise ExpressionError("The stack is empty")
+        value = self.values[-1]
+        result = self.backend.unary(op, value)
+        limits.check_result(result)
+        self.values[-1] = result
+        return value, result
+
+    def negate(self):
+        if not self.values:
+            raise ExpressionError("The stack is empty")
+        self.values[-1] = self.backend.negate(self.values[-1])
+
+    def swap(self):
+        """Exchange the top two values (x and y)"""
+        if len(self.values) < 2:
+            raise ExpressionError("Swap needs two numbers on the stack")
+        self.values[-1], self.values[-2] = self.values[-2], self.values[-1]
+
+    def duplicate(self):
+        if not self.values:
+            raise ExpressionError("The stack is empty")
+        self.values.append(self.values[-1])
+
+    def drop(self):
+        """Remove and return the top value"""
+        if not self.values:
+            raise ExpressionError("The stack is empty")
+        return self.values.pop()
+
+    def clear(self):
+        self.values.clear()
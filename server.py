@@ -0,0 +1,294 @@
+"""Asyncio evaluation service speaking line-delimited JSON over a local socket
+
+Each request is one JSON object per line, ``{"id": 1, "expr": "2+3×4"}``,
+and each response echoes the id: ``{"id": 1, "result": "14", "value": 14.0}``
+or ``{"id": 1, "error": "Cannot divide by zero!"}``. A result with a unit
+also has its label: ``{"id": 2, "result": "8640", "value": 8640.0, "unit":
+"GB/day"}`` for ``100[MB/s] to [GB/day]``. Clients may pipeline
+any number of requests; responses on a connection come back in request order.
+
+Requests from all connections go through one bounded queue. A batcher drains
+whatever is waiting into a single evaluation pass that runs in an executor,
+so long expressions never block the event loop, and a full queue pushes back
+on readers, which in turn stops reading from their sockets.
+
+Run ``python server.py serve`` to start the service and ``python server.py
+bench`` to measure throughput and latency against it.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import limits
+from expression import default_cache
+from numeric import format_result
+from parallel import evaluate_chunk, process_pool
+
+
+DEFAULT_PORT = 8765
+
+# Request line bytes allowed per token of limits.current.max_tokens, with
+# asyncio's default 64 KiB as the floor and UNLIMITED_LINE without a limit
+LINE_BYTES_PER_TOKEN = 16
+UNLIMITED_LINE = 2 ** 26
+
+
+def line_limit():
+    """Longest request line the service reads, in bytes"""
+    max_tokens = limits.current.max_tokens
+    if max_tokens is None:
+        return UNLIMITED_LINE
+    return max(2 ** 16, max_tokens * LINE_BYTES_PER_TOKEN)
+
+
+class EvaluationServer:
+    """Batches concurrent requests into evaluation passes on an executor"""
+
+    def __init__(self, workers=1, max_batch=256, queue_size=4096, use_processes=True):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.queue_size = queue_size
+        self.use_processes = use_processes
+        self.queue = None
+        self.executor = None
+        self.server = None
+        self._batcher = None
+        self._slots = None
+        self.limit = None
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        """Listen on a Unix socket if path is given, otherwise on localhost TCP"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        if self.use_processes:
+            self.executor = process_pool(self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._batcher = asyncio.ensure_future(self._batch_loop())
+        self.limit = line_limit()
+        if path:
+            self.server = await asyncio.start_unix_server(self._handle_client, path=path, limit=self.limit)
+        else:
+            self.server = await asyncio.start_server(self._handle_client, host, port, limit=self.limit)
+        return self.server
+
+    async def close(self):
+        """Stop accepting connections and shut down the executor"""
+        self.server.close()
+        await self.server.wait_closed()
+        self._batcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # One batch per worker at a time; further requests keep queueing
+            await self._slots.acquire()
+            expressions = [expression for expression, _ in batch]
+            future = loop.run_in_executor(self.executor, evaluate_chunk, 0, expressions)
+            future.add_done_callback(lambda done, batch=batch: self._resolve(batch, done))
+
+    def _resolve(self, batch, done):
+        self._slots.release()
+        error = done.exception()
+        results = None if error else done.result()
+        for i, (_, waiter) in enumerate(batch):
+            if waiter.done():
+                continue
+            if error:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(results[i])
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        ready = asyncio.Event()
+        finished = False
+
+        async def write_responses():
+            while pending or not finished:
+                if not pending:
+                    ready.clear()
+                    await ready.wait()
+                    continue
+                request_id, waiter = pending.popleft()
+                try:
+                    outcome = await waiter
+                except Exception as e:
+                    outcome = e
+                writer.write(self._response(request_id, outcome))
+                await writer.drain()
+
+        responder = asyncio.ensure_future(write_responses())
+        try:
+            async for line in self._lines(reader):
+                if line is None:
+                    request_id, expression, error = None, None, ValueError(
+                        f"Request is longer than {self.limit} bytes")
+                else:
+                    request_id, expression, error = self._parse_request(line)
+                waiter = loop.create_future()
+                if error is not None:
+                    waiter.set_result(error)
+                else:
+                    await self.queue.put((expression, waiter))
+                pending.append((request_id, waiter))
+                ready.set()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            finished = True
+            ready.set()
+            try:
+                await responder
+            except ConnectionError:
+                pass
+            writer.close()
+
+    @staticmethod
+    async def _lines(reader):
+        """Request lines from reader; a line over the reader's limit is skipped and yields None"""
+        skipping = False
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # The connection closed; a last line may lack its newline
+                if skipping:
+                    yield None
+                elif e.partial:
+                    yield e.partial
+                return
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+                skipping = True
+                continue
+            yield None if skipping else line
+            skipping = False
+
+    @staticmethod
+    def _parse_request(line):
+        try:
+            request = json.loads(line)
+            return request.get('id'), str(request['expr']), None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None, None, ValueError("Malformed request")
+
+    @staticmethod
+    def _response(request_id, outcome):
+        if isinstance(outcome, Exception):
+            body = {'id': request_id, 'error': str(outcome)}
+        elif outcome.error is not None:
+            body = {'id': request_id, 'error': str(outcome.error)}
+        else:
+            body = {'id': request_id, 'result': str(format_result(outcome.value)), 'value': outcome.value}
+            if '[' in outcome.expression:
+                # Workers return bare numbers; the unit comes from compiling here, once per text
+                unit = default_cache.compile(outcome.expression).unit
+                if unit is not None:
+                    body['unit'] = unit
+        return (json.dumps(body, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT, path=None, **options):
+    """Run the evaluation service until cancelled"""
+    service = EvaluationServer(**options)
+    server = await service.start(host, port, path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+async def _open(host, port, path):
+    if path:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def load_test(host='127.0.0.1', port=DEFAULT_PORT, path=None, requests=10000,
+                    connections=8, window=64, expression='2+3×4'):
+    """Drive the service with pipelined requests and report throughput and latency"""
+    per_connection = requests // connections
+    latencies = []
+
+    async def client():
+        reader, writer = await _open(host, port, path)
+        sent_at = {}
+        in_flight = asyncio.Semaphore(window)
+
+        async def send():
+            for request_id in range(per_connection):
+                await in_flight.acquire()
+                sent_at[request_id] = time.perf_counter()
+                writer.write(json.dumps({'id': request_id, 'expr': expression}).encode('utf-8') + b'\n')
+                await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        for _ in range(per_connection):
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent_at.pop(response['id']))
+            in_flight.release()
+        await sender
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator evaluation service")
+    parser.add_argument('command', choices=['serve', 'bench'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help="use a Unix socket instead of TCP")
+    parser.add_argument('--workers', type=int, default=1, help="evaluation worker processes")
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--requests', type=int, default=10000, help="bench: total requests")
+    parser.add_argument('--connections', type=int, default=8, help="bench: concurrent connections")
+    parser.add_argument('--window', type=int, default=64, help="bench: pipelined requests per connection")
+    parser.add_argument('--expr', default='2+3×4', help="bench: expression to send")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, args.unix,
+                              workers=args.workers, max_batch=args.max_batch))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    stats = asyncio.run(load_test(args.host, args.port, args.unix, args.requests,
+                                  args.connections, args.window, args.expr))
+    print(f"{stats['requests']} requests in {stats['seconds']:.2f}s "
+          f"({stats['throughput']:.0f} req/s), p50 {stats['p50_ms']:.2f} ms, "
+          f"p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Save the calculator's state between runs
+
+A session directory holds two files:
+
+    state.json  display, pending expression, operation and mode flags, the
+                numeric mode, the memory registers, the RPN stack and ans;
+                small, and rewritten atomically
+    history     the calculation history as a persistent HistoryFile journal
+
+snapshot() is cheap enough to call every few seconds. It rewrites
+state.json only when the state differs from the last snapshot, and the
+history journal already has each calculation appended as it happens, so
+syncing it writes only the entries added since the previous snapshot. The
+cost therefore does not grow with the history. restore() reads state.json
+alone; earlier history entries stay on disk until they are iterated or
+searched.
+
+    session = Session(SESSION_DIR)
+    engine = CalculatorEngine(history=session.history())
+    session.restore(engine)
+    ...
+    session.snapshot(engine)     # periodically, and when the window closes
+"""
+import json
+import os
+from decimal import Decimal
+from fractions import Fraction
+
+from history import HistoryStore
+
+
+# Engine attributes saved as they are
+FIELDS = ('display', 'num1', 'operation', 'reset_display', 'expression_mode', 'expression',
+          'parentheses_count', 'register', 'rpn_mode', 'entering')
+
+# Bumped when the layout of state.json changes; older files are ignored
+STATE_VERSION = 2
+
+
+def encode_value(value):
+    """A numeric value as a JSON list tagged with its type, so exact values come back exact"""
+    if type(value) is int:
+        # Hex has no digit limit on conversion and is shorter than decimal
+        return ['int', hex(value)]
+    if isinstance(value, Fraction):
+        return ['fraction', hex(value.numerator), hex(value.denominator)]
+    if isinstance(value, Decimal):
+        return ['decimal', str(value)]
+    return ['float', repr(float(value))]
+
+
+def decode_value(data):
+    """Inverse of encode_value"""
+    kind = data[0]
+    if kind == 'int':
+        return int(data[1], 16)
+    if kind == 'fraction':
+        return Fraction(int(data[1], 16), int(data[2], 16))
+    if kind == 'decimal':
+        return Decimal(data[1])
+    if kind == 'float':
+        return float(data[1])
+    raise ValueError(f"Unknown value type '{kind}'")
+
+
+class Session:
+    """Snapshots of one calculator's state in a directory, restored on the next start"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.state_path = os.path.join(directory, 'state.json')
+        self.history_path = os.path.join(directory, 'history')
+        # The state as last written or read, to skip snapshots that change nothing
+        self._saved = None
+        self._history = None
+
+    def history(self, capacity=1000):
+        """The history store to give the engine; it continues the journal from earlier runs"""
+        if self._history is None:
+            self._history = HistoryStore(capacity, spill_path=self.history_path, persist=True)
+        return self._history
+
+    def capture(self, engine):
+        """The engine's state as a JSON-ready dict"""
+        state = {name: getattr(engine, name) for name in FIELDS}
+        state['version'] = STATE_VERSION
+        state['mode'] = engine.backend.name
+        state['precision'] = getattr(engine.backend, 'precision', None)
+        state['registers'] = [encode_value(value) for value in engine.registers]
+        state['stack'] = [encode_value(value) for value in engine.stack.values]
+        state['ans'] = encode_value(engine.definitions.values.get('ans', 0))
+        return state
+
+    def snapshot(self, engine):
+        """Write what changed since the last snapshot; returns True if state.json was rewritten"""
+        if self._history is not None:
+            self._history.sync()
+        state = self.capture(engine)
+        if state == self._saved:
+            return False
+        temporary = self.state_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.state_path)
+        self._saved = state
+        return True
+
+    def restore(self, engine):
+        """Load the last snapshot into engine; returns False if there is none or it is unreadable"""
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') != STATE_VERSION:
+                return False
+            fields = {name: state[name] for name in FIELDS}
+            registers = [decode_value(value) for value in state['registers']]
+            stack = [decode_value(value) for value in state['stack']]
+            ans = decode_value(state['ans'])
+            if len(registers) != len(engine.registers):
+                return False
+            if state['mode'] != engine.backend.name or state['precision'] is not None:
+                engine.set_numeric_mode(state['mode'], state['precision'])
+        except FileNotFoundError:
+            return False
+        except (OSError, KeyError, IndexError, TypeError, ValueError, ArithmeticError):
+            # A damaged snapshot only costs the previous state, not the start-up
+            return False
+        for name, value in fields.items():
+            setattr(engine, name, value)
+        backend = engine.backend
+        for index, value in enumerate(registers):
+            engine.set_register(index, backend.coerce(value))
+        engine.stack.values = [backend.coerce(value) for value in stack]
+        engine.definitions.assign('ans', backend.coerce(ans))
+        self._saved = state
+        return True
+
+    def close(self):
+        """Sync and close the history journal"""
+        if self._history is not None:
+            self._history.sync()
+            self._history.close()
+            self._history = None
@@ -0,0 +1,61 @@
+"""Streaming mode: evaluate expressions line by line from stdin or a file
+
+Each non-blank input line is evaluated with the same rules as the GUI and
+written out as ``expr = result``, the format used by calculation_history.
+Lines are processed through generators in fixed-size chunks, so memory use
+does not depend on the size of the input.
+"""
+import sys
+from itertools import groupby
+
+from expression import default_cache
+from numeric import FLOAT, get_backend
+from parallel import parallel_evaluate
+
+
+CHUNK_SIZE = 1024
+
+
+def read_expressions(lines):
+    """Yield stripped, non-blank expression lines"""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def format_evaluation(item, backend=FLOAT):
+    """Render an Evaluation as an 'expr = result' line"""
+    if item.error is not None:
+        return f"{item.expression} = Error\n"
+    if '[' in item.expression:
+        # The result's unit is found by compiling; only lines with units pay for it
+        unit = default_cache.compile(item.expression, backend).unit
+        if unit is not None:
+            return f"{item.expression} = {backend.format(item.value)}[{unit}]\n"
+    return f"{item.expression} = {backend.format(item.value)}\n"
+
+
+def run(source=None, jobs=1, out=None, err=None, mode='float', precision=None):
+    """Evaluate every line of source (a path, or stdin when None); returns the error count"""
+    out = out or sys.stdout
+    err = err or sys.stderr
+    backend = get_backend(mode, precision)
+    errors = 0
+    handle = sys.stdin if source in (None, '-') else open(source, encoding='utf-8')
+    try:
+        results = parallel_evaluate(read_expressions(handle), workers=jobs, chunksize=CHUNK_SIZE,
+                                    backend=backend)
+        # Write one buffered block per chunk rather than one call per line
+        for _, block in groupby(results, key=lambda item: item.index // CHUNK_SIZE):
+            block = list(block)
+            out.write(''.join(format_evaluation(item, backend) for item in block))
+            for item in block:
+                if item.error is not None:
+                    errors += 1
+                    err.write(f"expression {item.index + 1}: {item.error}\n")
+        out.flush()
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+    return errors
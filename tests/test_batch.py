@@ -0,0 +1,55 @@
+"""Vectorized batch evaluation"""
+import pytest
+
+from batch import apply_operation, evaluate_batch, format_batch
+from expression import ExpressionError, evaluate
+
+
+def _rows(values, errors):
+    return [None if failed else float(value) for value, failed in zip(values, errors)]
+
+
+def test_rows_match_the_interactive_evaluator():
+    xs = [1, 0, 2, -1, 0.5]
+    ys = [1, 2, 3, 4, -2]
+    expected = []
+    for x, y in zip(xs, ys):
+        try:
+            expected.append(evaluate('1/x + y**2 - x%3', {'x': x, 'y': y}))
+        except (ValueError, ArithmeticError):
+            expected.append(None)
+    values, errors = evaluate_batch('1/x + y**2 - x%3', {'x': xs, 'y': ys})
+    assert _rows(values, errors) == expected
+
+
+def test_rows_that_would_raise_are_masked():
+    values, errors = evaluate_batch('sqrt(x)', {'x': [4, -1]})
+    assert _rows(values, errors) == [2.0, None]
+
+
+def test_constant_expression_needs_a_size():
+    values, errors = evaluate_batch('2+3', size=3)
+    assert _rows(values, errors) == [5.0, 5.0, 5.0]
+    with pytest.raises(ValueError):
+        evaluate_batch('2+3')
+
+
+def test_missing_column_is_an_error():
+    with pytest.raises(ExpressionError, match="Unknown variable 'y'"):
+        evaluate_batch('x+y', {'x': [1]})
+
+
+def test_apply_operation():
+    values, errors = apply_operation('√', [4, -1])
+    assert float(values[0]) == 2
+    assert [bool(failed) for failed in errors] == [False, True]
+    values, errors = apply_operation('1/x', [0, 4])
+    assert [bool(failed) for failed in errors] == [True, False]
+    assert float(values[1]) == 0.25
+    with pytest.raises(ValueError):
+        apply_operation('?', [1])
+
+
+def test_format_batch():
+    values, errors = evaluate_batch('10/x', {'x': [4, 0]})
+    assert format_batch(values, errors) == ['2.5', 'Error']
@@ -0,0 +1,25 @@
+"""Benchmark suite"""
+import pytest
+
+import benchmark
+
+
+@pytest.mark.parametrize('name', sorted(name for name in benchmark.BENCHMARKS if not name.startswith('gui.')))
+def test_every_benchmark_runs(name):
+    benchmark.BENCHMARKS[name]()()
+
+
+def test_measure():
+    stats = benchmark.measure(lambda: sum(range(10)), min_time=0.01, samples=5)
+    assert stats['ops_per_sec'] > 0
+    assert stats['p50_us'] <= stats['p99_us']
+
+
+def test_compare_flags_regressions(capsys):
+    baseline = {'results': {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0},
+                            'c': {'ops_per_sec': 100.0}}}
+    current = {'results': {'a': {'ops_per_sec': 95.0}, 'b': {'ops_per_sec': 80.0}}}
+    assert benchmark.compare(baseline, current, 0.10) == ['b']
+    output = capsys.readouterr().out
+    assert 'REGRESSION' in output
+    assert 'c                              missing from current run' in output
@@ -0,0 +1,62 @@
+"""LRU cache of compiled expressions"""
+import pytest
+
+from expression import ExpressionCache, ExpressionError
+from numeric import get_backend
+
+
+def test_equivalent_spellings_share_an_entry():
+    cache = ExpressionCache()
+    first = cache.compile('2×3')
+    assert cache.compile('2*3') is first
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ExpressionCache(maxsize=2)
+    a = cache.compile('1+1')
+    cache.compile('2+2')
+    cache.compile('1+1')
+    cache.compile('3+3')
+    assert len(cache) == 2
+    assert cache.stats()['evictions'] == 1
+    assert cache.compile('1+1') is a
+    assert cache.stats()['misses'] == 3
+
+
+def test_backends_do_not_share_entries():
+    cache = ExpressionCache()
+    decimal = get_backend('decimal')
+    assert cache.compile('1/3', decimal) is not cache.compile('1/3')
+    assert len(cache) == 2
+
+
+def test_errors_are_not_cached():
+    cache = ExpressionCache()
+    for _ in range(2):
+        with pytest.raises(ExpressionError):
+            cache.compile('2+')
+    assert len(cache) == 0
+    assert cache.stats()['misses'] == 2
+
+
+def test_zero_size_disables_caching():
+    cache = ExpressionCache(maxsize=0)
+    assert cache.evaluate('2+2') == 4
+    assert len(cache) == 0
+
+
+def test_resize_and_clear():
+    cache = ExpressionCache()
+    for i in range(5):
+        cache.compile(f'{i}+1')
+    cache.resize(2)
+    assert len(cache) == 2
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'maxsize': 2}
+
+
+def test_negative_size_is_rejected():
+    with pytest.raises(ValueError):
+        ExpressionCache(maxsize=-1)
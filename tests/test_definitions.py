@@ -0,0 +1,112 @@
+"""Variables and user-defined functions"""
+import json
+
+import pytest
+
+from definitions import Definitions, is_definition
+from engine import CalculatorEngine
+from expression import ExpressionCache, ExpressionError, evaluate
+from numeric import get_backend
+
+
+@pytest.fixture
+def definitions():
+    definitions = Definitions()
+    definitions.define('a = 2')
+    definitions.define('f(x) = x*a')
+    definitions.define('b = f(3) + ans')
+    return definitions
+
+
+def test_is_definition():
+    assert is_definition('rate = 1.07')
+    assert is_definition('f(x, y) = x+y')
+    assert not is_definition('2+3')
+
+
+def test_dependents_are_recomputed(definitions):
+    assert definitions.values['b'] == 6
+    definitions.assign('ans', 10)
+    assert definitions.values['b'] == 16
+    definitions.define('a = 0')
+    assert definitions.values['b'] == 10
+    assert definitions.ordered() == ['a', 'f', 'b']
+
+
+@pytest.mark.parametrize('text, message', [
+    ('a = b', "Circular definition of 'a'"),
+    ('ans = 3', "'ans' is set by the calculator"),
+    ('g(x, x) = x', "Duplicate parameter name"),
+    ('g(1) = 2', "Invalid parameter name '1'"),
+    ('2 = 3', "Definitions look like"),
+])
+def test_invalid_definitions(definitions, text, message):
+    with pytest.raises(ExpressionError, match=message):
+        definitions.define(text)
+
+
+def test_remove_refuses_names_in_use(definitions):
+    with pytest.raises(ExpressionError, match="'a' is used by f"):
+        definitions.remove('a')
+    definitions.remove('b')
+    assert 'b' not in definitions
+    assert 'b' not in definitions.values
+
+
+def test_function_calls(definitions):
+    assert evaluate('f(5) + 1', definitions.values) == 11
+    with pytest.raises(ExpressionError, match=r"f\(\) takes 1 argument, got 2"):
+        evaluate('f(1, 2)', definitions.values)
+
+
+def test_function_used_as_a_value(definitions):
+    with pytest.raises(ExpressionError, match="'f' is a function"):
+        evaluate('f + 1', definitions.values)
+    with pytest.raises(ExpressionError, match="'f' is a function"):
+        definitions.define('c = f')
+
+
+def test_function_used_as_a_value_in_the_preview(definitions):
+    engine = CalculatorEngine(cache=ExpressionCache(), definitions=definitions)
+    engine.insert('f+1')
+    assert engine.preview() == ''
+    assert engine.feed('=') == 'Error'
+    assert engine.error == "'f' is a function at position 1"
+
+
+def test_saved_definitions_are_reloaded(tmp_path):
+    path = str(tmp_path / 'definitions.json')
+    saved = Definitions(path)
+    saved.define('a = 2')
+    saved.define('f(x) = x*a')
+    loaded = Definitions(path)
+    assert list(loaded) == ['a', 'f']
+    assert evaluate('f(4)', loaded.values) == 8
+
+
+def test_definitions_that_fail_to_load_are_kept(tmp_path):
+    path = tmp_path / 'definitions.json'
+    texts = ['a = 0', 'c = 1/a', 'g(x) = x +', 'ans = 1', 'not a definition']
+    path.write_text(json.dumps({'definitions': texts}), encoding='utf-8')
+    definitions = Definitions(str(path))
+    assert definitions.errors['c'] == "Cannot divide by zero!"
+    assert 'c' not in definitions.values
+    assert 'g' in definitions.errors
+    assert set(definitions.rejected) == {'ans = 1', 'not a definition'}
+    definitions.define('a = 4')
+    assert definitions.values['c'] == 0.25
+    assert 'c' not in definitions.errors
+    assert sorted(json.loads(path.read_text(encoding='utf-8'))['definitions']) == sorted(
+        ['a = 4', 'c = 1/a', 'g(x) = x +', 'ans = 1', 'not a definition'])
+
+
+def test_switching_backends_keeps_definitions_that_do_not_fit():
+    definitions = Definitions()
+    definitions.define('rate = 1.07')
+    definitions.define('n = 3')
+    definitions.set_backend(get_backend('int'))
+    assert definitions.values['n'] == 3
+    assert 'rate' in definitions and 'rate' in definitions.errors
+    definitions.set_backend(get_backend('float'))
+    assert definitions.values['rate'] == 1.07
+    assert not definitions.errors
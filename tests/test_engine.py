@@ -0,0 +1,124 @@
+"""Headless calculator engine"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import engine as engine_module
+import limits
+from engine import CalculatorEngine, key_action
+from expression import ExpressionCache
+
+
+@pytest.fixture
+def engine():
+    return CalculatorEngine(cache=ExpressionCache())
+
+
+def test_typed_expression_is_evaluated(engine):
+    assert engine.feed('2+3*4=') == '14'
+    assert engine.error is None
+    entry, = engine.calculation_history
+    assert entry.expression == '2+3×4'
+    assert entry.result == 14
+
+
+def test_operator_after_a_result_continues_from_it(engine):
+    engine.feed('2+3=')
+    assert engine.feed('+1=') == '6'
+
+
+def test_digit_after_a_result_starts_over(engine):
+    engine.feed('2+3=')
+    assert engine.feed('7=') == '7'
+
+
+def test_errors_are_reported_not_raised(engine):
+    assert engine.feed('1/0=') == 'Error'
+    assert engine.error == "Cannot divide by zero!"
+    assert engine.feed('4') == '4'
+
+
+def test_backspace_and_clear(engine):
+    engine.feed('123')
+    engine.backspace()
+    assert engine.display == '12'
+    engine.clear_all()
+    assert engine.display == '0'
+    assert engine.expression == ''
+
+
+def test_preview_follows_typing(engine):
+    engine.feed('2+3*')
+    assert engine.preview() == '5'
+    engine.feed('4')
+    assert engine.preview() == '14'
+
+
+def test_preview_runs_under_a_short_time_budget(engine, monkeypatch):
+    engine.feed('2+3')
+    ticks = iter(range(0, 1000, 1))
+    monkeypatch.setattr(limits, '_clock', lambda: next(ticks))
+    assert engine.preview() == ''
+    monkeypatch.undo()
+    engine.feed('+1')
+    assert engine.preview() == '6'
+
+
+def test_unary_operation(engine):
+    engine.feed('9')
+    engine.calculate_operation('√')
+    assert engine.display == '3'
+
+
+def test_parentheses_toggle(engine):
+    engine.handle_input('2')
+    engine.toggle_parentheses()
+    engine.handle_input('3')
+    engine.toggle_parentheses()
+    assert engine.display == '2×(3)'
+    assert engine.feed('=') == '6'
+
+
+def test_toggle_sign(engine):
+    engine.feed('7')
+    engine.toggle_sign()
+    assert engine.feed('=') == '-7'
+
+
+def test_memory_keys(engine):
+    engine.feed('5')
+    engine.memory_store()
+    engine.feed('+1')
+    engine.memory_add()
+    assert engine.memory == 11
+    engine.memory_clear()
+    engine.memory_recall()
+    assert engine.display == '0'
+
+
+def test_ans_is_the_last_result(engine):
+    engine.feed('6*7=')
+    assert engine.definitions.values['ans'] == 42
+
+
+@pytest.mark.parametrize('key, action', [
+    ('5', ('handle_input', ('5',))),
+    ('*', ('handle_input', ('×',))),
+    ('=', ('calculate', ())),
+    ('\r', ('calculate', ())),
+    ('\x08', ('backspace', ())),
+    ('c', ('clear_all', ())),
+    ('(', ('toggle_parentheses', ())),
+    ('q', None),
+])
+def test_key_bindings(key, action):
+    assert key_action(key) == action
+
+
+def test_engine_does_not_need_tkinter():
+    code = "import sys, engine; engine.CalculatorEngine().feed('2+2='); print('tkinter' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(engine_module.__file__)))
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,90 @@
+"""Tokenizer, parser and compiler"""
+import pytest
+
+from expression import ExpressionError, compile_expression, evaluate, normalize, parse, tokenize
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2+3*4', 14),
+    ('(2+3)*4', 20),
+    ('2×3÷4', 1.5),
+    ('10−4−3', 3),
+    ('2**3**2', 512),
+    ('2××10', 1024),
+    ('-2**2', -4),
+    ('+-3', -3),
+    ('7//2', 3),
+    ('7÷÷2', 3),
+    ('7%3', 1),
+    ('1e3', 1000),
+    ('.5+.25', 0.75),
+    ('sqrt(16)', 4),
+    ('max(1, 2)', 2),
+])
+def test_evaluates_with_calculator_precedence(text, expected):
+    assert evaluate(text) == expected
+
+
+def test_result_is_float():
+    assert isinstance(evaluate('2+2'), float)
+
+
+def test_doubled_display_symbols_are_single_operators():
+    ops = [token.value for token in tokenize('2××3÷÷4') if token.kind == 'op']
+    assert ops == ['**', '//']
+
+
+def test_tokens_keep_their_source_positions():
+    tokens = tokenize('12 + x')
+    assert [(token.kind, token.pos) for token in tokens] == [
+        ('number', 0), ('op', 3), ('name', 5), ('end', 6)]
+
+
+@pytest.mark.parametrize('text, message, position', [
+    ('2 $ 3', "Invalid character '$'", 2),
+    ('2+', "Incomplete expression", 2),
+    ('(1', "Unmatched parentheses", 0),
+    ('1)', "Unmatched parentheses", 1),
+    ('2(3)', "Unexpected '('", 1),
+    ('sqrt', "Unknown variable 'sqrt'", 0),
+])
+def test_errors_point_at_the_offending_character(text, message, position):
+    with pytest.raises(ExpressionError) as info:
+        evaluate(text)
+    assert info.value.message == message
+    assert info.value.position == position
+    assert str(info.value) == f"{message} at position {position + 1}"
+
+
+def test_division_by_zero():
+    with pytest.raises(ZeroDivisionError, match="Cannot divide by zero!"):
+        evaluate('1/0')
+
+
+def test_variables_come_from_the_environment():
+    compiled = compile_expression('x*2+y')
+    assert compiled.names == {'x', 'y'}
+    assert compiled.evaluate({'x': 3, 'y': 1}) == 7
+    assert compiled.evaluate({'x': 0, 'y': 1}) == 1
+
+
+def test_function_used_as_a_value_is_an_expression_error():
+    with pytest.raises(ExpressionError, match="'f' is a function"):
+        evaluate('f+1', {'f': abs})
+
+
+def test_constant_expressions_are_memoized():
+    compiled = compile_expression('2*3')
+    assert compiled.is_constant
+    assert compiled.evaluate() is compiled.evaluate()
+
+
+def test_normalize_preserves_positions():
+    text = '2×3÷4−1'
+    assert len(normalize(text)) == len(text)
+    assert normalize(text) == '2*3/4-1'
+
+
+def test_parse_rejects_empty_input():
+    with pytest.raises(ExpressionError):
+        parse('')
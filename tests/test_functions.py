@@ -0,0 +1,61 @@
+"""Scientific function library"""
+import math
+
+import pytest
+
+import functions
+from expression import ExpressionError, evaluate
+from numeric import get_backend
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('sin(pi/2)', 1),
+    ('atan2(1, 1)', math.pi / 4),
+    ('log(100)', 2),
+    ('log(8, 2)', 3),
+    ('ln(e)', 1),
+    ('hypot(3, 4)', 5),
+    ('fact(5)', 120),
+    ('nCr(5, 2)', 10),
+    ('nPr(5, 2)', 20),
+    ('mean(2, 4, 9)', 5),
+    ('median(3, 1, 2)', 2),
+    ('min(3, 1)', 1),
+])
+def test_library_functions(text, expected):
+    assert evaluate(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('x, root', [(27, 3), (-8, -2), (64.0, 4), (0, 0), (-0.001, -0.1), (1e300, 1e100)])
+def test_cbrt_is_exact_for_perfect_cubes(x, root):
+    assert functions.cbrt(x) == root
+
+
+def test_cbrt_without_math_cbrt(monkeypatch):
+    # Python 3.8 to 3.10 fall back to a fractional power
+    monkeypatch.setattr(functions, '_cbrt', lambda x: x ** (1 / 3))
+    assert functions.cbrt(27) == 3
+    assert functions.cbrt(-2) == pytest.approx(-(2 ** (1 / 3)))
+    assert functions.cbrt(-math.inf) == -math.inf
+
+
+@pytest.mark.parametrize('text, message', [
+    ('sin()', r"sin\(\) takes 1 argument, got 0"),
+    ('log()', r"log\(\) takes 1 to 2 arguments, got 0"),
+    ('mean()', r"mean\(\) takes at least 1 argument, got 0"),
+    ('fact(2.5)', r"fact\(\) needs a whole number"),
+    ('sqrt(-1)', r"Invalid argument for sqrt\(\)"),
+    ('nope(1)', "Unknown function 'nope'"),
+])
+def test_call_errors(text, message):
+    with pytest.raises(ExpressionError, match=message):
+        evaluate(text)
+
+
+def test_decimal_mode_uses_full_precision():
+    decimal = get_backend('decimal', 40)
+    assert decimal.format(evaluate('sqrt(2)', backend=decimal)) == '1.41421356237309504880168872420969807857'
+
+
+def test_every_function_has_a_category():
+    assert all(function.category for function in functions.FUNCTIONS.values())
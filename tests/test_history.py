@@ -0,0 +1,134 @@
+"""Bounded calculation history and its on-disk archive"""
+import pytest
+
+import calculator
+from engine import CalculatorEngine
+from history import HistoryEntry, HistoryFile, HistoryStore
+
+
+def _entries(count):
+    return [HistoryEntry(f'{i}+1', (), None, i + 1) for i in range(count)]
+
+
+def test_entry_text():
+    assert str(HistoryEntry('2+3', (), None, 5)) == '2+3 = 5'
+    assert str(HistoryEntry(None, (9,), '√', 3)) == '√(9) = 3'
+    assert str(HistoryEntry(None, (3,), '**', 9)) == '(3)² = 9'
+    assert str(HistoryEntry(None, (4,), '1/x', 0.25)) == '1/(4) = 0.25'
+    assert str(HistoryEntry(None, (1, 2), '+', 3)) == '1 + 2 = 3'
+
+
+def test_ring_buffer_drops_the_oldest_entries():
+    history = HistoryStore(capacity=3)
+    for entry in _entries(5):
+        history.append(entry)
+    assert len(history) == 3
+    assert [entry.result for entry in history] == [3, 4, 5]
+    assert [entry.result for entry in history.recent(2)] == [4, 5]
+
+
+def test_search_in_memory():
+    history = HistoryStore(capacity=10)
+    for entry in _entries(5) + [HistoryEntry(None, (9,), '√', 3)]:
+        history.append(entry)
+    assert [entry.result for entry in history.search(2, 3)] == [2, 3, 3]
+    assert [str(entry) for entry in history.search(op='√')] == ['√(9) = 3']
+    assert [entry.result for entry in history.search(op='+')] == [1, 2, 3, 4, 5]
+
+
+def test_history_size_option():
+    assert CalculatorEngine().calculation_history.capacity == 1000
+    assert calculator.parse_args([]).history_size == 1000
+    assert calculator.parse_args(['--history-size', '5000']).history_size == 5000
+    with pytest.raises(SystemExit):
+        calculator.parse_args(['--history-size', '0'])
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        HistoryStore(capacity=0)
+    with pytest.raises(ValueError):
+        HistoryStore(persist=True)
+
+
+def test_spilled_entries_are_kept_on_disk(tmp_path):
+    history = HistoryStore(capacity=2, spill_path=str(tmp_path / 'history'))
+    for entry in _entries(5):
+        history.append(entry)
+    assert history.spilled == 3
+    assert len(history) == 5
+    assert [entry.result for entry in history] == [1, 2, 3, 4, 5]
+    history.clear()
+    assert len(history) == 0
+    history.close()
+
+
+def _archive(tmp_path, entries):
+    archive = HistoryFile(str(tmp_path / 'history'))
+    for entry in entries:
+        archive.append(entry)
+    return archive
+
+
+MIXED = [
+    HistoryEntry('2+3', (), None, 5),
+    HistoryEntry('10÷4', (), None, 2.5),
+    HistoryEntry(None, (9,), '√', 3),
+    HistoryEntry('6×7−2', (), None, 40),
+    HistoryEntry('1/0', (), None, 'Error'),
+    HistoryEntry(None, (1, 4), '+', 5),
+]
+
+
+def test_archive_random_access(tmp_path):
+    archive = _archive(tmp_path, MIXED)
+    assert len(archive) == len(MIXED)
+    assert archive[1] == MIXED[1]
+    assert archive[-1] == MIXED[-1]
+    assert list(archive) == MIXED
+    with pytest.raises(IndexError):
+        archive[len(MIXED)]
+    archive.close()
+
+
+@pytest.mark.parametrize('reindex', [False, True])
+def test_archive_lookups_with_and_without_indexes(tmp_path, reindex):
+    archive = _archive(tmp_path, MIXED)
+    if reindex:
+        archive.reindex()
+        assert archive.indexed == len(MIXED)
+    assert archive.find_results(5) == [0, 5]
+    assert archive.find_results(2, 4) == [1, 2]
+    assert archive.find_operator('√') == [2]
+    assert archive.find_operator('-') == [3]
+    assert sorted(archive.find_operator('*')) == [3]
+    with pytest.raises(ValueError):
+        archive.find_operator('^')
+    archive.close()
+
+
+def test_records_after_the_index_are_still_found(tmp_path):
+    archive = _archive(tmp_path, MIXED[:3])
+    archive.reindex()
+    for entry in MIXED[3:]:
+        archive.append(entry)
+    assert archive.indexed == 3
+    assert archive.find_results(5) == [0, 5]
+    assert archive.find_operator('+') == [0, 5]
+    archive.close()
+
+
+def test_archive_reopens(tmp_path):
+    _archive(tmp_path, MIXED).close()
+    archive = HistoryFile(str(tmp_path / 'history'))
+    assert list(archive) == MIXED
+    archive.close()
+
+
+def test_archive_search_through_the_store(tmp_path):
+    history = HistoryStore(capacity=2, spill_path=str(tmp_path / 'history'))
+    for entry in MIXED:
+        history.append(entry)
+    assert [entry.result for entry in history.search(5)] == [5, 5]
+    assert [str(entry) for entry in history.search(op='√')] == ['√(9) = 3']
+    history.close()
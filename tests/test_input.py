@@ -0,0 +1,42 @@
+"""Key bursts and clipboard paste"""
+import random
+
+import pytest
+
+from engine import CalculatorEngine
+from expression import ExpressionCache
+
+
+def _state(engine):
+    return (engine.display, engine.expression, engine.expression_mode, engine.reset_display, engine.error)
+
+
+def test_feed_matches_pressing_each_key():
+    rng = random.Random(2)
+    alphabet = list('0123456789') * 2 + list('+-*/%.=()c\x08')
+    for _ in range(500):
+        keys = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 15)))
+        fed = CalculatorEngine(cache=ExpressionCache())
+        pressed = CalculatorEngine(cache=ExpressionCache())
+        fed.feed(keys)
+        error = None
+        for key in keys:
+            pressed.press(key)
+            error = pressed.error or error
+        pressed.error = error
+        assert _state(fed) == _state(pressed), repr(keys)
+
+
+def test_paste_normalizes_operators_and_spacing():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    engine.paste('(12.5 + 3) * 4')
+    assert engine.display == '(12.5+3)×4'
+    assert engine.feed('=') == '62'
+
+
+@pytest.mark.parametrize('text', ['2+$', '{3}', '"1"'])
+def test_paste_rejects_other_characters(text):
+    engine = CalculatorEngine(cache=ExpressionCache())
+    engine.paste(text)
+    assert engine.error.startswith("Cannot paste")
+    assert engine.display == '0'
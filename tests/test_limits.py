@@ -0,0 +1,105 @@
+"""Evaluation limits"""
+import threading
+
+import pytest
+
+import calculator
+import limits
+from expression import CalculationCancelled, ExpressionCache, LimitError, evaluate
+from numeric import MAX_PRECISION, get_backend
+
+
+@pytest.fixture
+def configured():
+    """Restore the default limits after a test changes them"""
+    saved = limits.current
+    yield limits
+    limits.configure(saved)
+
+
+@pytest.mark.parametrize('text, message', [
+    ('9**9**9', "Result would exceed 1000000 bits"),
+    ('fact(100000)', "Result would exceed 1000000 bits"),
+    ('(' * 150 + '1' + ')' * 150, "nested more than 100 levels deep"),
+    ('1e308*10', "Result is too large"),
+])
+def test_costly_inputs_are_refused(text, message):
+    with pytest.raises(LimitError, match=message):
+        evaluate(text)
+
+
+def test_exact_modes_refuse_huge_numbers():
+    with pytest.raises(LimitError):
+        evaluate('2**2000000', backend=get_backend('int'))
+    with pytest.raises(LimitError):
+        evaluate('(1/3)**-2000000', backend=get_backend('fraction'))
+
+
+@pytest.mark.parametrize('mode, text', [
+    ('float', '×'.join(['9' * 40] * 20)),
+    ('int', '×'.join(['9' * 40] * 20)),
+    ('fraction', '1÷' + '÷'.join(['7' * 40] * 20)),
+    ('fraction', '+'.join(f'1/{n}' for n in range(2, 200))),
+])
+def test_operator_chains_are_bounded(configured, mode, text):
+    configured.configure(max_bits=256)
+    with pytest.raises(LimitError, match="256 bits"):
+        evaluate(text, backend=get_backend(mode))
+
+
+def test_long_chain_checks_the_time_budget():
+    cancel = threading.Event()
+    cancel.set()
+    with limits.budget(cancel=cancel):
+        assert evaluate('+'.join(['1'] * 10)) == 10
+        with pytest.raises(CalculationCancelled):
+            evaluate('+'.join(['1'] * 100))
+
+
+def test_configure(configured):
+    configured.configure(max_tokens=5)
+    with pytest.raises(LimitError, match="longer than 5 tokens"):
+        ExpressionCache().compile('1+2+3+4')
+    configured.configure(max_tokens=None, max_bits=64)
+    with pytest.raises(LimitError, match="64 bits"):
+        evaluate('2**100', backend=get_backend('int'))
+    assert configured.current.max_tokens is None
+
+
+def test_time_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(limits, '_clock', lambda: now[0])
+    with limits.budget(seconds=1):
+        now[0] += 0.5
+        limits.check_time()
+        now[0] += 1
+        with pytest.raises(LimitError, match="longer than 1 seconds"):
+            limits.check_time()
+    assert limits._local.deadline is None
+
+
+def test_cancel_event_stops_the_calculation():
+    cancel = threading.Event()
+    with limits.budget(cancel=cancel):
+        limits.check_time()
+        cancel.set()
+        with pytest.raises(CalculationCancelled):
+            limits.check_time()
+
+
+def test_nested_budgets_keep_the_outer_one():
+    cancel = threading.Event()
+    with limits.budget(cancel=cancel):
+        with limits.budget(seconds=100):
+            assert limits._local.cancel is cancel
+        assert limits._local.cancel is cancel
+    assert limits._local.cancel is None
+
+
+def test_decimal_precision_is_capped():
+    get_backend('decimal', MAX_PRECISION)
+    with pytest.raises(ValueError):
+        get_backend('decimal', MAX_PRECISION + 1)
+    with pytest.raises(SystemExit):
+        calculator.parse_args(['--mode', 'decimal', '--precision', str(MAX_PRECISION + 1)])
+    assert calculator.parse_args(['--precision', '50']).precision == 50
@@ -0,0 +1,112 @@
+"""Float, Decimal, Fraction and integer backends"""
+from fractions import Fraction
+
+import pytest
+
+from engine import CalculatorEngine
+from expression import ExpressionCache, ExpressionError, LimitError, evaluate
+from history import HistoryStore
+from numeric import FLOAT, MAX_PRECISION, MODES, backend_from_spec, backend_spec, format_result, get_backend
+
+
+@pytest.mark.parametrize('value, shown', [
+    (14.0, 14), (2.5, 2.5), (1 / 3, 0.3333333333), (1e12, '1.00e+12'), (-7.0, -7),
+])
+def test_format_result(value, shown):
+    assert format_result(value) == shown
+
+
+@pytest.mark.parametrize('mode, text, shown', [
+    ('float', '0.1+0.2', '0.3'),
+    ('decimal', '0.1+0.2', '0.3'),
+    ('decimal', '1/3', '0.3333333333333333333333333333'),
+    ('fraction', '1/3+1/6', '1/2'),
+    ('fraction', '0.1+0.2', '3/10'),
+    ('int', '2**100', '1267650600228229401496703205376'),
+    ('int', '7//2', '3'),
+])
+def test_modes(mode, text, shown):
+    backend = get_backend(mode)
+    assert backend.format(evaluate(text, backend=backend)) == shown
+
+
+@pytest.mark.parametrize('mode, text, message', [
+    ('int', '7/2', "Result is not an integer"),
+    ('int', '1.5', "Integer mode does not accept decimals"),
+    ('int', '2**-1', "Result is not an integer"),
+    ('fraction', '2**0.5', "Exact mode supports only whole-number powers"),
+])
+def test_exact_mode_errors(mode, text, message):
+    with pytest.raises(ExpressionError, match=message):
+        evaluate(text, backend=get_backend(mode))
+
+
+@pytest.mark.parametrize('text', ['1e999999999', '1e-999999999', '2.5E400000'])
+def test_fraction_exponents_are_checked_before_the_power_is_built(text):
+    with pytest.raises(LimitError, match="bits at position 1"):
+        evaluate(text, backend=get_backend('fraction'))
+    with pytest.raises(LimitError):
+        get_backend('fraction').parse(text)
+    assert get_backend('fraction').literal('2.5e3') == 2500
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('-7%3', 2), ('7%-3', -2), ('-7%-3', -1), ('-6%3', 0),
+    ('-7//2', -4), ('7//-2', -4), ('-7//-2', 3), ('-6//3', -2),
+])
+@pytest.mark.parametrize('mode', MODES)
+def test_floor_division_and_remainder_agree_across_modes(mode, text, expected):
+    backend = get_backend(mode)
+    assert backend.format(evaluate(text, backend=backend)) == str(expected)
+
+
+def test_decimal_precision():
+    assert get_backend('decimal', 5).format(evaluate('1/3', backend=get_backend('decimal', 5))) == '0.33333'
+    with pytest.raises(ValueError):
+        get_backend('decimal', MAX_PRECISION + 1)
+    with pytest.raises(ValueError):
+        get_backend('nope')
+
+
+def test_unary_operations():
+    assert get_backend('fraction').unary('√', Fraction(9, 4)) == Fraction(3, 2)
+    with pytest.raises(ValueError, match="not an exact fraction"):
+        get_backend('fraction').unary('√', Fraction(2))
+    assert get_backend('int').unary('√', 49) == 7
+    with pytest.raises(ZeroDivisionError):
+        get_backend('decimal').unary('1/x', get_backend('decimal').parse('0'))
+
+
+def test_numbers_too_long_for_str_are_shown_in_scientific_notation():
+    huge = 10 ** 5000
+    assert get_backend('fraction').format(Fraction(huge, 3)) == '3.3333333333E+4999'
+    assert get_backend('fraction').format(Fraction(1, huge + 1)) == '1.0000000000E-5000'
+    assert get_backend('int').format(huge * 7) == '7.0000000000E+5000'
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_backend_spec_round_trip(mode):
+    backend = get_backend(mode, 40 if mode == 'decimal' else None)
+    restored = backend_from_spec(backend_spec(backend))
+    assert restored.key == backend.key
+    assert (backend_spec(backend) is None) == (backend is FLOAT)
+
+
+def test_history_replays_each_entry_in_its_own_mode(tmp_path):
+    history = HistoryStore(capacity=1, spill_path=str(tmp_path / 'history'))
+    engine = CalculatorEngine(cache=ExpressionCache(), history=history)
+    engine.feed('1/3+1/6=')
+    engine.set_numeric_mode('fraction')
+    engine.feed('1/3+1/6=')
+    engine.set_numeric_mode('decimal', 10)
+    engine.feed('2')
+    engine.calculate_operation('√')
+    engine.set_numeric_mode('int')
+    engine.feed('2**70=')
+    replayed = list(history.archive.replay())
+    history.close()
+    assert [(str(entry), matches) for _, entry, _, matches in replayed] == [
+        ('1÷3+1÷6 = 0.5', True),
+        ('1÷3+1÷6 = 1/2', True),
+        ('√(2) = 1.414213562', True),
+    ]
@@ -0,0 +1,63 @@
+"""Process-pool evaluation"""
+import functools
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import limits
+import parallel
+import units
+from numeric import get_backend
+from parallel import evaluate_chunk, parallel_evaluate
+
+
+EXPRESSIONS = [f'{i}*2+1' for i in range(50)] + ['1/0', '2+']
+
+
+def _summary(results):
+    return [(item.index, item.value, None if item.error is None else str(item.error)) for item in results]
+
+
+def test_chunk_errors_are_returned_as_values():
+    ok, division, syntax = evaluate_chunk(10, ['3*3', '1/0', '2+'])
+    assert (ok.index, ok.value, ok.error) == (10, 9, None)
+    assert isinstance(division.error, ZeroDivisionError)
+    assert division.index == 11
+    assert str(syntax.error) == 'Incomplete expression at position 3'
+
+
+def test_workers_give_the_same_results_in_order():
+    serial = _summary(parallel_evaluate(EXPRESSIONS, workers=1, chunksize=8))
+    assert _summary(parallel_evaluate(EXPRESSIONS, workers=2, chunksize=8)) == serial
+    assert [index for index, _, _ in serial] == list(range(len(EXPRESSIONS)))
+
+
+def test_unordered_results_cover_every_index():
+    results = parallel_evaluate(EXPRESSIONS, workers=2, chunksize=8, ordered=False)
+    assert sorted(_summary(results)) == _summary(parallel_evaluate(EXPRESSIONS, workers=1))
+
+
+def test_spawned_workers_use_the_parent_limits_and_rates(tmp_path, monkeypatch):
+    # Spawned workers re-import everything, so nothing is inherited by accident
+    monkeypatch.setattr(parallel, 'ProcessPoolExecutor',
+                        functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+    monkeypatch.setattr(units, 'rates_path', units.rates_path)
+    path = tmp_path / 'rates.json'
+    path.write_text(json.dumps({'base': 'USD', 'rates': {'EUR': 0.5}}), encoding='utf-8')
+    units.load_rates(str(path))
+    saved = limits.current
+    limits.configure(max_bits=64)
+    try:
+        big, euros = parallel_evaluate(['2**100', '3[EUR] to [USD]'], workers=2, chunksize=1,
+                                       backend=get_backend('int'))
+    finally:
+        limits.configure(saved)
+    assert str(big.error) == "Result would exceed 64 bits"
+    assert euros.value == 6
+
+
+def test_chunksize_must_be_positive():
+    with pytest.raises(ValueError):
+        list(parallel_evaluate(EXPRESSIONS, chunksize=0))
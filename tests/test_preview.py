@@ -0,0 +1,114 @@
+"""Incremental evaluator behind the live preview"""
+import random
+
+import pytest
+
+import limits
+from expression import LimitError, evaluate
+from numeric import get_backend
+from preview import IncrementalEvaluator
+
+
+def _preview(text, **options):
+    evaluator = IncrementalEvaluator(**options)
+    evaluator.append(text)
+    return evaluator.result()
+
+
+@pytest.mark.parametrize('text', [
+    '2+3×4', '2**3**2', '-2**2', '2**-1', '2××3', '7÷÷2', '10%4', '1.5e+3+1', '(1+2)×(3−4)', '−3+ +2',
+])
+def test_agrees_with_the_full_evaluator(text):
+    assert _preview(text) == evaluate(text)
+
+
+def test_random_inputs_agree_with_the_full_evaluator():
+    alphabet = list('0123456789') * 3 + list('+-*/%()×÷−. ')
+    rng = random.Random(1)
+    for _ in range(3000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+        try:
+            expected = evaluate(text)
+        except (ValueError, ArithmeticError):
+            continue
+        assert _preview(text) == pytest.approx(expected, rel=1e-9), text
+
+
+def test_unfinished_input_previews_what_is_there():
+    assert _preview('(2+3×') == 5
+    assert _preview('2+') == 2
+    assert _preview('') is None
+    assert _preview('2)') is None
+    assert _preview('1/0') is None
+
+
+def test_complete():
+    for text, complete in [('2+3', True), ('2+', False), ('(2', False), ('(2)', True), ('', False)]:
+        evaluator = IncrementalEvaluator()
+        evaluator.append(text)
+        assert evaluator.complete() is complete, text
+
+
+def test_editing_reuses_the_common_prefix():
+    evaluator = IncrementalEvaluator()
+    evaluator.sync('12+30')
+    evaluator.backspace(2)
+    assert (evaluator.text, evaluator.result()) == ('12+', 12)
+    evaluator.sync('12×4')
+    assert evaluator.result() == 48
+    evaluator.sync('1')
+    assert evaluator.result() == 1
+
+
+def test_names_come_from_the_environment():
+    assert _preview('x×2', env={'x': 4}) == 8
+    assert _preview('y', env={'x': 4}) is None
+
+
+@pytest.mark.parametrize('mode, text', [
+    ('float', '×'.join(['9' * 40] * 20)),
+    ('fraction', '1÷' + '÷'.join(['7' * 40] * 20)),
+])
+def test_growth_past_the_limit_previews_nothing(mode, text):
+    saved = limits.current
+    limits.configure(max_bits=256)
+    try:
+        assert _preview(text, backend=get_backend(mode)) is None
+    finally:
+        limits.configure(saved)
+
+
+def test_an_error_sticks_to_the_rest_of_the_text():
+    evaluator = IncrementalEvaluator()
+    evaluator.append('2$' + '+1' * 100)
+    assert evaluator.result() is None
+    evaluator.backspace(len(evaluator.text) - 1)
+    assert evaluator.result() == 2
+
+
+def test_sync_resumes_after_the_time_budget_runs_out(monkeypatch):
+    now = [0.0]
+
+    def clock():
+        now[0] += 0.01
+        return now[0]
+    monkeypatch.setattr(limits, '_clock', clock)
+    evaluator = IncrementalEvaluator()
+    text = '+'.join(['1'] * 50)
+    with pytest.raises(LimitError):
+        with limits.budget(seconds=0.5):
+            evaluator.sync(text)
+    assert 0 < len(evaluator.text) < len(text)
+    assert text.startswith(evaluator.text)
+    monkeypatch.undo()
+    evaluator.sync(text)
+    assert evaluator.result() == 50
+
+
+def test_exact_backend():
+    fraction = get_backend('fraction')
+    assert fraction.format(_preview('1/3+1/6', backend=fraction)) == '1/2'
+    decimal = get_backend('decimal')
+    assert decimal.format(_preview('0.1+0.2', backend=decimal)) == '0.3'
+    assert decimal.format(_preview('−7%3', backend=decimal)) == '2'
+    assert decimal.format(_preview('−7÷÷2', backend=decimal)) == '-4'
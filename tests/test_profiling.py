@@ -0,0 +1,105 @@
+"""Opt-in profiler"""
+import csv
+import json
+
+from engine import CalculatorEngine
+from expression import ExpressionCache
+from profiling import Profiler, Timer, histogram_lines
+
+
+class _Clock:
+    """A clock that advances by a fixed step each time it is read"""
+
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def test_timer_summary():
+    timer = Timer('t')
+    for seconds in (1e-6, 3e-6, 100e-6):
+        timer.add(seconds)
+    summary = timer.as_dict()
+    assert summary['count'] == 3
+    assert summary['min_us'] == 1
+    assert summary['max_us'] == 100
+    assert summary['p50_us'] == 4
+    assert summary['p99_us'] == 128
+    assert summary['buckets']['<=1us'] == 1
+    assert histogram_lines(timer)
+
+
+def test_enable_times_and_counts_the_engine():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    profiler = Profiler(clock=_Clock(1e-6))
+    profiler.enable(engine=engine)
+    engine.feed('2+3')
+    engine.preview()
+    engine.feed('=')
+    engine.clear_all()
+    engine.feed('1/0=')
+    engine.clear_all()
+    engine.preview()
+    engine.paste('(1 + 2) * 3')
+    stats = profiler.stats()
+    assert stats['timers']['engine.calculate']['count'] == 2
+    assert stats['timers']['engine.feed']['count'] == 3
+    assert stats['timers']['engine.paste']['count'] == 1
+    assert stats['timers']['expression.compile']['count'] >= 2
+    counters = stats['counters']
+    assert counters['engine.errors'] == 1
+    assert counters['engine.evaluate_expression.errors'] == 1
+    assert counters['engine.preview.blank'] == 1
+    assert counters['expression.cache.misses'] == 2
+
+
+def test_disable_restores_the_original_methods():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    profiler = Profiler()
+    profiler.enable(engine=engine)
+    assert 'calculate' in vars(engine)
+    profiler.disable()
+    assert 'calculate' not in vars(engine)
+    assert '_set_error' not in vars(engine)
+    assert 'compile' not in vars(engine.expression_cache)
+    engine.feed('1/0=')
+    assert profiler.stats()['counters'].get('engine.errors') is None
+
+
+def test_reset():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    profiler = Profiler()
+    profiler.enable(engine=engine)
+    engine.feed('1/0=')
+    profiler.reset()
+    assert profiler.timers['engine.calculate'].count == 0
+    assert 'engine.errors' not in profiler.stats()['counters']
+
+
+def test_export(tmp_path):
+    engine = CalculatorEngine(cache=ExpressionCache())
+    profiler = Profiler()
+    profiler.enable(engine=engine)
+    engine.feed('2+2=')
+    profiler.export(str(tmp_path / 'profile.json'))
+    stats = json.loads((tmp_path / 'profile.json').read_text(encoding='utf-8'))
+    assert stats['timers']['engine.calculate']['count'] == 1
+    profiler.export(str(tmp_path / 'profile.csv'))
+    with open(tmp_path / 'profile.csv', newline='', encoding='utf-8') as f:
+        rows = {row[0]: row for row in csv.reader(f)}
+    assert rows['engine.calculate'][1] == '1'
+    assert rows['expression.cache.misses'] == ['expression.cache.misses', '1']
+
+
+def test_capture_report():
+    profiler = Profiler()
+    assert profiler.toggle_capture() is None
+    assert profiler.capturing
+    sum(range(1000))
+    report = profiler.toggle_capture()
+    assert not profiler.capturing
+    assert 'function calls' in report
@@ -0,0 +1,97 @@
+"""Memory registers and RPN stack mode"""
+from fractions import Fraction
+
+import pytest
+
+from engine import CalculatorEngine
+from expression import ExpressionCache, ExpressionError
+from numeric import get_backend
+from rpn import RPNStack
+
+
+@pytest.fixture
+def engine():
+    return CalculatorEngine(cache=ExpressionCache())
+
+
+@pytest.fixture
+def rpn(engine):
+    engine.set_rpn_mode(True)
+    return engine
+
+
+def test_stack_operations():
+    stack = RPNStack(get_backend('fraction'))
+    for value in (Fraction(1), Fraction(3)):
+        stack.push(value)
+    assert stack.apply('÷') == (1, 3, Fraction(1, 3))
+    stack.duplicate()
+    stack.apply('+')
+    assert stack.values == [Fraction(2, 3)]
+    with pytest.raises(ExpressionError, match="needs two numbers"):
+        stack.apply('×')
+    stack.push(Fraction(0))
+    with pytest.raises(ZeroDivisionError):
+        stack.apply('÷')
+    assert stack.values == [Fraction(2, 3), 0]
+    stack.swap()
+    assert stack.drop() == Fraction(2, 3)
+
+
+def test_rpn_keys(rpn):
+    assert rpn.feed('3=4+') == '7'
+    assert rpn.feed('2=3=4*+') == '14'
+    assert rpn.stack.values == [7, 14]
+    assert rpn.preview() == '7'
+    assert rpn.feed('/') == '0.5'
+    assert str(rpn.calculation_history.recent(1)[0]) == '7.0 ÷ 14.0 = 0.5'
+
+
+def test_rpn_errors_leave_the_stack_alone(rpn):
+    assert rpn.feed('1=0/') == 'Error'
+    assert rpn.error == "Cannot divide by zero!"
+    assert rpn.stack.values == [1, 0]
+
+
+def test_rpn_backspace_swap_and_sign(rpn):
+    rpn.feed('12=34')
+    rpn.backspace()
+    assert rpn.display == '3'
+    rpn.toggle_parentheses()
+    assert rpn.stack.values == [3, 12]
+    rpn.toggle_sign()
+    assert rpn.display == '-12'
+    rpn.backspace()
+    assert rpn.stack.values == [3]
+
+
+def test_mode_switch_carries_the_value(engine):
+    engine.feed('2+3')
+    engine.set_rpn_mode(True)
+    assert engine.stack.values == [5]
+    engine.feed('2*')
+    engine.set_rpn_mode(False)
+    assert (engine.display, engine.rpn_mode) == ('10', False)
+
+
+def test_registers(engine):
+    engine.feed('6')
+    engine.select_register(3)
+    engine.memory_store()
+    assert engine.registers[3] == 6
+    assert engine.memory == 0
+    engine.memory_add(0)
+    assert engine.definitions.values['M'] == 6
+    engine.clear_all()
+    engine.insert('M3+M0+1')
+    assert engine.feed('=') == '13'
+    with pytest.raises(ValueError):
+        engine.select_register(10)
+
+
+def test_registers_follow_the_numeric_mode(engine):
+    engine.set_register(2, 0.5)
+    engine.set_numeric_mode('fraction')
+    assert engine.registers[2] == Fraction(1, 2)
+    engine.set_numeric_mode('int')
+    assert engine.registers[2] == 0
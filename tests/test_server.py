@@ -0,0 +1,97 @@
+"""Line-delimited JSON evaluation service"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import limits
+from parallel import Evaluation
+import server
+from server import UNLIMITED_LINE, EvaluationServer, line_limit
+
+
+def _decode(response):
+    assert response.endswith(b'\n')
+    return json.loads(response)
+
+
+def test_service_and_batch_do_not_load_the_engine():
+    code = "import sys, server, batch; print('engine' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(server.__file__)))
+    assert result.stdout.strip() == 'False'
+
+
+def test_parse_request():
+    assert EvaluationServer._parse_request(b'{"id": 7, "expr": "2+3"}\n') == (7, '2+3', None)
+    for line in (b'not json\n', b'{"id": 1}\n', b'[1, 2]\n'):
+        request_id, expression, error = EvaluationServer._parse_request(line)
+        assert (request_id, expression, str(error)) == (None, None, "Malformed request")
+
+
+def test_response_bodies():
+    assert _decode(EvaluationServer._response(1, Evaluation(0, '2+3×4', 14.0, None))) == {
+        'id': 1, 'result': '14', 'value': 14.0}
+    failed = Evaluation(0, '1/0', None, ZeroDivisionError("Cannot divide by zero!"))
+    assert _decode(EvaluationServer._response(2, failed)) == {'id': 2, 'error': "Cannot divide by zero!"}
+    assert _decode(EvaluationServer._response(None, ValueError("Malformed request"))) == {
+        'id': None, 'error': "Malformed request"}
+
+
+def test_pipelined_requests_are_answered_in_order():
+    async def exchange():
+        service = EvaluationServer(workers=2, max_batch=4, use_processes=False)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            lines = [json.dumps({'id': i, 'expr': f'{i}*2'}) for i in range(20)] + ['garbage']
+            writer.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in lines]
+            writer.close()
+            return responses
+        finally:
+            await service.close()
+
+    responses = asyncio.run(exchange())
+    assert [response['id'] for response in responses] == list(range(20)) + [None]
+    assert [response['value'] for response in responses[:20]] == [i * 2 for i in range(20)]
+    assert responses[-1]['error'] == "Malformed request"
+
+
+def test_line_limit_follows_max_tokens():
+    saved = limits.current
+    try:
+        limits.configure(max_tokens=100000)
+        assert line_limit() == 1600000
+        limits.configure(max_tokens=10)
+        assert line_limit() == 2 ** 16
+        limits.configure(max_tokens=None)
+        assert line_limit() == UNLIMITED_LINE
+    finally:
+        limits.configure(saved)
+
+
+def test_too_long_lines_are_answered_and_the_connection_stays_open():
+    async def exchange():
+        service = EvaluationServer(use_processes=False)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            long = json.dumps({'id': 1, 'expr': '+'.join(['1'] * service.limit)})
+            lines = [long, json.dumps({'id': 2, 'expr': '2*3'}), long, json.dumps({'id': 3, 'expr': '1+1'})]
+            writer.write(''.join(line + '\n' for line in lines).encode('utf-8') + long.encode('utf-8'))
+            writer.write_eof()
+            responses = [json.loads(await reader.readline()) for _ in range(len(lines) + 1)]
+            writer.close()
+            return service.limit, responses
+        finally:
+            await service.close()
+
+    limit, responses = asyncio.run(exchange())
+    too_long = {'id': None, 'error': f"Request is longer than {limit} bytes"}
+    assert responses == [too_long, {'id': 2, 'result': '6', 'value': 6}, too_long,
+                         {'id': 3, 'result': '2', 'value': 2}, too_long]
@@ -0,0 +1,108 @@
+"""Saving and restoring calculator state"""
+import os
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+import history
+from engine import CalculatorEngine
+from expression import ExpressionCache
+from history import INDEX_RECORD, HistoryEntry, HistoryFile
+from session import Session, decode_value, encode_value
+
+
+def _engine(session):
+    engine = CalculatorEngine(cache=ExpressionCache(), history=session.history())
+    session.restore(engine)
+    return engine
+
+
+@pytest.mark.parametrize('value', [0, -7, 10 ** 6000, Fraction(-1, 3), Decimal('1.50'), 2.5, float('inf')],
+                         ids=['zero', 'negative', 'huge', 'fraction', 'decimal', 'float', 'inf'])
+def test_values_round_trip_exactly(value):
+    restored = decode_value(encode_value(value))
+    assert restored == value
+    assert type(restored) is type(value)
+    if isinstance(value, Decimal):
+        assert str(restored) == str(value)
+
+
+def test_state_and_history_are_restored(tmp_path):
+    session = Session(str(tmp_path))
+    engine = _engine(session)
+    engine.set_numeric_mode('fraction')
+    engine.feed('1/3+1/6=')
+    engine.memory_store()
+    engine.set_register(4, Fraction(2, 7))
+    engine.feed('2+')
+    assert session.snapshot(engine) is True
+    session.close()
+
+    session = Session(str(tmp_path))
+    engine = _engine(session)
+    assert engine.backend.name == 'fraction'
+    assert engine.display == '2+'
+    assert engine.memory == Fraction(1, 2)
+    assert engine.registers[4] == Fraction(2, 7)
+    assert engine.definitions.values['ans'] == Fraction(1, 2)
+    assert [str(entry) for entry in engine.calculation_history] == ['1÷3+1÷6 = 1/2']
+    assert engine.feed('1=') == '3'
+    session.close()
+
+
+def test_unchanged_state_is_not_rewritten(tmp_path):
+    session = Session(str(tmp_path))
+    engine = _engine(session)
+    engine.feed('12')
+    assert session.snapshot(engine) is True
+    assert session.snapshot(engine) is False
+    engine.feed('3')
+    assert session.snapshot(engine) is True
+    session.close()
+
+
+@pytest.mark.parametrize('content', ['', '{"version": 1}', '{"version": 2, "display": "5"}', 'not json'])
+def test_damaged_state_is_ignored(tmp_path, content):
+    (tmp_path / 'state.json').write_text(content, encoding='utf-8')
+    session = Session(str(tmp_path))
+    engine = CalculatorEngine(cache=ExpressionCache(), history=session.history())
+    assert session.restore(engine) is False
+    assert engine.display == '0'
+    session.close()
+
+
+def test_close_reindexes_only_a_long_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, 'REINDEX_TAIL', 3)
+    session = Session(str(tmp_path))
+    engine = _engine(session)
+    for digit in '12':
+        engine.feed(f'{digit}+1=')
+    session.close()
+    assert not os.path.exists(session.history_path + '.ridx')
+
+    session = Session(str(tmp_path))
+    engine = _engine(session)
+    for digit in '345':
+        engine.feed(f'{digit}+1=')
+    session.close()
+    archive = HistoryFile(session.history_path)
+    assert archive.indexed == 5
+    assert archive.find_results(4) == [2]
+    archive.close()
+
+
+def test_a_torn_append_is_dropped_on_open(tmp_path):
+    path = str(tmp_path / 'history')
+    archive = HistoryFile(path)
+    archive.append(HistoryEntry('1+1', (), None, 2))
+    archive.append(HistoryEntry('2+2', (), None, 4))
+    archive.close()
+    # The second payload never reached the disk, and half an index record follows
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    with open(path + '.idx', 'ab') as f:
+        f.write(b'\0' * (INDEX_RECORD.size // 2))
+    archive = HistoryFile(path)
+    assert list(archive) == [HistoryEntry('1+1', (), None, 2)]
+    archive.close()
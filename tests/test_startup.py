@@ -0,0 +1,33 @@
+"""What importing the GUI module loads"""
+import os
+import subprocess
+import sys
+
+import calculator
+
+# Loaded on first use, not at startup
+DEFERRED = ('argparse', 'tkinter.messagebox', 'tkinter.simpledialog', 'tkinter.filedialog', 'tkinter.ttk',
+            'profiling', 'units')
+
+
+def test_stream_runs_without_tkinter(tmp_path):
+    # A tkinter package that fails to import, as on Python builds without Tk
+    (tmp_path / 'tkinter').mkdir()
+    (tmp_path / 'tkinter' / '__init__.py').write_text("raise ImportError('No module named _tkinter')\n")
+    here = os.path.dirname(os.path.abspath(calculator.__file__))
+    env = dict(os.environ, PYTHONPATH=str(tmp_path))
+    result = subprocess.run([sys.executable, os.path.join(here, 'calculator.py'), '--stream'], input='2+2\n',
+                            capture_output=True, text=True, env=env, cwd=here)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '2+2 = 4\n'
+    result = subprocess.run([sys.executable, os.path.join(here, 'calculator.py'), '--no-session'],
+                            capture_output=True, text=True, env=env, cwd=here)
+    assert result.returncode == 2
+    assert "tkinter is not available" in result.stderr
+
+
+def test_import_defers_dialogs_and_optional_modules():
+    code = f"import sys, calculator; print([name for name in {DEFERRED!r} if name in sys.modules])"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(calculator.__file__)))
+    assert result.stdout.strip() == '[]'
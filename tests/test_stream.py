@@ -0,0 +1,25 @@
+"""Line-by-line streaming mode"""
+import io
+
+from stream import read_expressions, run
+
+
+def test_blank_lines_are_skipped():
+    assert list(read_expressions(['1+1\n', '  \n', ' 2*3 \n'])) == ['1+1', '2*3']
+
+
+def test_each_line_is_written_as_expr_equals_result(tmp_path):
+    source = tmp_path / 'input.txt'
+    source.write_text('1+1\n\n2×3\n1/0\n', encoding='utf-8')
+    out, err = io.StringIO(), io.StringIO()
+    assert run(str(source), out=out, err=err) == 1
+    assert out.getvalue() == '1+1 = 2\n2×3 = 6\n1/0 = Error\n'
+    assert err.getvalue() == 'expression 3: Cannot divide by zero!\n'
+
+
+def test_exact_mode(tmp_path):
+    source = tmp_path / 'input.txt'
+    source.write_text('1/3+1/6\n', encoding='utf-8')
+    out = io.StringIO()
+    assert run(str(source), out=out, err=io.StringIO(), mode='fraction') == 0
+    assert out.getvalue() == '1/3+1/6 = 1/2\n'
@@ -0,0 +1,95 @@
+"""Unit- and currency-aware arithmetic"""
+import io
+import json
+from fractions import Fraction
+
+import pytest
+
+import stream
+import units
+from engine import CalculatorEngine
+from expression import ExpressionCache, ExpressionError, compile_expression
+from numeric import get_backend
+from parallel import Evaluation
+from server import EvaluationServer
+
+
+@pytest.mark.parametrize('text, value, unit', [
+    ('100[MB/s] to [GB/day]', 8640, 'GB/day'),
+    ('1/(5[ms]) to [req/s]', 200, 'req/s'),
+    ('3[km] + 200[m]', 3.2, 'km'),
+    ('1[h] to [min]', 60, 'min'),
+    ('2[m] * 3[m]', 6, 'm^2'),
+    ('2 + 3', 5, None),
+])
+def test_conversions(text, value, unit):
+    compiled = compile_expression(text)
+    assert compiled.evaluate() == pytest.approx(value)
+    assert compiled.unit == unit
+
+
+@pytest.mark.parametrize('text, message', [
+    ('3[m] + 2[s]', "Cannot add m and s"),
+    ('5[km] to [s]', "Cannot convert km to s"),
+    ('10[foo]', "Unknown unit 'foo'"),
+    ('2[m]**[m]', r"Unexpected '\[m\]'"),
+])
+def test_unit_errors(text, message):
+    with pytest.raises(ExpressionError, match=message):
+        compile_expression(text)
+
+
+def test_exact_conversion():
+    fraction = get_backend('fraction')
+    assert compile_expression('1[ft] to [in]', fraction).evaluate() == 12
+    assert compile_expression('1[min] to [h]', fraction).evaluate() == Fraction(1, 60)
+
+
+def test_rates_come_from_a_local_file(tmp_path, monkeypatch):
+    monkeypatch.setenv('CALCULATOR_RATES', '')
+    path = tmp_path / 'rates.json'
+    path.write_text(json.dumps({'base': 'USD', 'rates': {'EUR': 0.8}}), encoding='utf-8')
+    assert units.load_rates(str(path)) == 'USD'
+    compiled = compile_expression('20[EUR] + 4[USD] to [USD]')
+    assert compiled.evaluate() == pytest.approx(29)
+    assert compiled.unit == 'USD'
+    path.write_text(json.dumps({'base': 'USD', 'rates': {'EUR': -1}}), encoding='utf-8')
+    with pytest.raises(ValueError, match="invalid rate for 'EUR'"):
+        units.load_rates(str(path))
+
+
+def test_engine_keeps_the_unit_with_the_result():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    engine.feed('100')
+    engine.insert_unit('MB/s')
+    engine.insert_unit('GB/day', convert=True)
+    assert engine.preview() == '8640[GB/day]'
+    assert engine.feed('=') == '8640[GB/day]'
+    engine.feed('+')
+    engine.insert('60')
+    engine.insert_unit('GB/day')
+    assert engine.feed('=') == '8700[GB/day]'
+
+
+def test_paste_keeps_unit_text():
+    engine = CalculatorEngine(cache=ExpressionCache())
+    engine.paste('2[m] * 3[m]')
+    assert engine.display == '2[m]×3[m]'
+    assert engine.feed('=') == '6[m^2]'
+    engine.calculate_operation('√')
+    assert engine.display == '2.4494897428[m]'
+
+
+def test_server_response_has_the_unit():
+    response = EvaluationServer._response(3, Evaluation(0, '100[MB/s] to [GB/day]', 8640.0, None))
+    assert json.loads(response) == {'id': 3, 'result': '8640', 'value': 8640.0, 'unit': 'GB/day'}
+    response = EvaluationServer._response(4, Evaluation(0, '2+3', 5.0, None))
+    assert 'unit' not in json.loads(response)
+
+
+def test_stream_output_has_the_unit(tmp_path):
+    source = tmp_path / 'input.txt'
+    source.write_text('3[km] + 200[m]\n', encoding='utf-8')
+    out = io.StringIO()
+    assert stream.run(str(source), out=out, err=io.StringIO()) == 0
+    assert out.getvalue() == '3[km] + 200[m] = 3.2[km]\n'
@@ -0,0 +1,211 @@
+"""Background calculations and the view's use of them"""
+import re
+import threading
+import time
+
+import pytest
+
+import limits
+from calculator import Calculator
+from engine import CalculatorEngine
+from expression import CalculationCancelled, ExpressionCache
+from profiling import Profiler
+from worker import Worker
+
+
+class _Root:
+    """Stand-in for the Tk root: after() callbacks run when run_pending() is called"""
+
+    def __init__(self):
+        self.pending = {}
+        self.ids = 0
+
+    def after(self, ms, func):
+        self.ids += 1
+        self.pending[self.ids] = func
+        return self.ids
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, {}
+        for func in pending.values():
+            func()
+
+    def run_until(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.001)
+            self.run_pending()
+
+
+class _Var:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class _Button:
+    def __init__(self, text):
+        self.text = text
+
+    def config(self, text):
+        self.text = text
+
+
+def _spin(started, cancel_seen):
+    """An action that runs until its budget is cancelled"""
+    started.set()
+    try:
+        while True:
+            limits.check_time()
+            time.sleep(0.001)
+    except CalculationCancelled:
+        cancel_seen.set()
+
+
+def test_quick_jobs_finish_inside_submit():
+    root = _Root()
+    worker = Worker(root, wait=1)
+    finished = []
+    assert worker.submit(lambda: None, finished.append) is True
+    assert finished == [False]
+    assert not worker.busy
+    worker.shutdown()
+
+
+def test_slow_jobs_finish_through_the_poll_and_can_be_cancelled():
+    root = _Root()
+    worker = Worker(root, wait=0)
+    started, cancel_seen = threading.Event(), threading.Event()
+    finished = []
+    assert worker.submit(lambda: _spin(started, cancel_seen), finished.append) is False
+    assert worker.busy
+    with pytest.raises(RuntimeError):
+        worker.submit(lambda: None, finished.append)
+    assert started.wait(5)
+    worker.cancel()
+    root.run_until(lambda: finished)
+    assert finished == [True]
+    assert cancel_seen.is_set()
+    worker.shutdown()
+
+
+def test_shutdown_waits_for_the_cancelled_job():
+    root = _Root()
+    worker = Worker(root, wait=0)
+    started, cancel_seen = threading.Event(), threading.Event()
+    worker.submit(lambda: _spin(started, cancel_seen), lambda cancelled: None)
+    assert started.wait(5)
+    worker.shutdown(wait=True)
+    assert cancel_seen.is_set()
+    assert not worker.busy
+    assert root.pending == {}
+
+
+def test_exceptions_reach_the_tk_thread():
+    root = _Root()
+    worker = Worker(root, wait=1)
+    finished = []
+    with pytest.raises(ZeroDivisionError):
+        worker.submit(lambda: 1 / 0, finished.append)
+    assert finished == [False]
+    assert not worker.busy
+    worker.shutdown()
+
+
+class _KeyEvent:
+    def __init__(self, char):
+        self.char = char
+
+
+@pytest.fixture
+def view():
+    """A Calculator view over stub Tk objects"""
+    view = Calculator.__new__(Calculator)
+    view.engine = CalculatorEngine(cache=ExpressionCache())
+    view.display_var = _Var(view.engine.display)
+    view.preview_var = _Var()
+    view._shown = view.engine.display
+    view._preview_shown = ""
+    view.buttons = {}
+    view.root = _Root()
+    view._pending_keys = []
+    view._flush_id = None
+    view.worker = Worker(view.root, wait=1)
+    view._deferred = []
+    view._busy_shown = False
+    view.profiler = None
+    yield view
+    view.worker.shutdown(wait=True)
+
+
+def _record_threads(view, name):
+    threads = []
+    method = getattr(view.engine, name)
+
+    def recorded(*args):
+        threads.append(threading.current_thread())
+        return method(*args)
+    setattr(view.engine, name, recorded)
+    return threads
+
+
+def test_keyboard_equals_calculates_on_the_worker(view):
+    threads = _record_threads(view, 'calculate')
+    for key in '2+3=+2=':
+        view.on_key_press(_KeyEvent(key))
+    view.flush_input()
+    assert view.engine.display == '7'
+    assert view.display_var.get() == '7'
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_capture_covers_the_worker_thread(view):
+    view.profiler = Profiler()
+    view.profiler.start_capture()
+    view.engine.insert('2+3')
+    view.dispatch_background(view.engine.calculate)
+    report = view.profiler.stop_capture()
+    assert view.engine.display == '5'
+    assert re.search(r'engine\.py:\d+\(calculate\)', report)
+
+
+def test_memory_add_evaluates_on_the_worker_when_needed(view):
+    threads = _record_threads(view, 'evaluate_expression')
+    view.engine.insert('sqrt(16)+1')
+    view.dispatch_memory(view.engine.memory_add)
+    assert view.engine.memory == 5
+    assert threads and threading.main_thread() not in threads
+    view.engine.clear_all()
+    view.engine.insert('4')
+    view.dispatch_memory(view.engine.memory_add)
+    assert view.engine.memory == 9
+
+
+def test_labels_follow_actions_deferred_behind_a_calculation(view):
+    view.buttons = {'=': _Button("="), '( )': _Button("( )"), 'M▸': _Button("M0▸")}
+    view.rpn_var = _Var(False)
+    release = threading.Event()
+    view.worker.wait = 0
+    view.worker.submit(release.wait, view.background_done)
+    view.next_register()
+    view.next_register()
+    view.rpn_var.set(True)
+    view.set_rpn_mode()
+    assert view.engine.register == 0
+    assert view.buttons['='].text == "="
+    release.set()
+    view.root.run_until(lambda: not view.worker.busy)
+    assert view.engine.register == 2
+    assert view.buttons['M▸'].text == "M2▸"
+    assert view.engine.rpn_mode
+    assert (view.buttons['='].text, view.buttons['( )'].text) == ("Enter", "x⇄y")
@@ -0,0 +1,547 @@
+"""Units and currencies in expressions: 100[MB/s] to [GB/day]
+
+A number, name or parenthesized expression followed by a unit in square
+brackets is a quantity, and ``to [unit]`` converts a result:
+
+    100[MB/s] to [GB/day]        8640[GB/day]
+    1/(5[ms]) to [req/s]         200[req/s]
+    3[km] + 200[m]               3.2[km]
+    20[EUR] + 5[USD] to [USD]
+
+Every unit, including each SI and binary prefix variant, is computed into
+UNITS when this module loads: its factor to the coherent SI unit and its
+dimension, a tuple of powers of the base units. DIMENSIONS indexes the same
+table by dimension. Units are checked once, when an expression is compiled:
+resolve() rejects mismatched dimensions (adding metres to seconds, units in
+exponents) and rewrites the tree into plain arithmetic. Scale factors are
+carried along and folded together rather than applied at each quantity, so
+a conversion costs a single multiplication, or none when the operand is a
+literal. Evaluating a unit expression is ordinary arithmetic in the selected
+numeric backend, and batch.py evaluates it column-wise like any other.
+
+Currency rates come from a local JSON file, never from the network:
+
+    {"base": "USD", "rates": {"EUR": 0.92, "GBP": 0.79}}
+
+meaning one USD buys 0.92 EUR. The file is RATES_PATH (the
+CALCULATOR_RATES environment variable or ~/.calculator_rates.json), or one
+given to load_rates(). Variables and ans hold plain numbers: a quantity
+stored there keeps its value in the unit it was displayed in.
+"""
+import json
+import os
+import re
+from collections import namedtuple
+from fractions import Fraction
+
+from expression import BinaryOp, Call, Convert, ExpressionError, Name, Number, Quantity, UnaryOp
+from numeric import FLOAT
+
+
+# Base dimensions; CURRENCY is measured in the rates file's base currency
+BASE_UNITS = ('m', 'kg', 's', 'A', 'K', 'mol', 'cd', 'B', 'USD')
+CURRENCY = len(BASE_UNITS) - 1
+DIMENSIONLESS = (0,) * len(BASE_UNITS)
+
+RATES_PATH = os.environ.get('CALCULATOR_RATES') or os.path.join(os.path.expanduser('~'),
+                                                                 '.calculator_rates.json')
+
+# factor converts a value in this unit to the coherent SI unit of its dimension
+Unit = namedtuple('Unit', ['factor', 'dimension'])
+
+# name -> Unit, for every unit and prefixed variant
+UNITS = {}
+# dimension -> {name: factor}: the same table indexed by what the units measure
+DIMENSIONS = {}
+# dimension -> name of its unit with factor 1 (m, J, Hz, ...), used to label results
+COHERENT = {}
+
+SI_PREFIXES = {
+    'p': Fraction(1, 10**12), 'n': Fraction(1, 10**9), 'u': Fraction(1, 10**6),
+    'µ': Fraction(1, 10**6), 'm': Fraction(1, 1000), 'c': Fraction(1, 100),
+    'k': 1000, 'M': 10**6, 'G': 10**9, 'T': 10**12, 'P': 10**15,
+}
+BINARY_PREFIXES = {'Ki': 2**10, 'Mi': 2**20, 'Gi': 2**30, 'Ti': 2**40, 'Pi': 2**50}
+
+# Units offered by the GUI's Units menu, by category
+CATALOG = {}
+
+
+def dimension(**powers):
+    """A dimension tuple from base unit powers, e.g. dimension(m=1, s=-1)"""
+    return tuple(powers.get(base, 0) for base in BASE_UNITS)
+
+
+def _combine(a, b, sign=1):
+    return tuple(x + sign * y for x, y in zip(a, b))
+
+
+def define(name, factor, dim, prefixes=None, category=None):
+    """Add a unit, and its prefixed variants where prefixes allows (existing names win)"""
+    factor = Fraction(factor)
+    _add(name, factor, dim)
+    if category is not None:
+        CATALOG.setdefault(category, []).append(name)
+    for prefix, scale in (prefixes or {}).items():
+        if prefix + name not in UNITS:
+            _prefixed.append((prefix + name, factor * scale, dim))
+
+
+def _add(name, factor, dim):
+    UNITS[name] = Unit(factor, dim)
+    DIMENSIONS.setdefault(dim, {})[name] = factor
+    if factor == 1 and dim != DIMENSIONLESS:
+        COHERENT.setdefault(dim, name)
+
+
+# Prefixed variants are added after every named unit, so 'min' stays minutes
+_prefixed = []
+
+LENGTH, MASS, TIME = dimension(m=1), dimension(kg=1), dimension(s=1)
+DATA = dimension(B=1)
+ENERGY = dimension(kg=1, m=2, s=-2)
+
+define('m', 1, LENGTH, SI_PREFIXES, 'Length')
+define('in', Fraction('0.0254'), LENGTH, category='Length')
+define('ft', Fraction('0.3048'), LENGTH, category='Length')
+define('yd', Fraction('0.9144'), LENGTH)
+define('mi', Fraction('1609.344'), LENGTH, category='Length')
+
+define('g', Fraction(1, 1000), MASS, SI_PREFIXES, 'Mass')
+define('t', 1000, MASS)
+define('lb', Fraction('0.45359237'), MASS, category='Mass')
+define('oz', Fraction('0.028349523125'), MASS, category='Mass')
+
+define('s', 1, TIME, SI_PREFIXES, 'Time')
+define('min', 60, TIME, category='Time')
+define('h', 3600, TIME, category='Time')
+define('day', 86400, TIME, category='Time')
+define('d', 86400, TIME)
+define('week', 604800, TIME)
+# Julian year, as astronomers use
+define('yr', 31557600, TIME)
+
+define('B', 1, DATA, dict(SI_PREFIXES, **BINARY_PREFIXES), 'Data')
+define('b', Fraction(1, 8), DATA, dict(SI_PREFIXES, **BINARY_PREFIXES), 'Data')
+define('byte', 1, DATA)
+define('bit', Fraction(1, 8), DATA)
+
+define('Hz', 1, dimension(s=-1), SI_PREFIXES)
+define('A', 1, dimension(A=1), SI_PREFIXES)
+define('K', 1, dimension(K=1))
+define('mol', 1, dimension(mol=1))
+define('cd', 1, dimension(cd=1))
+define('N', 1, dimension(kg=1, m=1, s=-2), SI_PREFIXES)
+define('J', 1, ENERGY, SI_PREFIXES, 'Energy')
+define('Wh', 3600, ENERGY, SI_PREFIXES)
+define('W', 1, dimension(kg=1, m=2, s=-3), SI_PREFIXES, 'Energy')
+define('Pa', 1, dimension(kg=1, m=-1, s=-2), SI_PREFIXES)
+define('V', 1, dimension(kg=1, m=2, s=-3, A=-1), SI_PREFIXES)
+define('L', Fraction(1, 1000), dimension(m=3), SI_PREFIXES)
+
+# Counts: dimensionless, but kept as labels so rates read as req/s
+define('req', 1, DIMENSIONLESS, category='Rates')
+define('op', 1, DIMENSIONLESS)
+
+for _name, _factor, _dim in _prefixed:
+    if _name not in UNITS:
+        _add(_name, _factor, _dim)
+del _prefixed
+
+CATALOG['Length'][1:1] = ['km', 'cm', 'mm']
+CATALOG['Mass'][1:1] = ['kg']
+CATALOG['Time'][:0] = ['ms']
+CATALOG['Data'] = ['B', 'kB', 'MB', 'GB', 'TB', 'KiB', 'MiB', 'GiB', 'b', 'Mb', 'Gb']
+CATALOG['Rates'] = ['MB/s', 'GB/day', 'Mb/s', 'Gb/s', 'req/s', 'req/min']
+CATALOG['Energy'] = ['J', 'kJ', 'kWh', 'W', 'kW']
+
+# Currency units defined by the last load_rates(); the base currency is always known
+_currencies = []
+
+# File the current rates came from, or None for the base currency alone
+rates_path = None
+
+
+def load_rates(path=None):
+    """Define the currencies in a rates file; returns the base currency code
+
+    Later conversions use the new rates. The file is read once, here; no
+    rate is ever fetched from the network.
+    """
+    global rates_path
+    path = path or RATES_PATH
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    try:
+        base = data['base']
+        rates = {code: Fraction(str(rate)) for code, rate in data['rates'].items()}
+    except (KeyError, TypeError, AttributeError, ValueError):
+        raise ValueError(f"{path}: expected {{\"base\": code, \"rates\": {{code: rate, ...}}}}")
+    for code, rate in rates.items():
+        if not _CODE.fullmatch(code) or rate <= 0:
+            raise ValueError(f"{path}: invalid rate for '{code}'")
+    if not _CODE.fullmatch(base):
+        raise ValueError(f"{path}: invalid base currency '{base}'")
+
+    _set_currencies(base, rates)
+    rates_path = os.path.abspath(path)
+    return base
+
+
+def _set_currencies(base, rates):
+    global BASE_UNITS
+    currency = tuple(int(index == CURRENCY) for index in range(len(BASE_UNITS)))
+    for code in _currencies:
+        UNITS.pop(code, None)
+    DIMENSIONS.pop(currency, None)
+    COHERENT.pop(currency, None)
+    _currencies[:] = [base] + [code for code in rates if code != base]
+    BASE_UNITS = BASE_UNITS[:CURRENCY] + (base,)
+    _add(base, 1, currency)
+    for code, rate in rates.items():
+        if code != base:
+            _add(code, 1 / rate, currency)
+    CATALOG['Currency'] = list(_currencies)
+    # Compiled expressions hold folded factors from the previous rates
+    _parsed.clear()
+    from expression import default_cache
+    default_cache.clear()
+
+
+_CODE = re.compile(r"[A-Za-z]{2,5}")
+_parsed = {}
+
+_set_currencies('USD', {})
+if os.path.exists(RATES_PATH):
+    try:
+        load_rates(RATES_PATH)
+    except (OSError, ValueError):
+        # A broken default file must not break unit arithmetic; --rates reports errors
+        pass
+
+
+# Unit text: MB/s, kg·m/s^2, 1/(req·ms)
+_UNIT_TOKEN = re.compile(r"\s*(?:(?P<name>[A-Za-zµ_]+)|(?P<number>-?\d+)|(?P<op>\*\*|[\^*/·×÷()-]))")
+
+# names: the unit names used, such as ('MB', 's') for MB/s
+ParsedUnit = namedtuple('ParsedUnit', ['factor', 'dimension', 'label', 'names'])
+
+
+def parse_unit(text, pos=None):
+    """Factor, dimension and label of unit text such as 'MB/s' or 'kg·m/s^2'"""
+    parsed = _parsed.get(text)
+    if parsed is None:
+        parsed = _parsed[text] = _UnitParser(text, pos).parse()
+    return parsed
+
+
+class _UnitParser:
+    """unit := factor (('*' | '·' | '/') factor)*
+    factor := (name | '1' | '(' unit ')') (('^' | '**') integer)?
+    """
+
+    def __init__(self, text, pos):
+        self.text = text
+        self.pos = pos
+        self.tokens = []
+        index = 0
+        while index < len(text):
+            match = _UNIT_TOKEN.match(text, index)
+            if match is None or match.end() == index:
+                if text[index:].strip():
+                    raise self.error(f"Invalid unit '{text}'")
+                break
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            index = match.end()
+        self.tokens.append(('end', None))
+        self.index = 0
+        self.names = []
+
+    def error(self, message):
+        return ExpressionError(message, self.pos)
+
+    def parse(self):
+        if self.tokens[0][0] == 'end':
+            raise self.error("Empty unit")
+        factor, dim = self.unit()
+        if self.tokens[self.index][0] != 'end':
+            raise self.error(f"Invalid unit '{self.text}'")
+        return ParsedUnit(factor, dim, self.text.strip().replace('*', '·'), tuple(self.names))
+
+    def unit(self):
+        factor, dim = self.factor()
+        while self.tokens[self.index][1] in ('*', '·', '×', '/', '÷'):
+            op = self.tokens[self.index][1]
+            self.index += 1
+            right, right_dim = self.factor()
+            if op in ('/', '÷'):
+                factor, dim = factor / right, _combine(dim, right_dim, -1)
+            else:
+                factor, dim = factor * right, _combine(dim, right_dim)
+        return factor, dim
+
+    def factor(self):
+        kind, value = self.tokens[self.index]
+        self.index += 1
+        if kind == 'name':
+            unit = UNITS.get(value)
+            if unit is None:
+                raise self.error(f"Unknown unit '{value}'")
+            factor, dim = unit
+            self.names.append(value)
+        elif kind == 'number' and value == '1':
+            factor, dim = Fraction(1), DIMENSIONLESS
+        elif value == '(':
+            factor, dim = self.unit()
+            if self.tokens[self.index][1] != ')':
+                raise self.error(f"Unmatched parentheses in unit '{self.text}'")
+            self.index += 1
+        else:
+            raise self.error(f"Invalid unit '{self.text}'")
+        if self.tokens[self.index][1] in ('^', '**'):
+            self.index += 1
+            kind, exponent = self.tokens[self.index]
+            if kind != 'number':
+                raise self.error(f"Unit powers must be whole numbers in '{self.text}'")
+            self.index += 1
+            exponent = int(exponent)
+            factor, dim = factor ** exponent, tuple(power * exponent for power in dim)
+        return factor, dim
+
+
+def conversion_factor(source, target):
+    """The single multiplier converting a value in unit text source to target"""
+    a, b = parse_unit(source), parse_unit(target)
+    if a.dimension != b.dimension:
+        raise ExpressionError(f"Cannot convert {a.label} to {b.label}")
+    return a.factor / b.factor
+
+
+def label(dim):
+    """Name for the coherent SI unit of a dimension: m, J, Hz, or a product like B/s"""
+    if dim in COHERENT:
+        return COHERENT[dim]
+    above = [base if power == 1 else f"{base}^{power}" for base, power in zip(BASE_UNITS, dim) if power > 0]
+    below = [base if power == -1 else f"{base}^{-power}" for base, power in zip(BASE_UNITS, dim) if power < 0]
+    text = '·'.join(above) or '1'
+    if below:
+        text += '/' + ('·'.join(below) if len(below) == 1 else f"({'·'.join(below)})")
+    return text
+
+
+# Library functions whose result has the unit of their arguments, which must agree
+SAME_UNIT = frozenset(('abs', 'min', 'max', 'sum', 'mean', 'median', 'stdev', 'pstdev', 'hypot'))
+# Roots divide the dimension; the operand's scale is applied first
+ROOTS = {'sqrt': 2, 'cbrt': 3}
+
+# A resolved node: value in SI units = (value of node) × scale
+_Resolved = namedtuple('_Resolved', ['node', 'dimension', 'scale', 'unit'])
+
+_VERBS = {'+': "add", '-': "subtract", '%': "take the remainder of"}
+
+
+def resolve(tree, backend=FLOAT):
+    """Check a parsed expression's units and rewrite it into plain arithmetic
+
+    Returns (tree, unit): the new tree has no Quantity or Convert nodes and
+    evaluates to the result in unit, a label such as 'GB/day', or None when
+    the result is a plain number. A result whose unit the expression does not
+    fix (30[EUR/h] * 8[h]) is given in the first unit written in it that
+    measures the same thing, else in the SI unit (Hz, J), else in a power of
+    a unit written in it (3[km] ** 2 in km^2), else in SI base units.
+    """
+    resolver = _Resolver(backend)
+    resolved = resolver.resolve(tree)
+    dim = resolved.dimension
+    if resolved.unit is not None:
+        name, factor = resolved.unit
+    elif dim != DIMENSIONLESS:
+        name, factor = _result_unit(dim, resolver.names)
+    else:
+        name, factor = None, 1
+    return resolver.scaled(resolved.node, resolved.scale / factor), name
+
+
+class _Resolver:
+    def __init__(self, backend):
+        self.backend = backend
+        # Unit names in the order they appear, for labelling the result
+        self.names = []
+
+    def resolve(self, node):
+        if isinstance(node, (Number, Name)):
+            return _Resolved(node, DIMENSIONLESS, Fraction(1), None)
+        if isinstance(node, Quantity):
+            operand = self.resolve(node.operand)
+            unit = parse_unit(node.unit, node.pos)
+            self.names.extend(unit.names)
+            if operand.dimension != DIMENSIONLESS:
+                raise ExpressionError(f"{self.describe(operand)} already has a unit", node.pos)
+            return _Resolved(operand.node, unit.dimension, operand.scale * unit.factor,
+                             (unit.label, unit.factor))
+        if isinstance(node, Convert):
+            operand = self.resolve(node.operand)
+            unit = parse_unit(node.unit, node.pos)
+            if operand.dimension != unit.dimension:
+                raise ExpressionError(f"Cannot convert {self.describe(operand)} to {unit.label}",
+                                      node.pos)
+            return operand._replace(unit=(unit.label, unit.factor))
+        if isinstance(node, UnaryOp):
+            operand = self.resolve(node.operand)
+            if node.op == '-':
+                return operand._replace(node=UnaryOp('-', operand.node, node.pos))
+            return operand
+        if isinstance(node, BinaryOp):
+            # Walk the left spine iteratively, as the compiler does
+            steps = []
+            while isinstance(node, BinaryOp):
+                steps.append(node)
+                node = node.left
+            value = self.resolve(node)
+            for step in reversed(steps):
+                value = self.binary(step, value, self.resolve(step.right))
+            return value
+        if isinstance(node, Call):
+            return self.call(node, [self.resolve(arg) for arg in node.args])
+        raise TypeError(f"Unknown node {node!r}")
+
+    def binary(self, node, left, right):
+        op, pos = node.op, node.pos
+        if op in ('+', '-', '%'):
+            if left.dimension != right.dimension:
+                raise ExpressionError(f"Cannot {_VERBS[op]} {self.describe(left)} and "
+                                      f"{self.describe(right)}", pos)
+            # Bring the right operand to the left one's scale; the sum keeps it
+            right_node = self.scaled(right.node, right.scale / left.scale)
+            return _Resolved(BinaryOp(op, left.node, right_node, pos), left.dimension, left.scale,
+                             left.unit or right.unit)
+        if op == '*':
+            return _Resolved(BinaryOp(op, left.node, right.node, pos),
+                             _combine(left.dimension, right.dimension), left.scale * right.scale,
+                             self.kept_unit(left, right))
+        if op == '/':
+            return _Resolved(BinaryOp(op, left.node, right.node, pos),
+                             _combine(left.dimension, right.dimension, -1), left.scale / right.scale,
+                             left.unit if right.dimension == DIMENSIONLESS else None)
+        if op == '//':
+            # Flooring does not commute with scaling: divide the SI values
+            return _Resolved(BinaryOp(op, self.applied(left), self.applied(right), pos),
+                             _combine(left.dimension, right.dimension, -1), Fraction(1), None)
+        return self.power(node, left, right)
+
+    def power(self, node, base, exponent):
+        if exponent.dimension != DIMENSIONLESS:
+            raise ExpressionError("Exponents cannot have units", node.pos)
+        if base.dimension == DIMENSIONLESS:
+            return _Resolved(BinaryOp('**', self.applied(base), self.applied(exponent), node.pos),
+                             DIMENSIONLESS, Fraction(1), None)
+        power = _constant_value(node.right)
+        if power is None:
+            raise ExpressionError("A quantity can only be raised to a fixed power", node.pos)
+        dim = tuple(p * power for p in base.dimension)
+        if any(p != int(p) for p in dim):
+            raise ExpressionError(f"{self.describe(base)} to the power {power:g} has no unit",
+                                  node.pos)
+        dim = tuple(int(p) for p in dim)
+        if power == int(power):
+            return _Resolved(BinaryOp('**', base.node, node.right, node.pos), dim,
+                             base.scale ** int(power), None)
+        return _Resolved(BinaryOp('**', self.applied(base), node.right, node.pos), dim,
+                         Fraction(1), None)
+
+    def call(self, node, args):
+        name, pos = node.name, node.pos
+        if name in SAME_UNIT and args:
+            first = args[0]
+            for arg in args[1:]:
+                if arg.dimension != first.dimension:
+                    raise ExpressionError(f"{name}() needs arguments in compatible units", pos)
+            nodes = [first.node] + [self.scaled(arg.node, arg.scale / first.scale) for arg in args[1:]]
+            return _Resolved(Call(name, nodes, pos), first.dimension, first.scale, first.unit)
+        if name in ROOTS and len(args) == 1:
+            (arg,) = args
+            root = ROOTS[name]
+            if any(p % root for p in arg.dimension):
+                raise ExpressionError(f"{name}() of {self.describe(arg)} has no unit", pos)
+            return _Resolved(Call(name, [self.applied(arg)], pos),
+                             tuple(p // root for p in arg.dimension), Fraction(1), None)
+        for arg in args:
+            if arg.dimension != DIMENSIONLESS:
+                raise ExpressionError(f"{name}() needs plain numbers, not {self.describe(arg)}", pos)
+        return _Resolved(Call(name, [self.applied(arg) for arg in args], pos), DIMENSIONLESS,
+                         Fraction(1), None)
+
+    @staticmethod
+    def kept_unit(left, right):
+        # Scaling by a plain number keeps the unit; other products get the SI label
+        if right.dimension == DIMENSIONLESS:
+            return left.unit
+        if left.dimension == DIMENSIONLESS:
+            return right.unit
+        return None
+
+    @staticmethod
+    def describe(resolved):
+        if resolved.unit is not None:
+            return resolved.unit[0]
+        if resolved.dimension == DIMENSIONLESS:
+            return "a plain number"
+        return label(resolved.dimension)
+
+    def applied(self, resolved):
+        return self.scaled(resolved.node, resolved.scale)
+
+    def scaled(self, node, factor):
+        """node multiplied by an exact factor, folded into a literal where possible"""
+        if factor == 1:
+            return node
+        pos = getattr(node, 'pos', None)
+        if self.backend is FLOAT:
+            if isinstance(node, Number) and isinstance(node.value, (int, float)):
+                try:
+                    return Number(node.value * float(factor), pos)
+                except OverflowError:
+                    pass
+            return BinaryOp('*', node, Number(float(factor), pos), pos)
+        # Exact backends: multiply by the numerator, then divide by the
+        # denominator, so integer results stay integers
+        node = BinaryOp('*', node, Number(factor.numerator, pos), pos)
+        if factor.denominator != 1:
+            node = BinaryOp('/', node, Number(factor.denominator, pos), pos)
+        return node
+
+
+def _result_unit(dim, names):
+    """Label and factor for a result whose unit the expression does not fix"""
+    for name in names:
+        if UNITS[name].dimension == dim:
+            return name, UNITS[name].factor
+    if dim in COHERENT:
+        return COHERENT[dim], 1
+    for name in names:
+        power = _power_of(dim, UNITS[name].dimension)
+        if power is not None:
+            return f"{name}^{power}", UNITS[name].factor ** power
+    return label(dim), 1
+
+
+def _power_of(dim, base):
+    """k where dim is base to the whole power k, or None"""
+    if base == DIMENSIONLESS:
+        return None
+    index = next(i for i, power in enumerate(base) if power)
+    power, remainder = divmod(dim[index], base[index])
+    if remainder or not power or any(p != power * q for p, q in zip(dim, base)):
+        return None
+    return power
+
+
+def _constant_value(node):
+    """The value of a literal exponent such as 2 or -1, or None"""
+    sign = 1
+    while isinstance(node, UnaryOp):
+        sign = -sign if node.op == '-' else sign
+        node = node.operand
+    if isinstance(node, Number):
+        return sign * node.value
+    return None
@@ -0,0 +1,113 @@
+"""Run slow calculator actions on a worker thread while Tk keeps drawing
+
+Tk is single-threaded, so the worker never touches widgets: it runs the
+action under a cancellable ``limits.budget`` and the result is collected on
+the Tk thread by a ``root.after`` poll. Most calculations finish within a
+few milliseconds; submit() waits that long before returning, so quick ones
+complete inside the button callback and only slow ones show as busy.
+
+While a job runs, the interpreter's thread switch interval is shortened so
+the Tk thread gets the GIL back within a millisecond of an event arriving,
+keeping redraws and key handling at frame rate.
+
+    worker = Worker(root)
+    worker.submit(engine.calculate, done)   # done(cancelled) runs on the Tk thread
+    worker.cancel()                         # from the C button
+"""
+import sys
+import threading
+
+from limits import budget
+
+
+class Worker:
+    """One background job at a time, finished through callbacks on the Tk thread"""
+
+    def __init__(self, root, poll_ms=16, wait=0.005, switch_interval=0.001):
+        self.root = root
+        self.poll_ms = poll_ms
+        # Seconds submit() blocks for a result before handing over to the poll
+        self.wait = wait
+        self.switch_interval = switch_interval
+        self._saved_interval = None
+        # Created on the first submit, so a session that never calculates starts no thread
+        self._executor = None
+        self._job = None
+        self._poll_id = None
+
+    @property
+    def busy(self):
+        return self._job is not None
+
+    def submit(self, action, done):
+        """Run action() in the background and call done(cancelled) on the Tk thread when it ends
+
+        Returns True if the job finished before submit() returned. Exceptions
+        the action lets escape are re-raised on the Tk thread.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait
+        if self._job is not None:
+            raise RuntimeError("A calculation is already running")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='calculator')
+        cancel = threading.Event()
+        self._saved_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self._saved_interval))
+        future = self._executor.submit(self._run, action, cancel)
+        self._job = (future, cancel, done)
+        if not wait([future], timeout=self.wait).done:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+            return False
+        self._finish()
+        return True
+
+    def cancel(self):
+        """Ask the running job to stop at its next limits check"""
+        if self._job is not None:
+            self._job[1].set()
+
+    @staticmethod
+    def _run(action, cancel):
+        with budget(cancel=cancel):
+            action()
+
+    def _poll(self):
+        self._poll_id = None
+        if self._job is None:
+            return
+        if not self._job[0].done():
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+            return
+        self._finish()
+
+    def _finish(self):
+        future, cancel, done = self._job
+        self._job = None
+        self._restore_interval()
+        try:
+            # Propagate anything the action did not handle itself
+            future.result()
+        finally:
+            # The view is restored and deferred input replayed even then
+            done(cancel.is_set())
+
+    def shutdown(self, wait=False):
+        """Cancel any running job and stop the thread
+
+        With wait, return only once the cancelled job has stopped, so nothing
+        is still changing the engine when the caller saves it.
+        """
+        self.cancel()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._job = None
+        self._restore_interval()
+
+    def _restore_interval(self):
+        if self._saved_interval is not None:
+            sys.setswitchinterval(self._saved_interval)
+            self._saved_interval = None